@@ -0,0 +1,82 @@
+import struct
+import chess
+import numpy as np
+import instrumentation
+
+# Cada grafo é guardado como a máscara (64 bits, little-endian) das casas de origem com algum destino,
+# seguida dos bitboards de destino dessas casas, em ordem crescente de casa: 8 bytes por peça mais 8.
+# Os grafos antigos, com os 64 bitboards de todas as casas (512 bytes), continuam legíveis.
+DENSE_FORMAT = '<64Q'
+DENSE_SIZE = struct.calcsize(DENSE_FORMAT)
+
+@instrumentation.timed('graph/encode')
+def encode_attack_graph(bitboards) -> bytes:
+    """Codifica os 64 bitboards origem -> destino de uma posição em um BLOB com só as casas de origem não vazias."""
+    targets = [bitboard for bitboard in bitboards if bitboard]
+    mask = 0
+    for square, bitboard in enumerate(bitboards):
+        if bitboard:
+            mask |= 1 << square
+    return struct.pack(f'<{len(targets) + 1}Q', mask, *targets)
+
+def decode_attack_graph(blob: bytes) -> tuple:
+    """Decodifica um BLOB nos 64 bitboards origem -> destino."""
+    if len(blob) == DENSE_SIZE:
+        return struct.unpack(DENSE_FORMAT, blob)
+    words = iter(struct.unpack(f'<{len(blob) // 8}Q', blob))
+    mask = next(words)
+    return tuple(next(words) if mask >> square & 1 else 0 for square in chess.SQUARES)
+
+def to_square_sets(blob: bytes) -> list:
+    """Retorna, para cada casa, o SquareSet das casas que a peça nela pode atacar."""
+    return [chess.SquareSet(bitboard) for bitboard in decode_attack_graph(blob)]
+
+def to_attacked_square_sets(blob: bytes) -> list:
+    """Retorna, para cada casa, o SquareSet das casas cujas peças podem se mover para ela."""
+    attacked = [0] * 64
+    for from_square, bitboard in enumerate(decode_attack_graph(blob)):
+        for to_square in chess.scan_forward(bitboard):
+            attacked[to_square] |= chess.BB_SQUARES[from_square]
+    return [chess.SquareSet(bitboard) for bitboard in attacked]
+
+def to_numpy(blobs) -> np.ndarray:
+    """
+    Converte um BLOB, ou uma lista de BLOBs, em um array uint64 de forma (64,) ou (n, 64)
+    sem nenhuma análise de texto: os bitboards de todos os grafos são espalhados de uma vez
+    nas casas marcadas em suas máscaras.
+    """
+    if isinstance(blobs, (bytes, bytearray, memoryview)):
+        return to_numpy([bytes(blobs)])[0]
+    words = np.frombuffer(b''.join(blobs), dtype='<u8')
+    sizes = np.fromiter((len(blob) // 8 for blob in blobs), dtype=np.int64, count=len(blobs))
+    starts = np.cumsum(sizes) - sizes
+    graphs = np.zeros((len(blobs), 64), dtype=np.uint64)
+
+    dense = sizes == 64
+    graphs[dense] = words[starts[dense, None] + np.arange(64)]
+    rows = np.flatnonzero(~dense)
+    masks = np.ascontiguousarray(words[starts[rows]], dtype='<u8')
+    bits = np.unpackbits(masks.view(np.uint8), bitorder='little').reshape(len(rows), 64)
+    graph_rows, squares = np.nonzero(bits)
+    counts = bits.sum(axis=1, dtype=np.int64)
+    within = np.arange(len(squares)) - np.repeat(np.cumsum(counts) - counts, counts)
+    graphs[rows[graph_rows], squares] = words[np.repeat(starts[rows] + 1, counts) + within]
+    return graphs
+
+def to_adjacency(blobs) -> np.ndarray:
+    """
+    Expande os grafos em matrizes de adjacência booleanas, onde adjacency[..., origem, destino]
+    indica que a peça na casa de origem pode se mover para a casa de destino.
+    """
+    bitboards = to_numpy(blobs)
+    bits = np.unpackbits(bitboards.view(np.uint8), bitorder='little')
+    return bits.reshape(bitboards.shape + (64,)).astype(bool)
+
+def load_attack_graphs(conn, limit: int = None):
+    """Carrega as FENs e os grafos da tabela graph_connections como um array (n, 64) de bitboards."""
+    query = 'SELECT fen, attacks FROM graph_connections ORDER BY rowid'
+    if limit is not None:
+        query += f' LIMIT {int(limit)}'
+    rows = conn.execute(query).fetchall()
+    fens = [fen for fen, _ in rows]
+    return fens, to_numpy([blob for _, blob in rows])
@@ -0,0 +1,47 @@
+import argparse
+import sqlite3
+import chess
+from position_analyzer import BITBOARD_COLUMNS, MOBILITY_COLUMNS, piece_bitboards, mobility_by_piece, parse_evaluation
+from bulk_writer import BulkWriter
+from db import create_positions_table, DERIVED_COLUMNS
+from ingestion import DB_PATH
+
+UPDATE_DERIVED_SQL = f'''
+    UPDATE positions SET {', '.join([f'{column} = ?' for column in DERIVED_COLUMNS])}
+    WHERE rowid = ?
+'''
+
+def backfill(conn, batch_size: int = 5000) -> int:
+    """
+    Preenche as colunas derivadas (bitboards das peças, mobilidade por peça e avaliação já convertida) das posições
+    gravadas antes delas existirem, a partir da FEN e da avaliação original.
+    Retorna o número de posições atualizadas.
+    """
+    create_positions_table(conn)
+
+    last_rowid = 0
+    with BulkWriter(conn, UPDATE_DERIVED_SQL, batch_size) as writer:
+        while True:
+            rows = conn.execute(f'''
+                SELECT rowid, fen, evaluation FROM positions
+                WHERE rowid > ? AND ({BITBOARD_COLUMNS[0]} IS NULL OR {MOBILITY_COLUMNS[0]} IS NULL OR evaluation_value IS NULL AND evaluation IS NOT NULL)
+                ORDER BY rowid LIMIT ?
+            ''', (last_rowid, batch_size)).fetchall()
+            if not rows:
+                break
+            for rowid, fen, evaluation in rows:
+                board = chess.Board(fen=fen)
+                writer.add((*piece_bitboards(board), *mobility_by_piece(board), *parse_evaluation(evaluation), rowid))
+            last_rowid = rows[-1][0]
+    return writer.rows
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Preenche as colunas derivadas da tabela positions.')
+    parser.add_argument('--db', default=DB_PATH, help='banco de dados SQLite a atualizar')
+    parser.add_argument('--batch-size', type=int, default=5000, help='linhas gravadas por transação')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    updated = backfill(conn, args.batch_size)
+    conn.close()
+    print(f"{updated} posições atualizadas")
@@ -0,0 +1,425 @@
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+import chess
+import chess.pgn
+import chess.polyglot
+import numpy as np
+import pandas as pd
+from position_analyzer import *
+import attack_graph
+import db
+import create_graph
+import dataset
+import graph_analytics
+import heat_map
+import pgn_ingest
+import regression
+from bulk_writer import BulkWriter
+from evaluator import PositionEvaluator
+from ingestion import run_ingestion
+from position_ids import position_id
+from service import EvaluationService
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_corpus.csv')
+
+CATEGORIES = ['opening', 'middlegame', 'endgame', 'mate']
+
+# Funções de características medidas individualmente
+FEATURE_FUNCTIONS = {
+    'compute_material_count': compute_material_count,
+    'compute_total_material_count': compute_total_material_count,
+    'compute_mobility': compute_mobility,
+    'compute_central_control': compute_central_control,
+    'compute_king_safety': compute_king_safety,
+    'compute_connectivity': compute_connectivity,
+    'get_pawns_position': get_pawns_position,
+    'get_knights_position': get_knights_position,
+    'get_bishops_position': get_bishops_position,
+    'get_rooks_position': get_rooks_position,
+    'get_queens_position': get_queens_position,
+    'get_kings_position': get_kings_position,
+    'count_moves': lambda board: count_moves(board, board.turn),
+    'mobility_by_piece': mobility_by_piece,
+    'piece_bitboards': piece_bitboards,
+}
+
+# Geração do corpus (executada uma vez; o resultado fica versionado em bench_corpus.csv)
+
+def random_evaluation(rng) -> str:
+    return f'{rng.randint(-300, 300):+d}'
+
+def random_game_positions(rng, count, min_plies, max_plies):
+    positions = []
+    while len(positions) < count:
+        board = chess.Board()
+        for _ in range(rng.randint(min_plies, max_plies)):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            board.push(rng.choice(moves))
+        if not board.is_game_over():
+            positions.append(board.fen())
+    return positions
+
+def random_endgame_positions(rng, count):
+    """Posições válidas com os dois reis e de duas a cinco peças sorteadas."""
+    positions = []
+    while len(positions) < count:
+        board = chess.Board(None)
+        squares = rng.sample(chess.SQUARES, 7)
+        board.set_piece_at(squares[0], chess.Piece(chess.KING, chess.WHITE))
+        board.set_piece_at(squares[1], chess.Piece(chess.KING, chess.BLACK))
+        for square in squares[2:2 + rng.randint(2, 5)]:
+            piece_type = rng.choice([chess.PAWN, chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN])
+            if piece_type == chess.PAWN and chess.BB_SQUARES[square] & chess.BB_BACKRANKS:
+                continue
+            board.set_piece_at(square, chess.Piece(piece_type, rng.choice(chess.COLORS)))
+        board.turn = rng.choice(chess.COLORS)
+        if board.is_valid() and not board.is_game_over():
+            positions.append(board.fen())
+    return positions
+
+def mate_in_one_positions(rng, count):
+    """Posições de partidas aleatórias em que o lado a jogar tem mate em um lance."""
+    positions = []
+    while len(positions) < count:
+        board = chess.Board()
+        while not board.is_game_over() and len(positions) < count:
+            mates = [move for move in board.legal_moves if board.gives_check(move) and is_mate_after(board, move)]
+            if mates:
+                positions.append((board.fen(), '#+1' if board.turn == chess.WHITE else '#-1'))
+                break
+            board.push(rng.choice(list(board.legal_moves)))
+    return positions
+
+def is_mate_after(board: chess.Board, move: chess.Move) -> bool:
+    board.push(move)
+    mate = board.is_checkmate()
+    board.pop()
+    return mate
+
+def generate_corpus(path: str = CORPUS_PATH, per_category: int = 250, seed: int = 859):
+    rng = random.Random(seed)
+    rows = [(fen, random_evaluation(rng), 'opening') for fen in random_game_positions(rng, per_category, 4, 16)]
+    rows += [(fen, random_evaluation(rng), 'middlegame') for fen in random_game_positions(rng, per_category, 20, 60)]
+    rows += [(fen, random_evaluation(rng), 'endgame') for fen in random_endgame_positions(rng, per_category)]
+    rows += [(fen, evaluation, 'mate') for fen, evaluation in mate_in_one_positions(rng, per_category // 5)]
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['FEN', 'Evaluation', 'Category'])
+        writer.writerows(rows)
+
+def random_pgn_games(count: int, seed: int = 859, max_plies: int = 160) -> list:
+    """Partidas aleatórias como texto PGN, com [%eval] na maioria dos lances e algumas variações."""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        game = chess.pgn.Game()
+        board = game.board()
+        node = game
+        for _ in range(rng.randint(1, max_plies)):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            move = rng.choice(moves)
+            node = node.add_variation(move)
+            if len(moves) > 1 and rng.random() < 0.05:
+                node.parent.add_variation(rng.choice([other for other in moves if other != move]))
+            board.push(move)
+            if rng.random() < 0.9:
+                node.comment = f"[%eval #{rng.randint(-5, 5)}]" if rng.random() < 0.05 else f"[%eval {rng.uniform(-9, 9):.2f}]"
+        texts.append(str(game) + '\n\n')
+    return texts
+
+def load_corpus(path: str = CORPUS_PATH) -> list:
+    """Lê o corpus como uma lista de (FEN, avaliação, categoria)."""
+    with open(path, newline='') as file:
+        reader = csv.reader(file)
+        next(reader)
+        return [tuple(row) for row in reader]
+
+# Medições
+
+def summarize(name: str, latencies_ns, items: int, total_s: float, peak_bytes: int) -> dict:
+    latencies_us = np.asarray(latencies_ns, dtype=np.float64) / 1000 if len(latencies_ns) else None
+    return {
+        'name': name,
+        'items': items,
+        'seconds': total_s,
+        'ops_per_sec': items / total_s if total_s else None,
+        'p50_us': float(np.percentile(latencies_us, 50)) if latencies_us is not None else None,
+        'p99_us': float(np.percentile(latencies_us, 99)) if latencies_us is not None else None,
+        'peak_memory_kb': peak_bytes / 1024 if peak_bytes is not None else None,
+    }
+
+def peak_memory(func) -> int:
+    """Pico de memória alocada pelo Python durante uma execução de func (medido à parte, pois tracemalloc a torna mais lenta)."""
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def time_per_item(name: str, func, inputs, repeat: int = 3) -> dict:
+    """Mede func(item) para cada item, repetindo o corpus; latências de cada chamada e vazão da melhor repetição."""
+    latencies, best = [], float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in inputs:
+            call_start = time.perf_counter_ns()
+            func(item)
+            latencies.append(time.perf_counter_ns() - call_start)
+        best = min(best, time.perf_counter() - start)
+    peak = peak_memory(lambda: [func(item) for item in inputs])
+    return summarize(name, latencies, len(inputs), best, peak)
+
+def time_batch(name: str, func, items: int, repeat: int = 3) -> dict:
+    """Mede uma operação em lote sobre `items` elementos; as latências são as de cada repetição."""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        func()
+        latencies.append(time.perf_counter_ns() - start)
+    return summarize(name, latencies, items, min(latencies) / 1e9, peak_memory(func))
+
+def ingestion_benchmark(name: str, corpus, analyze_row, create_tables, insert_sql: str, table: str, workers: int = 1) -> dict:
+    fen_data = [list(row[:2]) for row in corpus]
+    def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            run_ingestion(iter(fen_data), analyze_row, create_tables, insert_sql, table,
+                          db_path=os.path.join(tmp, 'bench.db'), workers=workers)
+    return time_batch(name, run, len(fen_data), repeat=1)
+
+def reingestion_benchmark(name: str, corpus) -> dict:
+    """Reingestão de um CSV que se sobrepõe ao já gravado: só a primeira metade do corpus é nova para o banco."""
+    fen_data = [list(row[:2]) for row in corpus]
+    def ingest(rows, db_path):
+        run_ingestion(iter(rows), db.analyze_position, db.create_positions_table, db.INSERT_POSITION_SQL,
+                      'positions', db_path=db_path)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        ingest(fen_data[len(fen_data) // 2:], db_path)
+        return time_batch(name, lambda: ingest(fen_data, db_path), len(fen_data), repeat=1)
+
+def write_benchmarks(rows, batch_size: int = 5000) -> list:
+    """Gravação das linhas de positions com um commit por linha (db.insert_data) e com o BulkWriter."""
+    def per_row():
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+            db.create_positions_table(conn)
+            for row in rows:
+                db.insert_data(conn, *row)
+            conn.close()
+    def bulk():
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+            db.create_positions_table(conn)
+            with BulkWriter(conn, db.INSERT_POSITION_SQL, batch_size) as writer:
+                writer.add_many([(position_id(row[0]), *row) for row in rows])
+            conn.close()
+    return [time_batch('write/insert_data', per_row, len(rows), repeat=1),
+            time_batch('write/bulk_writer', bulk, len(rows), repeat=1)]
+
+def polyglot_id(fen: str) -> int:
+    """Id da posição pelo python-chess, montando o tabuleiro (referência de position_id)."""
+    return chess.polyglot.zobrist_hash(chess.Board(fen=fen))
+
+def heat_map_frame(rows, size: int) -> pd.DataFrame:
+    df = pd.DataFrame([rows[i % len(rows)] for i in range(size)], columns=db.POSITION_COLUMNS)
+    return heat_map.add_evaluation_columns(df)
+
+def positions_database(path: str, rows, size: int):
+    """Grava `size` linhas de positions repetindo as linhas analisadas do corpus, cada uma com um id próprio."""
+    conn = sqlite3.connect(path)
+    db.create_positions_table(conn)
+    with BulkWriter(conn, db.INSERT_POSITION_SQL) as writer:
+        writer.add_many([(i, *rows[i % len(rows)]) for i in range(size)])
+    return conn
+
+def dataset_benchmarks(rows, size: int, repeat: int) -> list:
+    """Leitura das características da regressão do SQLite e do conjunto em memmap, e treino em blocos."""
+    columns = regression.regression_columns(mobility_breakdown=True)
+    condition = heat_map.HEAT_MAP_SLICES['default']
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'positions.db')
+        path = os.path.join(tmp, 'dataset')
+        conn = positions_database(db_path, rows, size)
+        results = [
+            time_batch('dataset/load_regression_data', lambda: heat_map.load_regression_data(conn), size, repeat),
+            time_batch('dataset/export', lambda: dataset.export_dataset(conn, path, heat_map.HEAT_MAP_SLICES), size, repeat=1),
+        ]
+        conn.close()
+
+        def load():
+            loaded = dataset.load_dataset(path)
+            selected = np.flatnonzero(dataset.slice_mask(loaded, 'default') & (loaded['is_mate'] == 0))
+            return dataset.feature_matrix(loaded, heat_map.REGRESSION_FEATURES, selected)
+        results.append(time_batch('dataset/load_memmap', load, size, repeat))
+        for workers in [1, 2]:
+            results.append(time_batch(f'regression/train_sqlite/workers={workers}',
+                                      lambda: regression.train_sqlite(db_path, columns, condition, 0, size, workers),
+                                      size, repeat=1))
+        results.append(time_batch('regression/train_dataset', lambda: regression.accumulate(
+            regression.dataset_chunks(dataset.load_dataset(path), columns, 'default', 50_000), columns), size, repeat))
+    return results
+
+def random_evaluator(seed: int = 859) -> PositionEvaluator:
+    """Avaliador com coeficientes e mapa de calor aleatórios, com todas as colunas de regression_columns."""
+    rng = np.random.default_rng(seed)
+    columns = regression.regression_columns(mobility_breakdown=True, piece_squares=True)
+    return PositionEvaluator(columns, rng.normal(), rng.normal(size=len(columns)), rng.normal(size=(12, 64)))
+
+def service_benchmark(name: str, evaluator: PositionEvaluator, fens, requests: int = 200, request_size: int = 50,
+                      concurrency: int = 16, workers: int = 2) -> dict:
+    """Requisições simultâneas ao serviço; as latências são as de cada requisição."""
+    batches = [[fens[(i * request_size + j) % len(fens)] for j in range(request_size)] for i in range(requests)]
+
+    async def run(executor):
+        service = EvaluationService(evaluator, executor, max_batches=2 * workers, max_requests=concurrency)
+        slots = asyncio.Semaphore(concurrency)
+        latencies = []
+        async def request(batch):
+            async with slots:
+                start = time.perf_counter_ns()
+                await service.evaluate(batch)
+                latencies.append(time.perf_counter_ns() - start)
+        start = time.perf_counter()
+        await asyncio.gather(*map(request, batches))
+        return latencies, time.perf_counter() - start
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        latencies, seconds = asyncio.run(run(executor))
+    return summarize(name, latencies, requests * request_size, seconds, None)
+
+def pgn_benchmarks(count: int, repeat: int) -> list:
+    texts = random_pgn_games(count)
+    pgn_ingest.set_known_ids(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    positions = sum(len(rows) for rows, _, _ in pgn_ingest.analyze_games(texts))
+    def ingest():
+        with tempfile.TemporaryDirectory() as tmp:
+            pgn_ingest.run_pgn_ingestion(texts, db_path=os.path.join(tmp, 'bench.db'))
+    return [time_batch('pgn/analyze_games', lambda: pgn_ingest.analyze_games(texts), positions, repeat),
+            time_batch('ingest/pgn', ingest, positions, repeat=1)]
+
+def run_suite(corpus, repeat: int = 3, heat_map_rows: int = 200_000, pgn_games: int = 200) -> list:
+    fens = [fen for fen, _, _ in corpus]
+    boards = [chess.Board(fen=fen) for fen in fens]
+    results = []
+    for name, func in FEATURE_FUNCTIONS.items():
+        results.append(time_per_item(f'feature/{name}', func, boards, repeat))
+
+    results.append(time_per_item('extract_features', extract_features, boards, repeat))
+    for category in CATEGORIES:
+        category_boards = [board for board, row in zip(boards, corpus) if row[2] == category]
+        results.append(time_per_item(f'extract_features/{category}', extract_features, category_boards, repeat))
+    results.append(time_per_item('db.analyze_position', db.analyze_position, [row[:2] for row in corpus], repeat))
+    results.append(time_per_item('position_id', position_id, fens, repeat))
+    results.append(time_per_item('position_id/polyglot', polyglot_id, fens, repeat))
+
+    results.append(time_per_item('graph/attack_bitboards', attack_bitboards, boards, repeat))
+    results.append(time_per_item('create_graph.generate_attack_data', create_graph.generate_attack_data, boards, repeat))
+    blobs = [create_graph.generate_attack_data(board) for board in boards]
+    results.append(time_per_item('graph/decode_attack_graph', attack_graph.decode_attack_graph, blobs, repeat))
+    results.append(time_batch('graph/to_numpy', lambda: attack_graph.to_numpy(blobs), len(blobs), repeat))
+    targets = attack_graph.to_numpy(blobs)
+    results.append(time_batch('graph/graph_features', lambda: graph_analytics.graph_features(fens, targets), len(fens), repeat))
+
+    for workers in [1, 2, 4]:
+        name = 'ingest/positions' if workers == 1 else f'ingest/positions/workers={workers}'
+        results.append(ingestion_benchmark(name, corpus, db.analyze_position,
+                                           db.create_positions_table, db.INSERT_POSITION_SQL, 'positions', workers))
+    results.append(reingestion_benchmark('ingest/positions/reingest', corpus))
+    results.append(ingestion_benchmark('ingest/graph_connections', corpus, create_graph.analyze_attacks,
+                                       create_graph.create_attack_table, create_graph.INSERT_ATTACK_SQL, 'graph_connections'))
+    rows = [db.analyze_position(row[:2]) for row in corpus]
+    results.extend(write_benchmarks(rows))
+    results.extend(pgn_benchmarks(pgn_games, repeat))
+
+    df = heat_map_frame(rows, heat_map_rows)
+    results.append(time_batch('heat_map/accumulate_bitboards', lambda: heat_map.accumulate_heat_map_stats(df), len(df), repeat))
+    text_df = df.drop(columns=heat_map.BITBOARD_COLUMNS)
+    results.append(time_batch('heat_map/accumulate_text', lambda: heat_map.accumulate_heat_map_stats(text_df), len(df), repeat))
+    results.extend(dataset_benchmarks(rows, heat_map_rows, repeat))
+
+    evaluator = random_evaluator()
+    X, bitboards = evaluator.board_arrays(boards)
+    X, bitboards = np.resize(X, (heat_map_rows, X.shape[1])), np.resize(bitboards, (heat_map_rows, bitboards.shape[1]))
+    results.append(time_batch('evaluator/evaluate_arrays', lambda: evaluator.evaluate_arrays(X, bitboards), heat_map_rows, repeat))
+    results.append(time_per_item('evaluator/evaluate', lambda board: evaluator.evaluate([board]), boards, repeat))
+    results.append(service_benchmark('service/evaluate', evaluator, fens))
+    return results
+
+def environment(corpus_path: str) -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    with open(corpus_path, 'rb') as file:
+        corpus_hash = hashlib.sha256(file.read()).hexdigest()
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'python_chess': chess.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'corpus': os.path.basename(corpus_path),
+        'corpus_sha256': corpus_hash,
+    }
+
+def print_results(results, baseline=None):
+    previous = {result['name']: result for result in baseline['results']} if baseline else {}
+    for result in results:
+        line = f"{result['name']:<45} {result['ops_per_sec']:>12.0f} op/s"
+        if result['p50_us'] is not None:
+            line += f"  p50 {result['p50_us']:>10.1f} µs  p99 {result['p99_us']:>10.1f} µs"
+        if result['peak_memory_kb'] is not None:
+            line += f"  pico {result['peak_memory_kb']:>10.0f} KiB"
+        if result['name'] in previous:
+            line += f"  ({result['ops_per_sec'] / previous[result['name']]['ops_per_sec']:.2f}x)"
+        print(line)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mede o desempenho das etapas de data_analysis sobre um corpus fixo de FENs.')
+    parser.add_argument('--corpus', default=CORPUS_PATH, help='CSV com as colunas FEN, avaliação e categoria')
+    parser.add_argument('--output', default='bench_results.json', help='arquivo JSON com os resultados')
+    parser.add_argument('--compare', help='JSON de uma execução anterior para comparar a vazão')
+    parser.add_argument('--repeat', type=int, default=3, help='repetições de cada medição')
+    parser.add_argument('--heat-map-rows', type=int, default=200_000,
+                        help='posições nas medições do mapa de calor, do conjunto de dados, da regressão e do avaliador')
+    parser.add_argument('--pgn-games', type=int, default=200, help='partidas aleatórias na medição da ingestão de PGN')
+    parser.add_argument('--generate-corpus', action='store_true', help='gerar novamente o corpus e sair')
+    args = parser.parse_args()
+
+    if args.generate_corpus:
+        generate_corpus(args.corpus)
+        raise SystemExit
+
+    results = run_suite(load_corpus(args.corpus), args.repeat, args.heat_map_rows, args.pgn_games)
+    # Pico de memória residente do processo inteiro (KiB no Linux), além do pico alocado por medição
+    max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    report = {'environment': environment(args.corpus), 'max_rss_kb': max_rss_kb, 'results': results}
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
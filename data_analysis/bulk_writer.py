@@ -0,0 +1,93 @@
+import sqlite3
+import time
+import instrumentation
+
+# Configurações usadas durante a carga: menos fsyncs e mais cache em memória
+LOAD_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'OFF',
+    'temp_store': 'MEMORY',
+    'cache_size': -200000,  # em KiB (aproximadamente 200 MB)
+}
+
+class BulkWriter:
+    """
+    Acumula linhas e as grava com executemany em lotes, cada lote dentro de uma transação.
+    Ao abrir aplica LOAD_PRAGMAS e ao fechar restaura as configurações anteriores da conexão.
+    Se `on_flush` for informado, ele é chamado com (conn, linhas) dentro da transação de cada lote.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, sql: str, batch_size: int = 1000, on_flush=None):
+        self.conn = conn
+        self.sql = sql
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self.buffer = []
+        self.rows = 0
+        self.elapsed = 0.0
+        self.saved_pragmas = {}
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.buffer = []
+            self.conn.rollback()
+            self.restore_pragmas()
+
+    def open(self):
+        """Guarda as configurações atuais e aplica as configurações de carga."""
+        self.conn.commit()
+        for pragma, value in LOAD_PRAGMAS.items():
+            self.saved_pragmas[pragma] = self.conn.execute(f'PRAGMA {pragma}').fetchone()[0]
+            self.conn.execute(f'PRAGMA {pragma} = {value}')
+
+    def restore_pragmas(self):
+        """Restaura as configurações da conexão salvas em open()."""
+        for pragma, value in self.saved_pragmas.items():
+            self.conn.execute(f'PRAGMA {pragma} = {value}')
+        self.saved_pragmas = {}
+
+    def add(self, row):
+        """Adiciona uma linha ao buffer, gravando o lote quando ele atinge batch_size."""
+        self.buffer.append(row)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def add_many(self, rows):
+        """Adiciona várias linhas ao buffer."""
+        for row in rows:
+            self.add(row)
+
+    def flush(self, force: bool = False):
+        """
+        Grava as linhas do buffer em uma única transação. Com `force`, executa a transação (e on_flush)
+        mesmo com o buffer vazio, para gravar o que on_flush acumula por conta própria.
+        """
+        if not self.buffer and not force:
+            return
+        start = time.perf_counter()
+        with instrumentation.stage('sqlite/flush'):
+            if not self.conn.in_transaction:
+                self.conn.execute('BEGIN')
+            self.conn.executemany(self.sql, self.buffer)
+            if self.on_flush is not None:
+                self.on_flush(self.conn, self.buffer)
+            self.conn.commit()
+        instrumentation.count('sqlite/rows', len(self.buffer))
+        self.elapsed += time.perf_counter() - start
+        self.rows += len(self.buffer)
+        self.buffer = []
+
+    def close(self):
+        """Grava o que restou no buffer e restaura as configurações da conexão."""
+        self.flush()
+        self.restore_pragmas()
+
+    def rows_per_second(self) -> float:
+        """Vazão das gravações, considerando apenas o tempo gasto dentro de flush()."""
+        return self.rows / self.elapsed if self.elapsed else 0.0
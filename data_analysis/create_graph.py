@@ -1,62 +1,74 @@
-import sqlite3
-import csv
-import chess
 from position_analyzer import *
+from attack_graph import encode_attack_graph
+from ingestion import *
+from feature_cache import CachedAnalyzer, read_cache_stats, format_cache_stats
+from position_ids import position_id
+import instrumentation
 
-# Criar a tabela no banco de dados
+# Namespace do cache de grafos; muda sempre que o formato de encode_attack_graph muda
+GRAPH_NAMESPACE = 'graph_connections_v2'
+
+# Criar a tabela no banco de dados; as posições são ligadas a positions pelo mesmo id (position_ids)
 def create_attack_table(conn):
     cursor = conn.cursor()
-    columns = ', '.join([f'square_{i} TEXT' for i in range(64)])
-    cursor.execute(f'''
+
+    # Bancos antigos ainda têm uma coluna de texto por casa ou usam a FEN como chave
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(graph_connections)')]
+    if columns and 'attacks' not in columns:
+        raise RuntimeError("graph_connections está no formato de texto antigo; execute migrate_graph.py antes")
+    if columns and 'id' not in columns:
+        raise RuntimeError("graph_connections ainda usa a FEN como chave; execute migrate_ids.py antes")
+
+    cursor.execute('''
         CREATE TABLE IF NOT EXISTS graph_connections (
-            fen TEXT PRIMARY KEY,
-            {columns}
+            id INTEGER UNIQUE,
+            fen TEXT,
+            attacks BLOB
         )
     ''')
     conn.commit()
 
 # Função para gerar dados de ataques e defesas para cada FEN
-def generate_attack_data(board: chess.Board):
-    attack_defense_data = []
-    for square in chess.SQUARES:
-        attacking = attacking_squares(board, square)
-        attacked = attacked_squares(board, square)
-        attack_defense_data.append(f'([{attacking}], [{attacked}])')
-    return attack_defense_data
+def generate_attack_data(board: chess.Board) -> bytes:
+    return encode_attack_graph(attack_bitboards(board))
+
+# Comando de inserção de uma linha da tabela graph_connections (id da posição, FEN, grafo)
+INSERT_ATTACK_SQL = '''
+    INSERT INTO graph_connections (id, fen, attacks)
+    VALUES (?, ?, ?)
+    ON CONFLICT (id) DO NOTHING
+'''
 
 # Função para inserir dados de ataques e defesas no banco de dados
 def insert_attack_data(conn, fen, attack_data):
     cursor = conn.cursor()
-    columns = ', '.join([f'square_{i}' for i in range(64)])
-    values = ', '.join(['?' for _ in range(64)])
-    cursor.execute(f'''
-        INSERT INTO graph_connections (fen, {columns})
-        VALUES (?, {values})
-    ''', [fen] + attack_data)
+    cursor.execute(INSERT_ATTACK_SQL, (position_id(fen), fen, attack_data))
     conn.commit()
 
-conn = sqlite3.connect('chess_analysis.db')
-create_attack_table(conn)
-
-CSV_FILE_PATH = 'data/chessData.csv'
-POSITIONS_ANALYZED = 200000
-
-fen_data_list = []
-with open(CSV_FILE_PATH, 'r') as file:
-    reader = csv.reader(file)
-    next(reader)
-    
-    for i, row in enumerate(reader):
-        if i == POSITIONS_ANALYZED:
-            break
-        fen_data_list.append(row)
-        
-
-for fen_data in fen_data_list:
-    board = chess.Board(fen=fen_data[0])
-    
-    # Inserir os dados no banco de dados
-    attack_data = generate_attack_data(board)
-    insert_attack_data(conn, fen_data[0], attack_data)
-
-conn.close()
+# Função que monta a linha de graph_connections a partir da linha do CSV e do grafo da posição
+def attack_row(fen_data, attack_data):
+    return fen_data[0], attack_data
+
+# Função executada nos processos de trabalho para cada linha do CSV
+def analyze_attacks(fen_data):
+    with instrumentation.stage('board'):
+        board = chess.Board(fen=fen_data[0])
+    return attack_row(fen_data, generate_attack_data(board))
+
+if __name__ == '__main__':
+    args = ingestion_arguments('Popula a tabela graph_connections com os ataques e defesas de cada FEN.').parse_args()
+    instrumentation.configure(args.instrument, args.profile, args.report)
+
+    offset, limit, previous_fen = resume_window(args, 'graph_connections')
+    fen_data = stream_fen_data(args.csv, offset, limit, previous_fen)
+    analyze = analyze_attacks
+    if args.cache:
+        analyze = CachedAnalyzer(attack_row, generate_attack_data, args.cache, GRAPH_NAMESPACE, args.cache_size)
+        stats_before = read_cache_stats(args.cache, GRAPH_NAMESPACE)
+    run_ingestion(fen_data, analyze, create_attack_table, INSERT_ATTACK_SQL, 'graph_connections', db_path=args.db,
+                  workers=args.workers, chunk_size=args.chunk_size, batch_size=args.batch_size,
+                  job='graph_connections', csv_path=args.csv, offset=offset, total=limit)
+
+    if args.cache:
+        stats_after = read_cache_stats(args.cache, GRAPH_NAMESPACE)
+        print(format_cache_stats(GRAPH_NAMESPACE, [after - before for after, before in zip(stats_after, stats_before)]))
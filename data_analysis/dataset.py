@@ -0,0 +1,170 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import numpy as np
+import pandas as pd
+from position_analyzer import BITBOARD_COLUMNS, MOBILITY_COLUMNS
+
+# Versão do formato em disco; load_dataset recusa conjuntos exportados com outra versão
+DATASET_VERSION = 1
+
+MANIFEST_FILE = 'manifest.json'
+
+# Características numéricas exportadas, na ordem das colunas de features.npy
+FEATURE_COLUMNS = [
+    'material', 'total_material', 'mobility', 'central_control', 'king_safety', 'connectivity',
+] + MOBILITY_COLUMNS
+
+# Arrays do conjunto de dados: nome do arquivo .npy -> (tipo, número de colunas ou None para vetores)
+ARRAYS = {
+    'rowid': (np.int64, None),
+    'features': (np.int32, len(FEATURE_COLUMNS)),
+    'evaluation': (np.float64, None),
+    'is_mate': (np.uint8, None),
+    'mate_in': (np.int16, None),
+    'bitboards': (np.int64, len(BITBOARD_COLUMNS)),
+    'slices': (np.uint8, None),
+}
+
+def export_dataset(conn, path: str, slices: dict, chunk_size: int = 200_000) -> dict:
+    """
+    Materializa a tabela positions em um diretório de arrays .npy: características, avaliação convertida,
+    bitboards das 12 peças e uma máscara de bits com os recortes (slices, nome -> condição SQL) a que
+    cada posição pertence. Posições sem avaliação (de partidas PGN sem [%eval]) ficam de fora. O
+    manifesto é gravado por último e o diretório só substitui o anterior quando está completo.
+    Retorna o manifesto.
+    """
+    if len(slices) > 8:
+        raise ValueError('no máximo 8 recortes cabem na máscara de slices.npy')
+
+    required = FEATURE_COLUMNS + BITBOARD_COLUMNS + ['evaluation_value', 'is_mate']
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(positions)')]
+    missing = [column for column in required if column not in columns]
+    if missing or conn.execute(
+        f"SELECT 1 FROM positions WHERE evaluation IS NOT NULL AND ({' OR '.join([f'{column} IS NULL' for column in required])}) LIMIT 1"
+    ).fetchone():
+        raise SystemExit('colunas derivadas não preenchidas; execute backfill_positions.py antes')
+
+    last_rowid = conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM positions').fetchone()[0]
+    rows = conn.execute('SELECT COUNT(*) FROM positions WHERE rowid <= ? AND evaluation IS NOT NULL', (last_rowid,)).fetchone()[0]
+    staging = path + '.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    arrays = {
+        name: np.lib.format.open_memmap(
+            os.path.join(staging, name + '.npy'), mode='w+', dtype=dtype,
+            shape=(rows,) if width is None else (rows, width),
+        )
+        for name, (dtype, width) in ARRAYS.items()
+    }
+
+    slice_flags = [f'({condition}) AS slice_{index}' for index, condition in enumerate(slices.values())]
+    query = f'''
+        SELECT rowid, {', '.join(FEATURE_COLUMNS)}, evaluation_value, is_mate, COALESCE(mate_in, 0) AS mate_in,
+               {', '.join(BITBOARD_COLUMNS + slice_flags)}
+        FROM positions WHERE rowid <= {int(last_rowid)} AND evaluation IS NOT NULL ORDER BY rowid
+    '''
+    start = 0
+    for chunk in pd.read_sql_query(query, conn, chunksize=chunk_size):
+        end = start + len(chunk)
+        arrays['rowid'][start:end] = chunk['rowid'].to_numpy()
+        arrays['features'][start:end] = chunk[FEATURE_COLUMNS].to_numpy()
+        arrays['evaluation'][start:end] = chunk['evaluation_value'].to_numpy()
+        arrays['is_mate'][start:end] = chunk['is_mate'].to_numpy()
+        arrays['mate_in'][start:end] = chunk['mate_in'].to_numpy()
+        arrays['bitboards'][start:end] = chunk[BITBOARD_COLUMNS].to_numpy(dtype=np.int64)
+        flags = np.zeros(len(chunk), dtype=np.uint8)
+        for index in range(len(slices)):
+            flags |= chunk[f'slice_{index}'].to_numpy(dtype=np.uint8) << index
+        arrays['slices'][start:end] = flags
+        start = end
+
+    for array in arrays.values():
+        array.flush()
+    del arrays
+
+    manifest = {
+        'version': DATASET_VERSION,
+        'rows': rows,
+        'last_rowid': last_rowid,
+        'feature_columns': FEATURE_COLUMNS,
+        'bitboard_columns': BITBOARD_COLUMNS,
+        'slices': slices,
+        'arrays': {name: {'dtype': np.dtype(dtype).str, 'columns': width} for name, (dtype, width) in ARRAYS.items()},
+    }
+    with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(staging, path)
+    return manifest
+
+def load_dataset(path: str) -> dict:
+    """
+    Abre um conjunto exportado por export_dataset sem copiá-lo para a memória: cada array é um
+    memmap somente leitura. Retorna {'manifest': ..., 'features': ..., 'evaluation': ..., ...}.
+    """
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest['version'] != DATASET_VERSION:
+        raise ValueError(f"conjunto de dados na versão {manifest['version']}, esperada {DATASET_VERSION}; exporte novamente")
+
+    dataset = {'manifest': manifest}
+    for name in manifest['arrays']:
+        dataset[name] = np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+    return dataset
+
+def slice_mask(dataset: dict, slice_name: str) -> np.ndarray:
+    """Retorna a máscara booleana das posições que pertencem ao recorte."""
+    index = list(dataset['manifest']['slices']).index(slice_name)
+    return (dataset['slices'] >> index) & 1 == 1
+
+def feature_matrix(dataset: dict, columns: list, rows=slice(None)) -> np.ndarray:
+    """Retorna as colunas pedidas de features.npy para as linhas selecionadas (fatia ou máscara)."""
+    indexes = [dataset['manifest']['feature_columns'].index(column) for column in columns]
+    return dataset['features'][rows][:, indexes]
+
+def unpack_bitboards(boards: np.ndarray) -> np.ndarray:
+    """Expande uma matriz (n, 12) de bitboards int64 em planos booleanos (n, 12, 64)."""
+    boards = np.ascontiguousarray(boards, dtype=np.int64)
+    bits = np.unpackbits(boards.view(np.uint8), bitorder='little')
+    return bits.reshape(len(boards), len(BITBOARD_COLUMNS), 64).astype(bool)
+
+def piece_planes(dataset: dict, rows=slice(None)) -> np.ndarray:
+    """Expande os bitboards das linhas selecionadas em planos booleanos (n, 12, 64)."""
+    return unpack_bitboards(dataset['bitboards'][rows])
+
+def heat_map_statistics(dataset: dict, slice_name: str = 'default', block_size: int = 100_000):
+    """
+    Calcula soma, contagem e soma dos quadrados das avaliações (sem xeque-mate) de cada peça em cada casa,
+    arrays (12, 64) equivalentes aos de heat_map.slice_statistics, percorrendo o conjunto em blocos.
+    """
+    shape = (len(BITBOARD_COLUMNS), 64)
+    size = shape[0] * shape[1]
+    sums, counts, sum_squares = np.zeros(size), np.zeros(size, dtype=np.int64), np.zeros(size)
+    selected = np.flatnonzero(slice_mask(dataset, slice_name) & (dataset['is_mate'] == 0))
+    for start in range(0, len(selected), block_size):
+        rows = selected[start:start + block_size]
+        block_rows, bins = np.nonzero(piece_planes(dataset, rows).reshape(len(rows), size))
+        evaluations = dataset['evaluation'][rows][block_rows]
+        sums += np.bincount(bins, weights=evaluations, minlength=size)
+        counts += np.bincount(bins, minlength=size)
+        sum_squares += np.bincount(bins, weights=evaluations ** 2, minlength=size)
+    return sums.reshape(shape), counts.reshape(shape), sum_squares.reshape(shape)
+
+if __name__ == '__main__':
+    from heat_map import HEAT_MAP_SLICES
+
+    parser = argparse.ArgumentParser(description='Exporta a tabela positions para arrays .npy abertos por memmap.')
+    parser.add_argument('--db', default='chess_analysis.db', help='banco de dados SQLite')
+    parser.add_argument('--out', default='positions_dataset', help='diretório do conjunto de dados')
+    parser.add_argument('--chunk-size', type=int, default=200_000, help='linhas lidas do banco por vez')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    manifest = export_dataset(conn, args.out, HEAT_MAP_SLICES, args.chunk_size)
+    conn.close()
+    print(f"{manifest['rows']} posições exportadas para {args.out}")
@@ -1,73 +1,135 @@
 from position_analyzer import *
+from ingestion import *
+from feature_cache import CachedAnalyzer, read_cache_stats, format_cache_stats
+from position_ids import position_id
+import instrumentation
 
-import sqlite3
-import csv
 
+# Namespace do cache de características; muda sempre que position_features passa a devolver outras colunas
+FEATURES_NAMESPACE = 'positions_v2'
+
+# Colunas acrescentadas depois da criação original da tabela positions
+DERIVED_COLUMNS = {
+    **{column: 'INTEGER' for column in BITBOARD_COLUMNS},
+    **{column: 'INTEGER' for column in MOBILITY_COLUMNS},
+    'evaluation_value': 'REAL',
+    'is_mate': 'INTEGER',
+    'mate_in': 'INTEGER',
+}
+
+def create_positions_table(conn):
+    """
+    Cria a tabela positions caso ela ainda não exista. Cada posição é identificada pelo id de
+    position_ids (o hash Zobrist da FEN); o rowid continua seguindo a ordem de inserção, usada pelas
+    atualizações incrementais do mapa de calor e da regressão.
+    """
+    cursor = conn.cursor()
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(positions)')]
+    if columns and 'id' not in columns:
+        raise RuntimeError("positions ainda usa a FEN como chave; execute migrate_ids.py antes")
 
-def insert_data(fen, material, total_material, mobility, central_control, king_safety, connectivity, evaluation, pawns, knights, bishops, rooks, queens, kings):
-    """Insere uma posição de xadrez e sua avaliação no banco de dados."""
     cursor.execute('''
-        INSERT OR REPLACE INTO positions (fen, material, total_material, mobility, central_control, king_safety, connectivity, evaluation, pawns, knights, bishops, rooks, queens, kings)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (fen, material, total_material, mobility, central_control, king_safety, connectivity, evaluation, str(pawns), str(knights), str(bishops), str(rooks), str(queens), str(kings)))
+        CREATE TABLE IF NOT EXISTS positions (
+            id INTEGER UNIQUE,
+            fen TEXT,
+            material INTEGER,
+            total_material INTEGER,
+            mobility INTEGER,
+            central_control INTEGER,
+            king_safety INTEGER,
+            connectivity INTEGER,
+            evaluation INTEGER,
+            pawns TEXT,
+            knights TEXT,
+            bishops TEXT,
+            rooks TEXT,
+            queens TEXT,
+            kings TEXT
+        )
+    ''')
+
+    # Bancos criados antes das colunas derivadas recebem as colunas novas (preenchidas por backfill_positions.py)
+    existing = [row[1] for row in cursor.execute('PRAGMA table_info(positions)')]
+    for column, column_type in DERIVED_COLUMNS.items():
+        if column not in existing:
+            cursor.execute(f'ALTER TABLE positions ADD COLUMN {column} {column_type}')
+
+    # Índice de cobertura para as consultas de análise filtradas por material
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_positions_material ON positions (
+            material, total_material, is_mate, evaluation_value,
+            mobility, central_control, king_safety, connectivity
+        )
+    ''')
+
+    # Visão normalizada (id, fen, piece, square) para estatísticas por casa com GROUP BY; bancos com a
+    # visão antiga, ligada só pela FEN, recebem a nova
+    view = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'view' AND name = 'piece_squares'").fetchone()
+    if view is not None and 'p.id' not in view[0]:
+        cursor.execute('DROP VIEW piece_squares')
+    planes = ' UNION ALL '.join([
+        f"SELECT p.id, p.fen, '{column[:-3]}' AS piece, s.square FROM positions p "
+        f"JOIN board_squares s ON (p.{column} >> s.square) & 1"
+        for column in BITBOARD_COLUMNS
+    ])
+    cursor.execute(f'''
+        CREATE VIEW IF NOT EXISTS piece_squares AS
+        WITH RECURSIVE board_squares(square) AS (
+            SELECT 0 UNION ALL SELECT square + 1 FROM board_squares WHERE square < 63
+        )
+        {planes}
+    ''')
+    conn.commit()
+
+POSITION_COLUMNS = [
+    'fen', 'material', 'total_material', 'mobility', 'central_control', 'king_safety', 'connectivity', 'evaluation',
+    'pawns', 'knights', 'bishops', 'rooks', 'queens', 'kings',
+] + list(DERIVED_COLUMNS)
+
+# Recebe o id da posição seguido de uma linha na ordem de POSITION_COLUMNS; posições já gravadas são mantidas
+INSERT_POSITION_SQL = f'''
+    INSERT INTO positions (id, {', '.join(POSITION_COLUMNS)})
+    VALUES ({', '.join(['?'] * (len(POSITION_COLUMNS) + 1))})
+    ON CONFLICT (id) DO NOTHING
+'''
+
+def insert_data(conn, fen, material, total_material, mobility, central_control, king_safety, connectivity, evaluation, pawns, knights, bishops, rooks, queens, kings, *derived):
+    """Insere uma posição de xadrez e sua avaliação no banco de dados."""
+    cursor = conn.cursor()
+    cursor.execute(INSERT_POSITION_SQL, (position_id(fen), fen, material, total_material, mobility, central_control, king_safety, connectivity, evaluation, str(pawns), str(knights), str(bishops), str(rooks), str(queens), str(kings), *derived))
     conn.commit()
 
-conn = sqlite3.connect('chess_analysis.db')
-cursor = conn.cursor()
-
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS positions (
-        fen TEXT PRIMARY KEY,
-        material INTEGER,
-        total_material INTEGER,
-        mobility INTEGER,
-        central_control INTEGER,
-        king_safety INTEGER,
-        connectivity INTEGER,
-        evaluation INTEGER,
-        pawns TEXT,
-        knights TEXT,
-        bishops TEXT,
-        rooks TEXT,
-        queens TEXT,
-        kings TEXT
-    )
-''')
-
-
-CSV_FILE_PATH = 'data/chessData.csv'
-POSITIONS_ANALYZED = 200000
-
-fen_data_list = []
-with open(CSV_FILE_PATH, 'r') as file:
-    reader = csv.reader(file)
-    next(reader)
-    
-    for i, row in enumerate(reader):
-        if i == POSITIONS_ANALYZED:
-            break
-        fen_data_list.append(row)
-        
-
-for fen_data in fen_data_list:
-    board = chess.Board(fen=fen_data[0])
-    
-    material = compute_material_count(board)
-    total_material = compute_total_material_count(board)
-    mobility = compute_mobility(board)
-    central_control = compute_central_control(board)
-    king_safety = compute_king_safety(board)
-    connectivity = compute_connectivity(board)
+def position_features(board: chess.Board) -> tuple:
+    """Calcula as colunas de positions que dependem apenas da posição (armazenadas no cache de características)."""
+    features = extract_features(board)
+    return (features['material'], features['total_material'], features['mobility'], features['central_control'], features['king_safety'], features['connectivity'], str(features['pawns']), str(features['knights']), str(features['bishops']), str(features['rooks']), str(features['queens']), str(features['kings']), *piece_bitboards(board), *features['mobility_by_piece'])
+
+def position_row(fen_data, features: tuple) -> tuple:
+    """Monta a linha de positions, na ordem de POSITION_COLUMNS, a partir da linha do CSV e de position_features."""
     evaluation = fen_data[1]
-    pawns = get_pawns_position(board)
-    knight = get_knights_position(board)
-    bishops = get_bishops_position(board)
-    rooks = get_rooks_position(board)
-    queens = get_queens_position(board)
-    kings = get_kings_position(board)
-    
-    insert_data(fen_data[0], material, total_material, mobility, central_control, king_safety, connectivity, evaluation, pawns, knight, bishops, rooks, queens, kings)
-
-
-conn.commit()
-conn.close()
\ No newline at end of file
+    return (fen_data[0], *features[:6], evaluation, *features[6:], *parse_evaluation(evaluation))
+
+def analyze_position(fen_data):
+    """Calcula as características de uma linha (FEN, avaliação) do CSV na ordem de POSITION_COLUMNS."""
+    with instrumentation.stage('board'):
+        board = chess.Board(fen=fen_data[0])
+    return position_row(fen_data, position_features(board))
+
+
+if __name__ == '__main__':
+    args = ingestion_arguments('Popula a tabela positions com as características de cada FEN.').parse_args()
+    instrumentation.configure(args.instrument, args.profile, args.report)
+
+    offset, limit, previous_fen = resume_window(args, 'positions')
+    fen_data = stream_fen_data(args.csv, offset, limit, previous_fen)
+    analyze = analyze_position
+    if args.cache:
+        analyze = CachedAnalyzer(position_row, position_features, args.cache, FEATURES_NAMESPACE, args.cache_size)
+        stats_before = read_cache_stats(args.cache, FEATURES_NAMESPACE)
+    run_ingestion(fen_data, analyze, create_positions_table, INSERT_POSITION_SQL, 'positions', db_path=args.db,
+                  workers=args.workers, chunk_size=args.chunk_size, batch_size=args.batch_size,
+                  job='positions', csv_path=args.csv, offset=offset, total=limit)
+
+    if args.cache:
+        stats_after = read_cache_stats(args.cache, FEATURES_NAMESPACE)
+        print(format_cache_stats(FEATURES_NAMESPACE, [after - before for after, before in zip(stats_after, stats_before)]))
@@ -0,0 +1,158 @@
+import argparse
+import itertools
+import pickle
+import sqlite3
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import chess
+import numpy as np
+from position_analyzer import extract_features, piece_bitboards, MOBILITY_COLUMNS
+from heat_map import PIECE_PLANES, NUM_SQUARES
+from regression import RegressionStats, PIECE_SQUARE_COLUMNS
+
+# Cada bitboard tem 8 bytes: as tabelas por byte somam os valores das casas cujos bits estão ligados
+BYTE_BITS = (np.arange(256)[:, None] >> np.arange(8)) & 1
+
+def byte_table(values: np.ndarray) -> np.ndarray:
+    """
+    Converte valores (12, 64) por peça e casa em uma tabela (96, 256): para cada byte dos 12 bitboards,
+    a soma dos valores das casas presentes em cada um dos 256 conteúdos possíveis do byte.
+    """
+    per_byte = values.reshape(len(PIECE_PLANES), 8, 8)
+    return np.einsum('pbk,vk->pbv', per_byte, BYTE_BITS).reshape(len(PIECE_PLANES) * 8, 256)
+
+def gather_bytes(table: np.ndarray, bitboards: np.ndarray) -> np.ndarray:
+    """Soma, para cada posição, os valores de byte_table indexados pelos 96 bytes dos seus bitboards."""
+    boards = np.ascontiguousarray(bitboards, dtype=np.int64)
+    data = boards.view(np.uint8).reshape(len(boards), len(PIECE_PLANES) * 8)
+    return table[np.arange(data.shape[1]), data].sum(axis=1)
+
+def board_arrays(feature_columns: list, boards) -> tuple:
+    """Empilha as características pedidas (n, k) e os bitboards (n, 12) de uma lista de tabuleiros."""
+    X = np.empty((len(boards), len(feature_columns)))
+    bitboards = np.empty((len(boards), len(PIECE_PLANES)), dtype=np.int64)
+    for row, board in enumerate(boards):
+        features = extract_features(board)
+        features.update(zip(MOBILITY_COLUMNS, features['mobility_by_piece']))
+        X[row] = [features[column] for column in feature_columns]
+        bitboards[row] = piece_bitboards(board)
+    return X, bitboards
+
+def fen_arrays(feature_columns: list, fens) -> tuple:
+    """Executada nos processos de trabalho da linha de comando para cada lote de FENs."""
+    return board_arrays(feature_columns, [chess.Board(fen=fen) for fen in fens])
+
+class PositionEvaluator:
+    """
+    Avalia posições com o modelo linear treinado por regression.py e com o mapa de calor de heat_map.py.
+    Os coeficientes e o mapa são carregados uma única vez; as avaliações são calculadas em lote, com as
+    características empilhadas em uma matriz e os termos por peça e casa lidos dos bitboards por tabela.
+    """
+
+    def __init__(self, columns: list, intercept: float, coef, heat_map=None):
+        self.columns = list(columns)
+        self.intercept = float(intercept)
+        coef = np.asarray(coef, dtype=np.float64)
+
+        self.feature_columns = [column for column in self.columns if column not in PIECE_SQUARE_COLUMNS]
+        self.feature_weights = np.array([coef[self.columns.index(column)] for column in self.feature_columns])
+        square_weights = np.zeros((len(PIECE_PLANES), NUM_SQUARES))
+        if len(self.feature_columns) < len(self.columns):
+            square_weights = np.array([coef[self.columns.index(column)] for column in PIECE_SQUARE_COLUMNS])
+        self.square_table = byte_table(square_weights.reshape(len(PIECE_PLANES), NUM_SQUARES))
+
+        # Mapa de calor: soma dos valores conhecidos e número de peças em casas com valor, para a média
+        heat_map = np.full((len(PIECE_PLANES), NUM_SQUARES), np.nan) if heat_map is None else np.asarray(heat_map, dtype=np.float64)
+        self.heat_table = byte_table(np.nan_to_num(heat_map))
+        self.heat_count_table = byte_table((~np.isnan(heat_map)).astype(np.float64))
+
+    @classmethod
+    def from_database(cls, db_path: str, model: str = 'default') -> 'PositionEvaluator':
+        """Carrega o modelo salvo por regression.py e a tabela heat_map do banco."""
+        conn = sqlite3.connect(db_path)
+        saved = conn.execute('SELECT train FROM regression_stats WHERE model = ?', (model,)).fetchone()
+        if saved is None:
+            conn.close()
+            raise SystemExit(f'modelo {model} não encontrado; execute regression.py antes')
+        train = RegressionStats.from_dict(pickle.loads(saved[0]))
+
+        heat_map = np.full((len(PIECE_PLANES), NUM_SQUARES), np.nan)
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        if 'heat_map' in tables:
+            for house, *values in conn.execute(f"SELECT house, {', '.join(PIECE_PLANES)} FROM heat_map"):
+                heat_map[:, house] = [np.nan if value is None else value for value in values]
+        conn.close()
+
+        intercept, coef = train.solve()
+        return cls(train.columns, intercept, coef, heat_map)
+
+    def board_arrays(self, boards) -> tuple:
+        """Calcula as características e os bitboards de uma lista de tabuleiros, empilhados em arrays."""
+        return board_arrays(self.feature_columns, boards)
+
+    def evaluate_arrays(self, X: np.ndarray, bitboards: np.ndarray) -> np.ndarray:
+        """Avaliação do modelo linear a partir das características (n, k) e dos bitboards (n, 12)."""
+        return self.intercept + np.asarray(X, dtype=np.float64) @ self.feature_weights + gather_bytes(self.square_table, bitboards)
+
+    def heat_arrays(self, bitboards: np.ndarray) -> np.ndarray:
+        """Média dos valores do mapa de calor das peças da posição (NaN se nenhuma casa tem valor)."""
+        counts = gather_bytes(self.heat_count_table, bitboards)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return gather_bytes(self.heat_table, bitboards) / counts
+
+    def evaluate(self, boards) -> np.ndarray:
+        X, bitboards = self.board_arrays(boards)
+        return self.evaluate_arrays(X, bitboards)
+
+    def evaluate_fens(self, fens) -> np.ndarray:
+        return self.evaluate([chess.Board(fen=fen) for fen in fens])
+
+def read_batches(lines, batch_size: int):
+    """Agrupa as FENs lidas (uma por linha; o que vier após uma vírgula é ignorado) em lotes."""
+    batch = []
+    for line in lines:
+        fen = line.split(',')[0].strip()
+        if not fen:
+            continue
+        batch.append(fen)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def score_batches(evaluator: PositionEvaluator, batches, workers: int = 1):
+    """
+    Gera (fens, avaliações, médias do mapa de calor) para cada lote, na ordem de entrada. Com mais de um
+    processo, as características (a parte cara) são calculadas em paralelo, com poucos lotes em andamento
+    para que a entrada padrão continue sendo lida aos poucos.
+    """
+    if workers <= 1:
+        for fens in batches:
+            X, bitboards = fen_arrays(evaluator.feature_columns, fens)
+            yield fens, evaluator.evaluate_arrays(X, bitboards), evaluator.heat_arrays(bitboards)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for fens in itertools.chain(batches, [None]):
+            if fens is not None:
+                pending.append((fens, executor.submit(fen_arrays, evaluator.feature_columns, fens)))
+            while pending and (fens is None or len(pending) > 2 * workers):
+                done_fens, future = pending.popleft()
+                X, bitboards = future.result()
+                yield done_fens, evaluator.evaluate_arrays(X, bitboards), evaluator.heat_arrays(bitboards)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Avalia as FENs lidas da entrada padrão com o modelo treinado.')
+    parser.add_argument('--db', default='chess_analysis.db', help='banco de dados SQLite com o modelo e o mapa de calor')
+    parser.add_argument('--model', default='default', help='nome do modelo salvo por regression.py')
+    parser.add_argument('--batch-size', type=int, default=10_000, help='FENs avaliadas por lote')
+    parser.add_argument('--workers', type=int, default=1, help='processos calculando as características dos lotes')
+    args = parser.parse_args()
+
+    evaluator = PositionEvaluator.from_database(args.db, args.model)
+    for fens, scores, heat in score_batches(evaluator, read_batches(sys.stdin, args.batch_size), args.workers):
+        for fen, score, heat_value in zip(fens, scores, heat):
+            print(f'{fen}\t{score:.2f}\t{heat_value:.2f}')
@@ -0,0 +1,179 @@
+import argparse
+import pickle
+import sqlite3
+from collections import OrderedDict
+import chess
+import instrumentation
+
+def normalized_fen(fen: str) -> str:
+    """Retorna os campos da FEN que definem a posição (peças, lado a jogar, roques e en passant), sem os relógios."""
+    return ' '.join(fen.split()[:4])
+
+def create_cache_tables(conn):
+    """Cria as tabelas do cache em disco: valores por posição e contadores acumulados."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS feature_cache (
+            namespace TEXT,
+            position TEXT,
+            value BLOB,
+            PRIMARY KEY (namespace, position)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cache_stats (
+            namespace TEXT PRIMARY KEY,
+            memory_hits INTEGER,
+            disk_hits INTEGER,
+            misses INTEGER
+        )
+    ''')
+    conn.commit()
+
+class FeatureCache:
+    """
+    Cache de características por posição normalizada: um LRU em memória na frente de um arquivo
+    SQLite compartilhado entre processos. Valores novos são gravados em disco em lotes por flush().
+    """
+
+    def __init__(self, path: str, namespace: str, maxsize: int = 100_000, batch_size: int = 1000):
+        self.path = path
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.memory = OrderedDict()
+        self.pending = []
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.reported = (0, 0, 0)
+
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        create_cache_tables(self.conn)
+
+    def remember(self, key: str, value):
+        """Coloca o valor no LRU em memória, descartando o menos usado quando ele está cheio."""
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
+
+    def get(self, key: str):
+        """Procura o valor em memória e depois em disco. Retorna None se a posição não está no cache."""
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            return self.memory[key]
+
+        row = self.conn.execute(
+            'SELECT value FROM feature_cache WHERE namespace = ? AND position = ?', (self.namespace, key)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.disk_hits += 1
+        value = pickle.loads(row[0])
+        self.remember(key, value)
+        return value
+
+    def put(self, key: str, value):
+        """Guarda um valor recém-calculado em memória e o agenda para gravação em disco."""
+        self.remember(key, value)
+        self.pending.append((self.namespace, key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Grava em disco os valores pendentes e soma os contadores desde o último flush em cache_stats."""
+        counters = (self.memory_hits, self.disk_hits, self.misses)
+        delta = [current - previous for current, previous in zip(counters, self.reported)]
+        if not self.pending and not any(delta):
+            return
+
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO feature_cache (namespace, position, value) VALUES (?, ?, ?)', self.pending
+            )
+            self.conn.execute('''
+                INSERT INTO cache_stats (namespace, memory_hits, disk_hits, misses) VALUES (?, ?, ?, ?)
+                ON CONFLICT (namespace) DO UPDATE SET
+                    memory_hits = memory_hits + excluded.memory_hits,
+                    disk_hits = disk_hits + excluded.disk_hits,
+                    misses = misses + excluded.misses
+            ''', (self.namespace, *delta))
+        self.pending = []
+        self.reported = counters
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+# Um cache por processo para cada (arquivo, namespace), reaproveitado entre os blocos de posições
+_caches = {}
+
+def cache_for(path: str, namespace: str, maxsize: int) -> FeatureCache:
+    key = (path, namespace)
+    if key not in _caches:
+        _caches[key] = FeatureCache(path, namespace, maxsize)
+    return _caches[key]
+
+class CachedAnalyzer:
+    """
+    Função de análise de linhas do CSV que consulta o cache antes de calcular as características.
+    compute_features(board) produz o valor armazenado por posição e analyze_row(fen_data, features)
+    monta a linha final. Pode ser enviada aos processos de trabalho: cada processo abre o seu cache.
+    """
+
+    def __init__(self, analyze_row, compute_features, path: str, namespace: str, maxsize: int = 100_000):
+        self.analyze_row = analyze_row
+        self.compute_features = compute_features
+        self.path = path
+        self.namespace = namespace
+        self.maxsize = maxsize
+
+    def __call__(self, fen_data):
+        cache = cache_for(self.path, self.namespace, self.maxsize)
+        key = normalized_fen(fen_data[0])
+        with instrumentation.stage('cache/get'):
+            features = cache.get(key)
+        if features is None:
+            with instrumentation.stage('board'):
+                board = chess.Board(fen=fen_data[0])
+            features = self.compute_features(board)
+            with instrumentation.stage('cache/put'):
+                cache.put(key, features)
+        return self.analyze_row(fen_data, features)
+
+    def flush(self):
+        """Chamada ao fim de cada bloco, para que os processos de trabalho não percam valores ao terminar."""
+        cache_for(self.path, self.namespace, self.maxsize).flush()
+
+def read_cache_stats(path: str, namespace: str) -> tuple:
+    """Retorna os contadores acumulados (acertos em memória, acertos em disco, faltas) de um namespace."""
+    conn = sqlite3.connect(path, timeout=60)
+    create_cache_tables(conn)
+    row = conn.execute(
+        'SELECT memory_hits, disk_hits, misses FROM cache_stats WHERE namespace = ?', (namespace,)
+    ).fetchone()
+    conn.close()
+    return row if row is not None else (0, 0, 0)
+
+def format_cache_stats(namespace: str, stats: tuple) -> str:
+    memory_hits, disk_hits, misses = stats
+    total = memory_hits + disk_hits + misses
+    hit_rate = (memory_hits + disk_hits) / total if total else 0.0
+    return (f"{namespace}: {memory_hits} acertos em memória, {disk_hits} acertos em disco, "
+            f"{misses} faltas ({hit_rate:.1%} de acertos)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mostra os contadores do cache de características.')
+    parser.add_argument('cache', help='arquivo SQLite do cache')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.cache)
+    create_cache_tables(conn)
+    namespaces = [row[0] for row in conn.execute('SELECT namespace FROM cache_stats ORDER BY namespace')]
+    conn.close()
+    for namespace in namespaces:
+        print(format_cache_stats(namespace, read_cache_stats(args.cache, namespace)))
@@ -0,0 +1,293 @@
+import chess
+import chess.polyglot
+import lookup_tables
+import instrumentation
+from position_analyzer import PIECE_VALUES, CONNECTIVITY_VALUES, BB_CENTER, piece_attacks, pin_masks, needs_move_generation, to_signed_bitboard
+from position_ids import RANDOM, PIECE_KEYS
+
+# Símbolo da FEN e chaves Zobrist (as mesmas de position_ids) de cada peça (tipo, cor)
+PIECE_SYMBOLS = {
+    (piece_type, color): chess.piece_symbol(piece_type).upper() if color else chess.piece_symbol(piece_type)
+    for piece_type in chess.PIECE_TYPES
+    for color in chess.COLORS
+}
+ZOBRIST_KEYS = {piece: PIECE_KEYS[symbol] for piece, symbol in PIECE_SYMBOLS.items()}
+HASHER = chess.polyglot.ZobristHasher(RANDOM)
+
+def board_masks(board: chess.Board) -> tuple:
+    """Bitboards que descrevem a disposição das peças: um por tipo de peça e o das peças brancas."""
+    return board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings, board.occupied_co[chess.WHITE]
+
+def legal_ep_square(board: chess.Board):
+    """Casa de en passant que aparece em board.fen(): só quando a captura é legal."""
+    return board.ep_square if board.ep_square is not None and board.has_legal_en_passant() else None
+
+def move_count(targets: int) -> int:
+    """Movimentos de uma peça até `targets`, contando quatro por destino na última fileira (promoções dos peões)."""
+    return chess.popcount(targets & ~chess.BB_BACKRANKS) + 4 * chess.popcount(targets & chess.BB_BACKRANKS)
+
+def pawn_pushes(pawns: int, color: chess.Color, occupied: int, double: bool = True) -> int:
+    """Casas livres alcançadas pelos peões avançando uma casa (e duas, a partir da fileira inicial, se `double`)."""
+    if color == chess.WHITE:
+        single = pawns << 8 & ~occupied & chess.BB_ALL
+        return single | (single & chess.BB_RANK_3) << 8 & ~occupied if double else single
+    single = pawns >> 8 & ~occupied
+    return single | (single & chess.BB_RANK_6) >> 8 & ~occupied if double else single
+
+class IncrementalPosition:
+    """
+    Características das posições de uma partida, atualizadas lance a lance a partir da posição anterior.
+    Em update() só as casas que mudaram de ocupante alteram o material, o hash Zobrist e as fileiras da
+    FEN. Os ataques de cada peça, e suas parcelas do controle central e da conectividade, são refeitos
+    em features() apenas para as peças nas casas alteradas e para as que atacam alguma delas (uma peça
+    deslizante só muda de alcance quando uma casa do seu alcance muda). Os valores são idênticos aos de
+    db.position_features e create_graph.generate_attack_data sobre o mesmo tabuleiro.
+    """
+
+    def __init__(self, board: chess.Board):
+        self.reset(board)
+
+    def reset(self, board: chess.Board):
+        """Recomeça a partir de um tabuleiro qualquer (a posição inicial da partida)."""
+        self.pieces = [None] * 64  # (tipo, cor) da peça em cada casa
+        self.masks = (0,) * 7
+        self.material = 0
+        self.total_material = 0
+        self.piece_hash = 0
+        self.ranks = ['8'] * 8  # fileiras da FEN, da oitava para a primeira
+        self.attacks = [0] * 64
+        self.central = [0] * 64
+        self.connections = [0] * 64
+        self.targets = [0] * 64
+        self.moves = [0] * 64
+        self.slots = [0] * 64  # posição em self.mobility (7 * cor + tipo) da peça que tinha self.moves movimentos
+        self.mobility = [0] * 14
+        self.lists = [(None, None, None)] * 6
+        self.central_control = 0
+        self.connectivity = 0
+        self.stale = chess.BB_ALL  # casas alteradas desde o último cálculo dos ataques
+        self.update(board)
+
+    def update(self, board: chess.Board):
+        """Aplica as diferenças entre a posição anterior e `board` (em geral, um lance depois)."""
+        masks = board_masks(board)
+        changed = 0
+        for old, new in zip(self.masks, masks):
+            changed |= old ^ new
+        self.masks = masks
+        white = masks[6]
+
+        ranks = 0
+        for square in chess.scan_forward(changed):
+            old = self.pieces[square]
+            if old is not None:
+                value = PIECE_VALUES.get(old[0], 0)
+                self.material -= value if old[1] else -value
+                self.total_material -= value
+                self.piece_hash ^= ZOBRIST_KEYS[old][square]
+            piece_type = board.piece_type_at(square)
+            new = (piece_type, bool(white & chess.BB_SQUARES[square])) if piece_type else None
+            if new is not None:
+                value = PIECE_VALUES.get(piece_type, 0)
+                self.material += value if new[1] else -value
+                self.total_material += value
+                self.piece_hash ^= ZOBRIST_KEYS[new][square]
+            self.pieces[square] = new
+            ranks |= 1 << (square >> 3)
+
+        for rank in chess.scan_forward(ranks):
+            self.ranks[7 - rank] = self.rank_text(rank)
+        self.stale |= changed
+
+    def rank_text(self, rank: int) -> str:
+        text, empty = '', 0
+        for piece in self.pieces[8 * rank:8 * rank + 8]:
+            if piece is None:
+                empty += 1
+                continue
+            if empty:
+                text += str(empty)
+                empty = 0
+            text += PIECE_SYMBOLS[piece]
+        return text + str(empty) if empty else text
+
+    def position_id(self, board: chess.Board) -> int:
+        """
+        Id da posição, igual a position_ids.position_id(self.fen(board)), a partir do hash das peças mantido
+        em update(). Como na FEN, o en passant só entra no hash quando a captura é legal.
+        """
+        value = self.piece_hash ^ HASHER.hash_castling(board) ^ HASHER.hash_turn(board)
+        ep_square = legal_ep_square(board)
+        if ep_square is not None:
+            value ^= RANDOM[772 + chess.square_file(ep_square)]
+        return value - (1 << 64) if value >= 1 << 63 else value
+
+    def fen(self, board: chess.Board) -> str:
+        """Mesmo texto de board.fen(), reaproveitando as fileiras que o lance não alterou."""
+        ep_square = legal_ep_square(board)
+        return ' '.join([
+            '/'.join(self.ranks),
+            'w' if board.turn == chess.WHITE else 'b',
+            board.castling_xfen() if board.castling_rights else '-',
+            chess.SQUARE_NAMES[ep_square] if ep_square is not None else '-',
+            str(board.halfmove_clock),
+            str(board.fullmove_number),
+        ])
+
+    def refresh_attacks(self, board: chess.Board):
+        """
+        Refaz os ataques das peças afetadas pelas casas alteradas desde a última chamada, com os destinos
+        de cada peça que independem de cravadas e de xeques (capturas dos peões, casas livres ou inimigas
+        das demais peças, exceto o rei) e o total desses movimentos por cor e tipo de peça.
+        """
+        stale = self.stale
+        if not stale:
+            return
+        occupied = board.occupied
+        white = self.masks[6]
+        affected = stale
+        if stale != chess.BB_ALL:
+            # Uma peça que não saiu do lugar alcançava uma casa alterada antes dos lances se e só se alcança
+            # agora: em cada direção, a casa alterada mais próxima dela é atacada nos dois momentos
+            rooks = board.rooks | board.queens
+            bishops = board.bishops | board.queens
+            for square in chess.scan_forward(stale):
+                affected |= (lookup_tables.KNIGHT_ATTACKS[square] & board.knights |
+                             lookup_tables.KING_ATTACKS[square] & board.kings |
+                             lookup_tables.rook_attacks(square, occupied) & rooks |
+                             lookup_tables.bishop_attacks(square, occupied) & bishops |
+                             lookup_tables.PAWN_ATTACKS[chess.BLACK][square] & board.pawns & white |
+                             lookup_tables.PAWN_ATTACKS[chess.WHITE][square] & board.pawns & ~white)
+
+        for square in chess.scan_forward(affected):
+            piece = self.pieces[square]
+            attacks, central, connections, targets, moves, slot = 0, 0, 0, 0, 0, 0
+            if piece is not None:
+                piece_type, color = piece
+                sign = 1 if color else -1
+                own = white if color else occupied & ~white
+                attacks = piece_attacks(piece_type, color, square, occupied)
+                central = sign * chess.popcount(attacks & BB_CENTER)
+                if piece_type in CONNECTIVITY_VALUES:
+                    # Cada peça da mesma cor atacada por esta é uma peça defendida por ela
+                    connections = sign * CONNECTIVITY_VALUES[piece_type] * chess.popcount(attacks & own)
+                if piece_type == chess.PAWN:
+                    targets = attacks & occupied & ~own
+                    moves = move_count(targets)
+                elif piece_type != chess.KING:
+                    targets = attacks & ~own
+                    moves = chess.popcount(targets)
+                slot = 7 * color + piece_type
+            self.attacks[square] = attacks
+            self.targets[square] = targets
+            self.mobility[self.slots[square]] -= self.moves[square]
+            self.mobility[slot] += moves
+            self.moves[square] = moves
+            self.slots[square] = slot
+            self.central_control += central - self.central[square]
+            self.central[square] = central
+            self.connectivity += connections - self.connections[square]
+            self.connections[square] = connections
+        self.stale = 0
+
+    def count_moves(self, board: chess.Board, color: chess.Color, enemy_attacks: int, graph: list) -> list:
+        """
+        Conta os movimentos legais da cor indicada por tipo de peça, como position_analyzer.count_moves,
+        partindo dos totais mantidos em refresh_attacks e corrigindo só as peças cravadas, os avanços
+        dos peões e o rei. Completa em graph (uma cópia de self.targets) os destinos de cada peça.
+        """
+        own = board.occupied_co[color]
+        king_mask = board.kings & own
+        if needs_move_generation(board, color, king_mask):
+            counts = [0] * 7
+            for square in chess.scan_forward(own):
+                graph[square] = 0
+            probe = board.copy(stack=False)
+            probe.turn = color
+            for move in probe.legal_moves:
+                counts[probe.piece_type_at(move.from_square)] += 1
+                graph[move.from_square] |= chess.BB_SQUARES[move.to_square]
+            return counts
+
+        counts = self.mobility[7 * color:7 * color + 7]
+        occupied = board.occupied
+        king = chess.lsb(king_mask)
+        pawns = board.pawns & own
+
+        # Peças cravadas só se movem na linha entre o rei e o cravador
+        pinned = 0
+        for square, line in pin_masks(board, color, king).items():
+            pinned |= chess.BB_SQUARES[square]
+            if pawns & chess.BB_SQUARES[square]:
+                targets = (self.targets[square] | pawn_pushes(chess.BB_SQUARES[square], color, occupied)) & line
+                moves = move_count(targets)
+            else:
+                targets = self.targets[square] & line
+                moves = chess.popcount(targets)
+            counts[self.pieces[square][0]] += moves - self.moves[square]
+            graph[square] = targets
+
+        # Avanços dos peões não cravados, de uma vez para todos os peões
+        forward = 8 if color == chess.WHITE else -8
+        single = pawn_pushes(pawns & ~pinned, color, occupied, double=False)
+        double = pawn_pushes(pawns & ~pinned, color, occupied) & ~single
+        counts[chess.PAWN] += move_count(single) + chess.popcount(double)
+        for square in chess.scan_forward(single):
+            graph[square - forward] |= chess.BB_SQUARES[square]
+        for square in chess.scan_forward(double):
+            graph[square - 2 * forward] |= chess.BB_SQUARES[square]
+
+        targets = lookup_tables.KING_ATTACKS[king] & ~own & ~enemy_attacks
+        for rook in chess.scan_forward(board.clean_castling_rights() & own & board.rooks):
+            # Roque padrão: casas entre rei e torre vazias, casas de passagem e destino do rei não atacadas
+            king_to = chess.square(6 if rook > king else 2, chess.square_rank(king))
+            king_path = chess.between(king, king_to) | chess.BB_SQUARES[king_to]
+            if not chess.between(king, rook) & occupied and not king_path & enemy_attacks:
+                targets |= chess.BB_SQUARES[king_to]
+        graph[king] = targets
+        counts[chess.KING] = chess.popcount(targets)
+        return counts
+
+    def square_lists(self, index: int, white: int) -> str:
+        """Texto "([brancas], [pretas])" das casas das peças do tipo `index`, refeito só quando elas mudam."""
+        mask = self.masks[index]
+        cached_mask, cached_white, text = self.lists[index]
+        if mask != cached_mask or mask & white != cached_white:
+            text = str((list(chess.scan_forward(mask & white)), list(chess.scan_forward(mask & ~white))))
+            self.lists[index] = (mask, mask & white, text)
+        return text
+
+    @instrumentation.timed('features/incremental')
+    def features(self, board: chess.Board) -> tuple:
+        """
+        Retorna (colunas de db.position_features, 64 bitboards de create_graph.generate_attack_data)
+        da posição atual.
+        """
+        self.refresh_attacks(board)
+        white = self.masks[6]
+        black = board.occupied & ~white
+
+        # Ataques de cada cor: peões deslocando os bitboards, as demais peças pelos ataques já calculados
+        pawns = board.pawns
+        attacked_by = [
+            (pawns & black) >> 9 & ~chess.BB_FILE_H | (pawns & black) >> 7 & ~chess.BB_FILE_A,
+            ((pawns & white) << 7 & ~chess.BB_FILE_H | (pawns & white) << 9 & ~chess.BB_FILE_A) & chess.BB_ALL,
+        ]
+        for square in chess.scan_forward(board.occupied & ~pawns):
+            attacked_by[self.pieces[square][1]] |= self.attacks[square]
+
+        king_safety = 0
+        for color in chess.COLORS:
+            unsafe = chess.popcount(lookup_tables.KING_ZONE[board.king(color)] & attacked_by[not color])
+            king_safety -= unsafe if color == chess.WHITE else -unsafe
+
+        graph = list(self.targets)
+        white_moves = self.count_moves(board, chess.WHITE, attacked_by[chess.BLACK], graph)
+        black_moves = self.count_moves(board, chess.BLACK, attacked_by[chess.WHITE], graph)
+        by_piece = [white_moves[piece_type] - black_moves[piece_type] for piece_type in chess.PIECE_TYPES]
+
+        squares = [self.square_lists(index, white) for index in range(6)]
+        bitboards = [to_signed_bitboard(mask & own) for own in (white, black) for mask in self.masks[:6]]
+        features = (self.material, self.total_material, sum(by_piece), self.central_control, king_safety,
+                    self.connectivity, *squares, *bitboards, *by_piece)
+        return features, graph
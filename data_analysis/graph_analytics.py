@@ -0,0 +1,277 @@
+import argparse
+import sqlite3
+import numpy as np
+import scipy.sparse
+from attack_graph import to_numpy
+from ingestion import DB_PATH
+
+# Planos de peças na ordem das letras da FEN (e das colunas da tabela heat_map)
+FEN_PIECES = 'PNBRQKpnbrqk'
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+
+# Valor de cada tipo de peça na ordem dos planos (o rei nunca está pendurado)
+PLANE_VALUES = [1, 3, 3, 5, 9, 0]
+
+# Características numéricas do grafo de ataques (brancas - pretas), gravadas na tabela graph_features
+GRAPH_COLUMNS = {
+    'threatened_pieces': 'INTEGER',  # peças adversárias que podem ser capturadas
+    'hanging_pieces': 'INTEGER',     # dessas, as que não têm nenhuma peça defensora
+    'hanging_value': 'INTEGER',      # valor material das peças adversárias penduradas
+    'attack_chain': 'INTEGER',       # maior cadeia de capturas (a ataca b, que ataca c...) iniciada pelo lado
+    'square_control': 'INTEGER',     # casas alcançadas por mais peças do lado do que do adversário
+    'centrality': 'REAL',            # soma da centralidade das peças do lado
+}
+
+# Limite da cadeia de capturas: ciclos (a ataca b, que ataca a) atingem o limite
+MAX_CHAIN = 8
+
+# Grafos processados por bloco em update_graph_features: os arrays intermediários ocupam alguns KB por posição
+CHUNK_SIZE = 5_000
+
+# Parâmetros do PageRank usado como centralidade
+DAMPING = 0.85
+PAGERANK_ITERATIONS = 30
+
+FILE_A = np.uint64(0x0101010101010101)
+FILE_B = FILE_A << np.uint64(1)
+FILE_G = FILE_A << np.uint64(6)
+FILE_H = FILE_A << np.uint64(7)
+ALL = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+# Deslocamento de cada direção e casas que não podem ser alcançadas por ele (as que "deram a volta" no tabuleiro)
+ROOK_DIRECTIONS = [(8, 0), (-8, 0), (1, FILE_A), (-1, FILE_H)]
+BISHOP_DIRECTIONS = [(9, FILE_A), (7, FILE_H), (-7, FILE_A), (-9, FILE_H)]
+KNIGHT_JUMPS = [(17, FILE_A), (15, FILE_H), (10, FILE_A | FILE_B), (6, FILE_G | FILE_H),
+                (-6, FILE_A | FILE_B), (-10, FILE_G | FILE_H), (-15, FILE_A), (-17, FILE_H)]
+
+# Índice do plano de cada caractere da FEN (-1 para os demais) e casas que cada caractere avança
+PLANE_OF_CHAR = np.full(256, -1, dtype=np.int64)
+PLANE_OF_CHAR[np.frombuffer(FEN_PIECES.encode('ascii'), dtype=np.uint8)] = np.arange(len(FEN_PIECES))
+ADVANCE_OF_CHAR = np.zeros(256, dtype=np.int64)
+ADVANCE_OF_CHAR[np.frombuffer(FEN_PIECES.encode('ascii'), dtype=np.uint8)] = 1
+ADVANCE_OF_CHAR[ord('1'):ord('9')] = np.arange(1, 9)
+
+def fen_piece_bitboards(fens) -> np.ndarray:
+    """
+    Converte uma lista de FENs nos bitboards (n, 12) uint64 dos planos de peças, analisando o texto
+    de todas as FENs de uma só vez com numpy.
+    """
+    text = '\n'.join(fens) + '\n'
+    chars = np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+    newlines = chars == ord('\n')
+    rows = np.cumsum(newlines) - newlines
+    # Apenas o primeiro campo da FEN (até o primeiro espaço da linha) descreve as peças
+    spaces = np.cumsum(chars == ord(' '))
+    line_starts = np.concatenate(([0], np.flatnonzero(newlines)[:-1] + 1))
+    in_board = spaces - spaces[line_starts][rows] + (chars[line_starts][rows] == ord(' ')) == 0
+
+    advance = np.where(in_board, ADVANCE_OF_CHAR[chars], 0)
+    position = np.cumsum(advance) - advance
+    position -= position[line_starts][rows]
+    planes = PLANE_OF_CHAR[chars]
+    pieces = in_board & (planes >= 0)
+    # A FEN começa em a8 e termina em h1: o índice i na FEN corresponde à casa i ^ 56
+    squares = position[pieces] ^ 56
+
+    bits = np.zeros((len(fens), len(FEN_PIECES), 64), dtype=bool)
+    bits[rows[pieces], planes[pieces], squares] = True
+    return np.packbits(bits, axis=-1, bitorder='little').view('<u8').reshape(len(fens), len(FEN_PIECES))
+
+def square_bits(bitboards: np.ndarray) -> np.ndarray:
+    """Expande bitboards uint64 de forma (...) em indicadores booleanos de forma (..., 64)."""
+    bitboards = np.ascontiguousarray(bitboards, dtype='<u8')
+    bits = np.unpackbits(bitboards.view(np.uint8), bitorder='little')
+    return bits.reshape(bitboards.shape + (64,)).view(bool)
+
+def popcount(bitboards: np.ndarray) -> np.ndarray:
+    """Número de casas de cada bitboard."""
+    return square_bits(bitboards).sum(axis=-1)
+
+def shift(bitboards: np.ndarray, offset: int, excluded) -> np.ndarray:
+    """Desloca os bitboards `offset` casas, descartando as casas que deram a volta no tabuleiro."""
+    if offset > 0:
+        shifted = bitboards << np.uint64(offset)
+    else:
+        shifted = bitboards >> np.uint64(-offset)
+    return shifted & (ALL ^ np.uint64(excluded))
+
+def slider_attacks(pieces: np.ndarray, empty: np.ndarray, directions) -> np.ndarray:
+    """Casas atacadas por peças deslizantes: cada raio avança até a primeira casa ocupada (inclusive)."""
+    attacks = np.zeros_like(pieces)
+    for offset, excluded in directions:
+        ray = pieces
+        for _ in range(7):
+            ray = shift(ray, offset, excluded)
+            attacks |= ray
+            ray = ray & empty
+    return attacks
+
+def attack_maps(planes: np.ndarray) -> np.ndarray:
+    """
+    Casas atacadas por cada cor (n, 2), a partir dos bitboards (n, 12), incluindo as ocupadas por peças
+    da própria cor (ou seja, as defendidas). Cravadas e xeques são ignorados, como em compute_connectivity.
+    """
+    planes = np.asarray(planes, dtype=np.uint64)
+    empty = ~np.bitwise_or.reduce(planes, axis=1)
+    attacks = np.zeros((len(planes), 2), dtype=np.uint64)
+    for color in [0, 1]:
+        pieces = planes[:, 6 * color:6 * color + 6]
+        forward = 8 if color == 0 else -8
+        attacks[:, color] = (
+            shift(pieces[:, PAWN], forward + 1, FILE_A) | shift(pieces[:, PAWN], forward - 1, FILE_H)
+            | slider_attacks(pieces[:, ROOK] | pieces[:, QUEEN], empty, ROOK_DIRECTIONS)
+            | slider_attacks(pieces[:, BISHOP] | pieces[:, QUEEN], empty, BISHOP_DIRECTIONS)
+        )
+        for offset, excluded in KNIGHT_JUMPS:
+            attacks[:, color] |= shift(pieces[:, KNIGHT], offset, excluded)
+        for offset, excluded in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+            attacks[:, color] |= shift(pieces[:, KING], offset, excluded)
+    return attacks
+
+def union_of_rows(targets: np.ndarray, selected: np.ndarray) -> np.ndarray:
+    """União (n,) dos bitboards de destino (n, 64) das casas de origem selecionadas (n, 64)."""
+    return np.bitwise_or.reduce(np.where(selected, targets, np.uint64(0)), axis=1)
+
+def in_degree_by_color(targets: np.ndarray, occupancy: np.ndarray) -> np.ndarray:
+    """
+    Para cada cor (n, 2) e casa, o número de peças daquela cor que alcançam a casa: array (n, 2, 64) uint8
+    (no máximo 16 peças por cor). Os destinos das casas de outra cor são zerados antes de expandir os bits,
+    de modo que só a matriz booleana (n, 64, 64) de uma cor existe por vez.
+    """
+    degrees = np.empty((len(targets), 2, 64), dtype=np.uint8)
+    for color in [0, 1]:
+        selected = np.where(square_bits(occupancy[:, color]), targets, np.uint64(0))
+        degrees[:, color] = square_bits(selected).sum(axis=1, dtype=np.uint8)
+    return degrees
+
+def adjacency_csr(targets: np.ndarray) -> scipy.sparse.csr_matrix:
+    """
+    Monta os grafos de um lote como uma única matriz esparsa bloco-diagonal (64n, 64n): o nó
+    64 * i + casa representa a casa na posição i, com arestas origem -> destino.
+    """
+    # Os índices de np.flatnonzero já saem ordenados por origem, como a matriz CSR exige
+    edges = np.flatnonzero(square_bits(targets))
+    size = 64 * len(targets)
+    indices = ((edges >> 12 << 6) | (edges & 63)).astype(np.int32)
+    indptr = np.zeros(size + 1, dtype=np.int32)
+    np.cumsum(np.bincount(edges >> 6, minlength=size), out=indptr[1:])
+    return scipy.sparse.csr_matrix((np.ones(len(edges), dtype=np.float32), indices, indptr), shape=(size, size))
+
+def piece_centrality(targets: np.ndarray, damping: float = DAMPING, iterations: int = PAGERANK_ITERATIONS) -> np.ndarray:
+    """
+    Centralidade de cada casa (n, 64): PageRank no grafo invertido (destino -> origem), em que uma peça
+    é central quando alcança casas que muitas outras peças também alcançam. Os grafos do lote são
+    iterados juntos na matriz bloco-diagonal; a massa dos nós sem arestas e o salto aleatório ficam
+    dentro da própria posição. Os valores são multiplicados por 64 (média 1 por casa).
+    """
+    n = len(targets)
+    adjacency = adjacency_csr(targets)
+    in_degree = np.bincount(adjacency.indices, minlength=64 * n).astype(np.float32)
+    dangling = (in_degree == 0).reshape(n, 64)
+    inverse_degree = np.divide(1.0, in_degree, out=np.zeros_like(in_degree), where=in_degree > 0)
+
+    rank = np.full((n, 64), 1.0 / 64, dtype=np.float32)
+    for _ in range(iterations):
+        shared = (damping * (rank * dangling).sum(axis=1, keepdims=True) + 1 - damping) / 64
+        rank = damping * (adjacency @ (rank.ravel() * inverse_degree)).reshape(n, 64) + shared
+    return rank * 64
+
+def capture_chains(targets: np.ndarray, starts: np.ndarray, victims: np.ndarray, max_length: int = MAX_CHAIN) -> np.ndarray:
+    """
+    Comprimento (n,) da maior sequência de capturas a -> b -> c... começando em uma casa de `starts` e
+    passando apenas por casas de `victims`, limitado a `max_length`. Cada passo expande, em todas as
+    posições ao mesmo tempo, o conjunto de casas alcançáveis pelas cadeias do passo anterior.
+    """
+    lengths = np.zeros(len(targets), dtype=np.int64)
+    frontier = np.asarray(starts, dtype=np.uint64)
+    for _ in range(max_length):
+        frontier = union_of_rows(targets, square_bits(frontier)) & victims
+        alive = frontier != 0
+        if not alive.any():
+            break
+        lengths += alive
+    return lengths
+
+def graph_features(fens, targets: np.ndarray) -> dict:
+    """
+    Calcula GRAPH_COLUMNS (brancas - pretas) para um lote de posições, a partir das FENs e dos bitboards
+    de destino (n, 64) de attack_graph. Retorna um dicionário coluna -> array (n,).
+    """
+    targets = np.asarray(targets, dtype=np.uint64)
+    planes = fen_piece_bitboards(fens)
+    occupancy = np.stack([np.bitwise_or.reduce(planes[:, :6], axis=1), np.bitwise_or.reduce(planes[:, 6:], axis=1)], axis=1)
+    kings = planes[:, KING] | planes[:, 6 + KING]
+    defended = attack_maps(planes)
+    owners = square_bits(occupancy)
+    reached = np.stack([union_of_rows(targets, owners[:, 0]), union_of_rows(targets, owners[:, 1])], axis=1)
+
+    in_degree = in_degree_by_color(targets, occupancy)
+    centrality = piece_centrality(targets)
+
+    features = {column: np.zeros(len(fens), dtype=np.int64) for column in GRAPH_COLUMNS}
+    features['centrality'] = np.zeros(len(fens))
+    for color, sign in [(0, 1), (1, -1)]:
+        enemy = 1 - color
+        threatened = reached[:, color] & occupancy[:, enemy] & ~kings
+        hanging = threatened & ~defended[:, enemy]
+        features['threatened_pieces'] += sign * popcount(threatened)
+        features['hanging_pieces'] += sign * popcount(hanging)
+        for piece, value in enumerate(PLANE_VALUES):
+            features['hanging_value'] += sign * value * popcount(hanging & planes[:, 6 * enemy + piece])
+        features['attack_chain'] += sign * capture_chains(targets, occupancy[:, color], (occupancy[:, 0] | occupancy[:, 1]) & ~kings)
+        features['square_control'] += sign * (in_degree[:, color] > in_degree[:, enemy]).sum(axis=1)
+        features['centrality'] += sign * (centrality * owners[:, color]).sum(axis=1)
+    return features
+
+def create_graph_features_table(conn):
+    # A tabela é derivada de graph_connections: a versão antiga, ligada pela FEN, é descartada e recalculada
+    existing = [row[1] for row in conn.execute('PRAGMA table_info(graph_features)')]
+    if existing and 'id' not in existing:
+        conn.execute('DROP TABLE graph_features')
+    columns = ',\n'.join([f'{column} {column_type}' for column, column_type in GRAPH_COLUMNS.items()])
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS graph_features (
+            id INTEGER PRIMARY KEY,
+            {columns}
+        )
+    ''')
+    conn.commit()
+
+def update_graph_features(conn, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Calcula as características das posições de graph_connections que ainda não estão em graph_features,
+    em blocos de `chunk_size` grafos. Retorna o número de posições acrescentadas.
+    """
+    create_graph_features_table(conn)
+    insert_sql = f'''
+        INSERT OR REPLACE INTO graph_features (id, {', '.join(GRAPH_COLUMNS)})
+        VALUES ({', '.join(['?'] * (len(GRAPH_COLUMNS) + 1))})
+    '''
+    added, last_rowid = 0, 0
+    while True:
+        rows = conn.execute('''
+            SELECT g.rowid, g.id, g.fen, g.attacks FROM graph_connections g
+            WHERE g.rowid > ? AND NOT EXISTS (SELECT 1 FROM graph_features f WHERE f.id = g.id)
+            ORDER BY g.rowid LIMIT ?
+        ''', (last_rowid, chunk_size)).fetchall()
+        if not rows:
+            return added
+        features = graph_features([row[2] for row in rows], to_numpy([row[3] for row in rows]))
+        values = [features[column].tolist() for column in GRAPH_COLUMNS]
+        conn.executemany(insert_sql, zip([row[1] for row in rows], *values))
+        conn.commit()
+        added += len(rows)
+        last_rowid = rows[-1][0]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calcula as características dos grafos de graph_connections em lote.')
+    parser.add_argument('--db', default=DB_PATH, help='banco de dados SQLite')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='grafos processados por vez')
+    parser.add_argument('--rebuild', action='store_true', help='recalcular todas as posições')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    if args.rebuild:
+        conn.execute('DROP TABLE IF EXISTS graph_features')
+    print(f'{update_graph_features(conn, args.chunk_size)} posições novas em graph_features')
+    conn.close()
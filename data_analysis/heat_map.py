@@ -1,73 +1,23 @@
+import argparse
 import sqlite3
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.linear_model import LinearRegression
 from sklearn.metrics import mean_squared_error
+from dataset import load_dataset, slice_mask, feature_matrix, heat_map_statistics
+from graph_analytics import GRAPH_COLUMNS
+from position_analyzer import BITBOARD_COLUMNS, MOBILITY_COLUMNS
 
 NUM_SQUARES = 64
 
-# Função para atualizar a lista com avaliações e contagem de avaliações
-def update_positions(df, piece_type, color, piece_positions, piece_col):
-    for index, row in df.iterrows():
-        positions = eval(row[piece_col])
-        evaluation = row['avaliacao_numerica']
-        
-        if color == 'white':
-            piece_list = positions[0]  # Primeira lista é para peças brancas
-        else:
-            piece_list = positions[1]  # Segunda lista é para peças pretas
-            
-        for pos in piece_list:
-            piece_positions[color + '_' + piece_type]['sum'][pos] += evaluation
-            piece_positions[color + '_' + piece_type]['count'][pos] += 1
-
-# Conectar ao banco de dados
-conn = sqlite3.connect('chess_analysis.db')
-
-# Ler os dados da tabela 'positions'
-query = "SELECT * FROM positions WHERE material = 0 AND total_material > 40"
-df = pd.read_sql_query(query, conn)
-
-# Fechar a conexão
-conn.close()
-
-# Verificar os dados
-print(df.head())
-
-# Criar uma nova coluna indicando a presença de xeque-mate
-df['is_mate'] = df['evaluation'].apply(lambda x: 1 if '#' in str(x) else 0)
-
-# Separar a avaliação numérica das avaliações de xeque-mate
-df['avaliacao_numerica'] = df['evaluation'].apply(lambda x: 1000 - int(x[1:]) if '#' in str(x) else float(x))
-
-# Filtrar as linhas sem xeque-mate para regressão
-df_no_mate = df[df['is_mate'] == 0]
-
-# Definir as variáveis independentes e dependente
-X = df_no_mate[['material', 'mobility', 'central_control', 'king_safety', 'connectivity']]
-y = df_no_mate['avaliacao_numerica']
-
-# Filtrar dados onde o material é zero
-df_equal_material = df_no_mate[df_no_mate['material'] == 0]
-
-# Inicializar dicionários para armazenar soma e contagem de avaliações para cada peça e posição
-piece_positions = {
-    'white_pawn': {'sum': np.zeros(NUM_SQUARES), 'count': np.zeros(NUM_SQUARES)},
-    'white_knight': {'sum': np.zeros(NUM_SQUARES), 'count': np.zeros(NUM_SQUARES)},
-    'white_bishop': {'sum': np.zeros(NUM_SQUARES), 'count': np.zeros(NUM_SQUARES)},
-    'white_rook': {'sum': np.zeros(NUM_SQUARES), 'count': np.zeros(NUM_SQUARES)},
-    'white_queen': {'sum': np.zeros(NUM_SQUARES), 'count': np.zeros(NUM_SQUARES)},
-    'white_king': {'sum': np.zeros(NUM_SQUARES), 'count': np.zeros(NUM_SQUARES)},
-    'black_pawn': {'sum': np.zeros(NUM_SQUARES), 'count': np.zeros(NUM_SQUARES)},
-    'black_knight': {'sum': np.zeros(NUM_SQUARES), 'count': np.zeros(NUM_SQUARES)},
-    'black_bishop': {'sum': np.zeros(NUM_SQUARES), 'count': np.zeros(NUM_SQUARES)},
-    'black_rook': {'sum': np.zeros(NUM_SQUARES), 'count': np.zeros(NUM_SQUARES)},
-    'black_queen': {'sum': np.zeros(NUM_SQUARES), 'count': np.zeros(NUM_SQUARES)},
-    'black_king': {'sum': np.zeros(NUM_SQUARES), 'count': np.zeros(NUM_SQUARES)},
-}
+# Planos de peças na ordem das colunas da tabela heat_map
+PIECE_PLANES = [
+    'white_pawn', 'white_knight', 'white_bishop', 'white_rook', 'white_queen', 'white_king',
+    'black_pawn', 'black_knight', 'black_bishop', 'black_rook', 'black_queen', 'black_king',
+]
 
-# Atualizar posições para cada tipo de peça
+# Colunas da tabela positions com as casas de cada tipo de peça
 piece_cols = {
     'pawn': 'pawns',
     'knight': 'knights',
@@ -77,94 +27,373 @@ piece_cols = {
     'king': 'kings'
 }
 
-for piece_type in piece_cols.keys():
-    for color in ['white', 'black']:
-        update_positions(df_equal_material, piece_type, color, piece_positions, piece_cols[piece_type])
-
-# Calcular a avaliação média para cada peça em cada posição
-piece_avg_evaluation = {}
-for piece, data in piece_positions.items():
-    # Dividir a soma pela contagem para obter a média, evitando divisão por 0
-    piece_avg_evaluation[piece] = np.zeros(NUM_SQUARES)
-    for i in range(NUM_SQUARES):
-        if data['count'][i] > 10:  # Apenas dividir se o contador for maior que zero
-            piece_avg_evaluation[piece][i] = round(data['sum'][i] / data['count'][i], 2)
-        else:
-            piece_avg_evaluation[piece][i] = None  # Evitar divisão por zero
-
-"""
-for house in range(NUM_SQUARES):  # Para cada casa no tabuleiro (de 0 a 63)
-    print(f"square {house}:")
-    for piece in piece_positions.keys():
-        avg_eval = piece_avg_evaluation[piece][house]
-        print(f"  {piece}: {avg_eval:.2f}")
-    print()
-"""
-# Conectar ao banco de dados
-conn = sqlite3.connect('chess_analysis.db')
-cursor = conn.cursor()
-
-# Criar a tabela heat_map
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS heat_map (
-        house INTEGER PRIMARY KEY,
-        white_pawn REAL,
-        white_knight REAL,
-        white_bishop REAL,
-        white_rook REAL,
-        white_queen REAL,
-        white_king REAL,
-        black_pawn REAL,
-        black_knight REAL,
-        black_bishop REAL,
-        black_rook REAL,
-        black_queen REAL,
-        black_king REAL
-    )
-''')
-
-# Inserir os dados na tabela heat_map
-for house in range(64):  # Para cada casa no tabuleiro (de 0 a 63)
+# Características usadas na regressão linear
+REGRESSION_FEATURES = ['material', 'mobility', 'central_control', 'king_safety', 'connectivity']
+
+# Mínimo de ocorrências de uma peça em uma casa para que a média seja considerada
+MIN_COUNT = 10
+
+# Recortes de posições (condições sobre a tabela positions) para os quais o mapa de calor é mantido.
+# O recorte 'default' é o que alimenta a tabela heat_map.
+HEAT_MAP_SLICES = {
+    'default': 'material = 0 AND total_material > 40',
+    'middlegame': 'material = 0 AND total_material > 20 AND total_material <= 40',
+    'endgame': 'material = 0 AND total_material <= 20',
+}
+
+# Função para separar as listas "([brancas], [pretas])" de uma coluna em arrays de linhas e casas.
+# O texto é analisado byte a byte com numpy, em blocos de linhas para limitar a memória usada.
+def parse_square_lists(column: pd.Series, block_size=100_000):
+    parsed = [([], []), ([], [])]
+    values = column.tolist()
+    for block_start in range(0, len(values), block_size):
+        text = '\n'.join(values[block_start:block_start + block_size]) + '\n'
+        chars = np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+
+        is_digit = (chars >= ord('0')) & (chars <= ord('9'))
+        rows = np.cumsum(chars == ord('\n'), dtype=np.int32)
+        # 1 dentro da lista das peças brancas, 2 dentro da lista das pretas
+        lists = np.cumsum(chars == ord('['), dtype=np.int32) - 2 * rows
+
+        previous_digit = np.concatenate(([False], is_digit[:-1]))
+        next_digit = np.concatenate((is_digit[1:], [False]))
+        starts = np.flatnonzero(is_digit & ~previous_digit)
+        digits = chars.astype(np.int64) - ord('0')
+        squares = np.where(next_digit[starts], digits[starts] * 10 + digits[starts + 1], digits[starts])
+
+        for color in [0, 1]:
+            in_list = lists[starts] == color + 1
+            parsed[color][0].append(rows[starts[in_list]] + block_start)
+            parsed[color][1].append(squares[in_list])
+
+    empty = np.zeros(0, dtype=np.int64)
+    return [(np.concatenate(rows + [empty]), np.concatenate(squares + [empty])) for rows, squares in parsed]
+
+# Função que expande as colunas de bitboards em (linha, plano, casa). Em cada plano, o bit menos
+# significativo de todos os bitboards ainda não vazios é retirado de uma vez, de modo que o trabalho é
+# proporcional ao número de peças (como nas listas de texto), e não às 768 casas de cada linha.
+def bitboard_piece_squares(df):
+    boards = df[BITBOARD_COLUMNS].to_numpy(dtype=np.int64).view(np.uint64)
+    rows, planes, squares = [], [], []
+    for plane in range(len(PIECE_PLANES)):
+        plane_rows = np.flatnonzero(boards[:, plane])
+        remaining = boards[plane_rows, plane]
+        while len(plane_rows):
+            lowest = remaining & (~remaining + np.uint64(1))
+            rows.append(plane_rows)
+            planes.append(np.full(len(plane_rows), plane))
+            # Potências de dois são exatas em float64, então log2 dá o índice da casa
+            squares.append(np.log2(lowest).astype(np.int64))
+            remaining = remaining ^ lowest
+            left = remaining != 0
+            plane_rows, remaining = plane_rows[left], remaining[left]
+    empty = np.zeros(0, dtype=np.int64)
+    return np.concatenate(rows + [empty]), np.concatenate(planes + [empty]), np.concatenate(squares + [empty])
+
+# Função para converter todas as colunas de peças em um único conjunto de (linha, plano, casa).
+# Usa as colunas de bitboards quando estão preenchidas e as listas de texto caso contrário.
+def parse_piece_squares(df):
+    if all(column in df.columns for column in BITBOARD_COLUMNS) and df[BITBOARD_COLUMNS].notna().all().all():
+        return bitboard_piece_squares(df)
+
+    rows, planes, squares = [], [], []
+    for piece_type, col in piece_cols.items():
+        white, black = parse_square_lists(df[col])
+        for color, (color_rows, color_squares) in zip(['white', 'black'], [white, black]):
+            rows.append(color_rows)
+            squares.append(color_squares)
+            planes.append(np.full(len(color_rows), PIECE_PLANES.index(color + '_' + piece_type)))
+    return np.concatenate(rows), np.concatenate(planes), np.concatenate(squares)
+
+# Função que acumula, em uma só passada, soma, contagem e soma dos quadrados das avaliações dos 12 planos de peças
+def accumulate_heat_map_stats(df):
+    rows, planes, squares = parse_piece_squares(df)
+    bins = planes * NUM_SQUARES + squares
+    evaluations = df['avaliacao_numerica'].to_numpy(dtype=np.float64)[rows]
+    size = len(PIECE_PLANES) * NUM_SQUARES
+    shape = (len(PIECE_PLANES), NUM_SQUARES)
+
+    sums = np.bincount(bins, weights=evaluations, minlength=size).reshape(shape)
+    counts = np.bincount(bins, minlength=size).reshape(shape)
+    sum_squares = np.bincount(bins, weights=evaluations ** 2, minlength=size).reshape(shape)
+    return sums, counts, sum_squares
+
+# Função que acumula soma e contagem das avaliações dos 12 planos de peças
+def accumulate_heat_map(df):
+    sums, counts, _ = accumulate_heat_map_stats(df)
+    return sums, counts
+
+# Função que calcula a avaliação média de cada peça em cada casa (NaN quando há poucas ocorrências).
+# O arredondamento usa o round do Python, como o cálculo original: np.round difere dele em alguns valores
+# terminados em 5 na terceira casa decimal.
+def average_heat_map(sums, counts, min_count=MIN_COUNT):
+    averages = np.full(sums.shape, np.nan)
+    enough = counts > min_count
+    averages[enough] = [round(value, 2) for value in (sums[enough] / counts[enough]).tolist()]
+    return averages
+
+# Função que grava as médias na tabela heat_map
+def save_heat_map(conn, averages):
+    cursor = conn.cursor()
     cursor.execute('''
-        INSERT OR REPLACE INTO heat_map (
-            house, white_pawn, white_knight, white_bishop, white_rook, white_queen, white_king,
-            black_pawn, black_knight, black_bishop, black_rook, black_queen, black_king
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        house,
-        piece_avg_evaluation['white_pawn'][house],
-        piece_avg_evaluation['white_knight'][house],
-        piece_avg_evaluation['white_bishop'][house],
-        piece_avg_evaluation['white_rook'][house],
-        piece_avg_evaluation['white_queen'][house],
-        piece_avg_evaluation['white_king'][house],
-        piece_avg_evaluation['black_pawn'][house],
-        piece_avg_evaluation['black_knight'][house],
-        piece_avg_evaluation['black_bishop'][house],
-        piece_avg_evaluation['black_rook'][house],
-        piece_avg_evaluation['black_queen'][house],
-        piece_avg_evaluation['black_king'][house]
-    ))
-
-# Fechar a conexão
-conn.commit()
-
-# Dividir os dados em treino e teste
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-# Criar o modelo de regressão linear
-model = LinearRegression()
-
-# Treinar o modelo
-model.fit(X_train, y_train)
-
-# Fazer previsões
-y_pred = model.predict(X_test)
-
-# Avaliar o modelo com erro quadrático médio
-mse = mean_squared_error(y_test, y_pred)
-print(f'Erro Quadrático Médio: {mse}')
-
-# Exibir os coeficientes da regressão
-coefficients = pd.DataFrame(model.coef_, X.columns, columns=['Coefficient'])
-print(coefficients)
+        CREATE TABLE IF NOT EXISTS heat_map (
+            house INTEGER PRIMARY KEY,
+            white_pawn REAL,
+            white_knight REAL,
+            white_bishop REAL,
+            white_rook REAL,
+            white_queen REAL,
+            white_king REAL,
+            black_pawn REAL,
+            black_knight REAL,
+            black_bishop REAL,
+            black_rook REAL,
+            black_queen REAL,
+            black_king REAL
+        )
+    ''')
+
+    for house in range(NUM_SQUARES):  # Para cada casa no tabuleiro (de 0 a 63)
+        values = [None if np.isnan(value) else float(value) for value in averages[:, house]]
+        cursor.execute('''
+            INSERT OR REPLACE INTO heat_map (
+                house, white_pawn, white_knight, white_bishop, white_rook, white_queen, white_king,
+                black_pawn, black_knight, black_bishop, black_rook, black_queen, black_king
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [house] + values)
+    conn.commit()
+
+# Função que cria as tabelas com as estatísticas acumuladas de cada recorte
+def create_stats_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS heat_map_stats (
+            slice TEXT,
+            piece TEXT,
+            house INTEGER,
+            eval_sum REAL,
+            eval_count INTEGER,
+            eval_sum_squares REAL,
+            PRIMARY KEY (slice, piece, house)
+        )
+    ''')
+    # Maior rowid da tabela positions já incorporado às estatísticas de cada recorte
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS heat_map_progress (
+            slice TEXT PRIMARY KEY,
+            last_rowid INTEGER
+        )
+    ''')
+    conn.commit()
+
+# Função que apaga as estatísticas acumuladas, forçando o recálculo completo na próxima atualização
+def reset_heat_map_stats(conn):
+    create_stats_tables(conn)
+    conn.execute('DELETE FROM heat_map_stats')
+    conn.execute('DELETE FROM heat_map_progress')
+    conn.commit()
+
+# Função que incorpora às estatísticas de cada recorte apenas as posições inseridas desde a última execução.
+# Retorna o número de posições (sem xeque-mate) acrescentadas a cada recorte.
+def update_heat_map_stats(conn, slices=HEAT_MAP_SLICES, chunk_size=200_000):
+    create_stats_tables(conn)
+    max_rowid = conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM positions').fetchone()[0]
+    added = {}
+
+    for slice_name, condition in slices.items():
+        progress = conn.execute('SELECT last_rowid FROM heat_map_progress WHERE slice = ?', (slice_name,)).fetchone()
+        last_rowid = progress[0] if progress else 0
+
+        shape = (len(PIECE_PLANES), NUM_SQUARES)
+        sums, counts, sum_squares = np.zeros(shape), np.zeros(shape, dtype=np.int64), np.zeros(shape)
+        added[slice_name] = 0
+
+        window = f'rowid > {int(last_rowid)} AND rowid <= {int(max_rowid)} AND {condition}'
+        if derived_columns_ready(conn, window, ['evaluation_value', 'is_mate', BITBOARD_COLUMNS[0]]):
+            query = f"SELECT evaluation_value, is_mate, {', '.join(BITBOARD_COLUMNS)} FROM positions WHERE {window} AND is_mate = 0"
+        else:
+            query = f'SELECT * FROM positions WHERE {window}'
+        for chunk in pd.read_sql_query(query, conn, chunksize=chunk_size):
+            chunk = add_evaluation_columns(chunk)
+            chunk = chunk[chunk['is_mate'] == 0].reset_index(drop=True)
+            chunk_sums, chunk_counts, chunk_squares = accumulate_heat_map_stats(chunk)
+            sums += chunk_sums
+            counts += chunk_counts
+            sum_squares += chunk_squares
+            added[slice_name] += len(chunk)
+
+        # Estatísticas e progresso são gravados na mesma transação
+        conn.executemany('''
+            INSERT INTO heat_map_stats (slice, piece, house, eval_sum, eval_count, eval_sum_squares)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (slice, piece, house) DO UPDATE SET
+                eval_sum = eval_sum + excluded.eval_sum,
+                eval_count = eval_count + excluded.eval_count,
+                eval_sum_squares = eval_sum_squares + excluded.eval_sum_squares
+        ''', [
+            (slice_name, piece, house, float(sums[plane, house]), int(counts[plane, house]), float(sum_squares[plane, house]))
+            for plane, piece in enumerate(PIECE_PLANES)
+            for house in range(NUM_SQUARES)
+        ])
+        conn.execute('INSERT OR REPLACE INTO heat_map_progress (slice, last_rowid) VALUES (?, ?)', (slice_name, max_rowid))
+        conn.commit()
+
+    return added
+
+# Função que lê as estatísticas acumuladas de um recorte como arrays (12, 64) de soma, contagem e soma dos quadrados
+def slice_statistics(conn, slice_name='default'):
+    shape = (len(PIECE_PLANES), NUM_SQUARES)
+    sums, counts, sum_squares = np.zeros(shape), np.zeros(shape, dtype=np.int64), np.zeros(shape)
+    rows = conn.execute(
+        'SELECT piece, house, eval_sum, eval_count, eval_sum_squares FROM heat_map_stats WHERE slice = ?', (slice_name,)
+    ).fetchall()
+    for piece, house, eval_sum, eval_count, eval_sum_squares in rows:
+        plane = PIECE_PLANES.index(piece)
+        sums[plane, house] = eval_sum
+        counts[plane, house] = eval_count
+        sum_squares[plane, house] = eval_sum_squares
+    return sums, counts, sum_squares
+
+# Função que calcula o desvio padrão das avaliações de cada peça em cada casa a partir das estatísticas
+def std_heat_map(sums, counts, sum_squares, min_count=MIN_COUNT):
+    deviations = np.full(sums.shape, np.nan)
+    enough = counts > min_count
+    means = sums[enough] / counts[enough]
+    deviations[enough] = np.sqrt(np.maximum(sum_squares[enough] / counts[enough] - means ** 2, 0))
+    return deviations
+
+# Função que verifica se as colunas derivadas pedidas existem e estão preenchidas
+# para todas as posições avaliadas que satisfazem a condição. Posições sem avaliação (de partidas
+# PGN sem [%eval]) ficam com is_mate nulo e são descartadas pelo filtro is_mate = 0 das consultas.
+def derived_columns_ready(conn, condition, required):
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(positions)')]
+    if not all(column in columns for column in required):
+        return False
+    missing = conn.execute(f'''
+        SELECT 1 FROM positions
+        WHERE ({condition}) AND evaluation IS NOT NULL AND ({' OR '.join([f'{column} IS NULL' for column in required])})
+        LIMIT 1
+    ''').fetchone()
+    return missing is None
+
+# Função que lê as características usadas na regressão para as posições sem mate do recorte 'default'.
+# As colunas de GRAPH_COLUMNS vêm da tabela graph_features (graph_analytics.py), ligada pelo id da posição.
+def load_regression_data(conn, features=REGRESSION_FEATURES):
+    condition = HEAT_MAP_SLICES['default']
+    graph = [column for column in features if column in GRAPH_COLUMNS]
+    extra = [column for column in features if column not in REGRESSION_FEATURES and column not in graph]
+    if extra and not derived_columns_ready(conn, condition, extra):
+        raise SystemExit(f"Colunas {', '.join(extra)} não preenchidas; execute backfill_positions.py antes")
+
+    source, columns = 'positions', 'positions.*'
+    if graph:
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        if 'graph_features' not in tables:
+            raise SystemExit('Tabela graph_features não encontrada; execute graph_analytics.py antes')
+        source = 'positions JOIN graph_features USING (id)'
+        columns += ''.join([f', {column}' for column in graph])
+
+    if derived_columns_ready(conn, condition, ['evaluation_value', 'is_mate']):
+        # Sem colunas extras, a consulta é atendida apenas pelo índice idx_positions_material, na mesma ordem da tabela
+        query = f'''
+            SELECT {', '.join(features)}, evaluation_value, is_mate
+            FROM {source} WHERE {condition} AND is_mate = 0 ORDER BY positions.rowid
+        '''
+    else:
+        query = f"SELECT {columns} FROM {source} WHERE {condition}"
+    df = pd.read_sql_query(query, conn)
+    df = add_evaluation_columns(df)
+    return df[df['is_mate'] == 0]
+
+# Função que cria as colunas de xeque-mate e de avaliação numérica
+def add_evaluation_columns(df):
+    # Bancos preenchidos por db.py já têm a avaliação convertida na ingestão
+    if 'evaluation_value' in df.columns and df['evaluation_value'].notna().all():
+        df['is_mate'] = df['is_mate'].astype(int)
+        df['avaliacao_numerica'] = df['evaluation_value'].astype(float)
+        return df
+
+    # Criar uma nova coluna indicando a presença de xeque-mate, descartando as posições sem avaliação
+    df = df[df['evaluation'].notna()].reset_index(drop=True)
+    df['is_mate'] = df['evaluation'].apply(lambda x: 1 if '#' in str(x) else 0)
+
+    # Separar a avaliação numérica das avaliações de xeque-mate
+    df['avaliacao_numerica'] = df['evaluation'].apply(lambda x: 1000 - int(x[1:]) if '#' in str(x) else float(x))
+    return df
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Atualiza o mapa de calor das peças e treina a regressão linear.')
+    parser.add_argument('--db', default='chess_analysis.db', help='banco de dados SQLite')
+    parser.add_argument('--rebuild', action='store_true', help='recalcular as estatísticas do mapa de calor do zero')
+    parser.add_argument('--skip-regression', action='store_true', help='apenas atualizar o mapa de calor')
+    parser.add_argument('--dataset', help='ler posições do conjunto exportado por dataset.py em vez da tabela positions')
+    parser.add_argument('--mobility-breakdown', action='store_true',
+                        help='incluir na regressão a mobilidade de cada tipo de peça')
+    parser.add_argument('--graph-features', action='store_true',
+                        help='incluir na regressão as características do grafo de ataques (graph_analytics.py)')
+    args = parser.parse_args()
+    if args.dataset and args.graph_features:
+        parser.error('--graph-features lê a tabela graph_features e não pode ser usado com --dataset')
+
+    # Conectar ao banco de dados
+    conn = sqlite3.connect(args.db)
+
+    if args.dataset:
+        # Estatísticas calculadas diretamente do conjunto em memmap, sem ler a tabela positions
+        dataset = load_dataset(args.dataset)
+        sums, counts, _ = heat_map_statistics(dataset, 'default')
+    else:
+        # Incorporar às estatísticas apenas as posições novas
+        if args.rebuild:
+            reset_heat_map_stats(conn)
+        added = update_heat_map_stats(conn)
+        for slice_name, count in added.items():
+            print(f'{slice_name}: {count} posições novas')
+        sums, counts, _ = slice_statistics(conn, 'default')
+
+    # Calcular a avaliação média para cada peça em cada posição e inserir na tabela heat_map
+    piece_avg_evaluation = average_heat_map(sums, counts)
+    save_heat_map(conn, piece_avg_evaluation)
+
+    if args.skip_regression:
+        conn.close()
+        raise SystemExit
+
+    # Ler da tabela 'positions' as linhas sem xeque-mate para regressão
+    features = REGRESSION_FEATURES + (MOBILITY_COLUMNS if args.mobility_breakdown else [])
+    features += list(GRAPH_COLUMNS) if args.graph_features else []
+    if args.dataset:
+        rows = np.flatnonzero(slice_mask(dataset, 'default') & (dataset['is_mate'] == 0))
+        df_no_mate = pd.DataFrame(feature_matrix(dataset, features, rows), columns=features)
+        df_no_mate['avaliacao_numerica'] = dataset['evaluation'][rows]
+    else:
+        df_no_mate = load_regression_data(conn, features)
+
+    # Fechar a conexão
+    conn.close()
+
+    # Verificar os dados
+    print(df_no_mate.head())
+
+    # Definir as variáveis independentes e dependente
+    X = df_no_mate[features]
+    y = df_no_mate['avaliacao_numerica']
+
+    # Dividir os dados em treino e teste
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+    # Criar o modelo de regressão linear
+    model = LinearRegression()
+
+    # Treinar o modelo
+    model.fit(X_train, y_train)
+
+    # Fazer previsões
+    y_pred = model.predict(X_test)
+
+    # Avaliar o modelo com erro quadrático médio
+    mse = mean_squared_error(y_test, y_pred)
+    print(f'Erro Quadrático Médio: {mse}')
+
+    # Exibir os coeficientes da regressão
+    coefficients = pd.DataFrame(model.coef_, X.columns, columns=['Coefficient'])
+    print(coefficients)
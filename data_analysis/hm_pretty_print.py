@@ -1,79 +1,204 @@
+import argparse
+import os
 import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from matplotlib.widgets import Button
+from matplotlib.figure import Figure
+from matplotlib.image import imsave
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.colors import LinearSegmentedColormap
+from heat_map import PIECE_PLANES, NUM_SQUARES, slice_statistics, average_heat_map
 
+# Definir peças e cores (o primeiro mapa mostra o número de cada casa)
+pieces = ['square'] + PIECE_PLANES
 
-# Conectar ao banco de dados
-conn = sqlite3.connect('chess_analysis.db')
-cursor = conn.cursor()
-
-# Consultar todos os dados da tabela heat_map
-cursor.execute("SELECT * FROM heat_map")
-data = cursor.fetchall()
-
-# Definir peças e cores
-pieces = [
-    'square', 'white_pawn', 'white_knight', 'white_bishop', 'white_rook', 'white_queen', 'white_king',
-    'black_pawn', 'black_knight', 'black_bishop', 'black_rook', 'black_queen', 'black_king'
-]
+cmap = LinearSegmentedColormap.from_list("custom_cmap", ["black", "white"])
 
 # Função para garantir que os dados são acessados e organizados corretamente no tabuleiro 8x8
-def extract_piece_data(data, col_index):
-    # Extrair valores e substituir None por 0 para evitar erros de visualização
-    piece_data = np.array([row[col_index] if row[col_index] is not None else 0 for row in data]).reshape(8, 8)
+def extract_piece_data(values):
+    # Substituir valores ausentes (None ou NaN) por 0 para evitar erros de visualização
+    piece_data = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    piece_data = np.nan_to_num(piece_data).reshape(8, 8)
     # Espelhar nos eixos X e Y
     piece_data = np.flip(piece_data, axis=(0, 1))
     return piece_data
 
-# Preparar dados das peças
-piece_data_list = [extract_piece_data(data, i) for i in range(len(pieces))]
+def map_title(piece: str, slice_name: str = None) -> str:
+    title = piece.replace('_', ' ').capitalize()
+    return f'{title} ({slice_name})' if slice_name else title
 
-# Configurações iniciais
-current_index = 0
+# Função que lê os mapas a exibir como uma lista de (recorte, peça, título, dados 8x8).
+# Sem recortes, lê a tabela heat_map; com recortes, calcula as médias a partir de heat_map_stats.
+def load_heat_maps(conn, slices=None):
+    if not slices:
+        data = conn.execute(f"SELECT house, {', '.join(PIECE_PLANES)} FROM heat_map ORDER BY house").fetchall()
+        return [(None, piece, map_title(piece), extract_piece_data([row[i] for row in data])) for i, piece in enumerate(pieces)]
 
-# Função para atualizar o mapa de calor
-cmap = LinearSegmentedColormap.from_list("custom_cmap", ["black", "white"])
-def update_heatmap(index):
-    ax.clear()
-    sns.heatmap(
-        piece_data_list[index], annot=True, fmt=".0f", cmap=cmap, center=0, cbar=False, square=True,
-        linewidths=.5, linecolor='black', annot_kws={"size": 10, "color": "#8c0112"}, ax=ax
-    )
-    
-    ax.set_xticklabels(['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h'], fontsize=10)
-    ax.set_yticklabels([8, 7, 6, 5, 4, 3, 2, 1], fontsize=10, rotation=0)
-    ax.set_title(pieces[index].replace('_', ' ').capitalize(), fontsize=12)
-    fig.canvas.draw()
-
-# Funções de callback para os botões
-def next_heatmap(event):
-    global current_index
-    current_index = (current_index + 1) % len(pieces)
-    update_heatmap(current_index)
-
-def previous_heatmap(event):
-    global current_index
-    current_index = (current_index - 1) % len(pieces)
-    update_heatmap(current_index)
-
-# Configuração da figura e do primeiro mapa de calor
-fig, ax = plt.subplots(figsize=(6, 6))
-plt.subplots_adjust(bottom=0.2)  # Ajuste para dar espaço para os botões
-
-# Botões para navegação
-axprev = plt.axes([0.1, 0.05, 0.1, 0.075])
-axnext = plt.axes([0.8, 0.05, 0.1, 0.075])
-btn_prev = Button(axprev, 'Back')
-btn_next = Button(axnext, 'Next')
-btn_prev.on_clicked(previous_heatmap)
-btn_next.on_clicked(next_heatmap)
-
-# Exibir o primeiro mapa de calor
-update_heatmap(current_index)
-plt.show()
-
-# Fechar conexão com o banco de dados
-conn.close()
+    maps = []
+    for slice_name in slices:
+        if conn.execute('SELECT 1 FROM heat_map_progress WHERE slice = ?', (slice_name,)).fetchone() is None:
+            raise SystemExit(f'recorte {slice_name} sem estatísticas; execute heat_map.py antes')
+        sums, counts, _ = slice_statistics(conn, slice_name)
+        averages = average_heat_map(sums, counts)
+        for piece, values in zip(pieces, [np.arange(NUM_SQUARES)] + list(averages)):
+            maps.append((slice_name, piece, map_title(piece, slice_name), extract_piece_data(values)))
+    return maps
+
+class HeatMapRenderer:
+    """
+    Desenha os mapas de calor em um eixo com artistas criados uma única vez: uma imagem, as linhas do
+    tabuleiro e os 64 textos. Trocar de mapa apenas atualiza os dados da imagem, a escala de cores e os
+    textos, sem recriar o gráfico. O resultado reproduz o seaborn.heatmap usado anteriormente
+    (escala centrada em 0, valores com 0 casas decimais).
+
+    Com `blit`, o fundo (eixos e rótulos das fileiras e colunas) é desenhado uma vez e guardado; cada
+    troca de mapa redesenha apenas a imagem, as linhas, os valores e o título sobre ele. O fundo é capturado novamente a cada
+    desenho completo da figura (por exemplo, quando a janela muda de tamanho).
+    """
+
+    def __init__(self, ax, blit: bool = False):
+        self.ax = ax
+        self.canvas = ax.figure.canvas
+        self.image = ax.imshow(np.zeros((8, 8)), cmap=cmap, extent=(0, 8, 8, 0), interpolation='nearest')
+        self.grid = [
+            ax.hlines(range(9), 0, 8, colors='black', linewidths=.5),
+            ax.vlines(range(9), 0, 8, colors='black', linewidths=.5),
+        ]
+        for spine in ax.spines.values():
+            spine.set_visible(False)
+
+        ax.set_xticks(np.arange(8) + .5)
+        ax.set_yticks(np.arange(8) + .5)
+        ax.set_xticklabels(['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h'], fontsize=10)
+        ax.set_yticklabels([8, 7, 6, 5, 4, 3, 2, 1], fontsize=10, rotation=0)
+        self.labels = [
+            ax.text(col + .5, row + .5, '', ha='center', va='center', size=10, color='#8c0112')
+            for row in range(8) for col in range(8)
+        ]
+        self.title = ax.set_title('', fontsize=12)
+
+        self.background = None
+        self.blit = blit
+        if blit:
+            # Artistas animados não entram no desenho completo da figura, que passa a ser só o fundo
+            for artist in self.dynamic_artists():
+                artist.set_animated(True)
+            self.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def dynamic_artists(self) -> list:
+        # As linhas ficam por cima da imagem, por isso são redesenhadas com ela
+        return [self.image, *self.grid, *self.labels, self.title]
+
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.ax.figure.bbox)
+        self.draw_dynamic()
+
+    def draw_dynamic(self):
+        for artist in self.dynamic_artists():
+            self.ax.draw_artist(artist)
+
+    def draw(self, title: str, piece_data):
+        # Mesma escala do seaborn com center=0: simétrica em torno de zero
+        vrange = np.abs(piece_data).max() or 1.0
+        self.image.set_data(piece_data)
+        self.image.set_clim(-vrange, vrange)
+        for label, value in zip(self.labels, piece_data.ravel()):
+            label.set_text(f'{value:.0f}')
+        self.title.set_text(title)
+
+        if not self.blit:
+            self.canvas.draw_idle()
+        elif self.background is None:
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self.background)
+            self.draw_dynamic()
+            self.canvas.blit(self.ax.figure.bbox)
+
+def export_maps(maps, out_dir: str, formats, dpi: int = 100) -> list:
+    """
+    Grava os mapas em `out_dir`/<recorte>/<peça>.<formato> reutilizando as mesmas figuras. Os PNGs são
+    desenhados sobre o fundo guardado e gravados direto do buffer; SVG e PDF passam por savefig.
+    Retorna os arquivos gravados.
+    """
+    raster = Figure(figsize=(6, 6), dpi=dpi)
+    FigureCanvasAgg(raster)
+    raster_renderer = HeatMapRenderer(raster.subplots(), blit=True)
+    vector = Figure(figsize=(6, 6))
+    vector_renderer = HeatMapRenderer(vector.subplots())
+
+    paths = []
+    for slice_name, piece, title, piece_data in maps:
+        directory = os.path.join(out_dir, slice_name or 'heat_map')
+        os.makedirs(directory, exist_ok=True)
+        for image_format in formats:
+            path = os.path.join(directory, f'{piece}.{image_format}')
+            if image_format == 'png':
+                raster_renderer.draw(title, piece_data)
+                imsave(path, np.asarray(raster.canvas.buffer_rgba()), dpi=dpi)
+            else:
+                vector_renderer.draw(title, piece_data)
+                vector.savefig(path)
+            paths.append(path)
+    return paths
+
+def export_all(maps, out_dir: str, formats, workers: int = None, dpi: int = 100) -> list:
+    """Distribui os mapas entre `workers` processos, cada um com sua figura, sem usar interface gráfica."""
+    workers = min(workers or os.cpu_count() or 1, len(maps))
+    if workers <= 1:
+        return export_maps(maps, out_dir, formats, dpi)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(export_maps, maps[start::workers], out_dir, formats, dpi) for start in range(workers)]
+        return [path for future in futures for path in future.result()]
+
+# Visualizador interativo: os botões apenas trocam os dados dos artistas já criados
+def show_heat_maps(maps):
+    import matplotlib.pyplot as plt
+    from matplotlib.widgets import Button
+
+    # Configuração da figura e do primeiro mapa de calor
+    fig, ax = plt.subplots(figsize=(6, 6))
+    plt.subplots_adjust(bottom=0.2)  # Ajuste para dar espaço para os botões
+    current_index = 0
+
+    # Função para atualizar o mapa de calor
+    def update_heatmap(step):
+        nonlocal current_index
+        current_index = (current_index + step) % len(maps)
+        renderer.draw(*maps[current_index][2:])
+
+    # Botões para navegação
+    axprev = plt.axes([0.1, 0.05, 0.1, 0.075])
+    axnext = plt.axes([0.8, 0.05, 0.1, 0.075])
+    btn_prev = Button(axprev, 'Back')
+    btn_next = Button(axnext, 'Next')
+    btn_prev.on_clicked(lambda event: update_heatmap(-1))
+    btn_next.on_clicked(lambda event: update_heatmap(1))
+
+    # Exibir o primeiro mapa de calor; os seguintes são desenhados sobre o fundo guardado
+    renderer = HeatMapRenderer(ax, blit=fig.canvas.supports_blit)
+    renderer.draw(*maps[current_index][2:])
+    plt.show()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exibe ou exporta os mapas de calor das peças.')
+    parser.add_argument('--db', default='chess_analysis.db', help='banco de dados SQLite')
+    parser.add_argument('--slices', nargs='+', help='recortes de heat_map_stats a exibir (padrão: a tabela heat_map)')
+    parser.add_argument('--export', metavar='DIR', help='gravar as imagens em DIR em vez de abrir a janela')
+    parser.add_argument('--format', nargs='+', default=['png'], choices=['png', 'svg', 'pdf'], help='formatos exportados')
+    parser.add_argument('--dpi', type=int, default=100, help='resolução das imagens PNG')
+    parser.add_argument('--workers', type=int, default=None, help='processos usados na exportação (padrão: um por CPU)')
+    args = parser.parse_args()
+
+    # Conectar ao banco de dados e preparar os dados de todos os mapas uma única vez
+    conn = sqlite3.connect(args.db)
+    maps = load_heat_maps(conn, args.slices)
+    conn.close()
+
+    if args.export:
+        start = time.perf_counter()
+        paths = export_all(maps, args.export, args.format, args.workers, args.dpi)
+        print(f'{len(paths)} imagens gravadas em {args.export} ({time.perf_counter() - start:.1f} s)')
+    else:
+        show_heat_maps(maps)
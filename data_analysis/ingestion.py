@@ -0,0 +1,298 @@
+import argparse
+import csv
+import functools
+import itertools
+import sqlite3
+import multiprocessing
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from bulk_writer import BulkWriter
+from position_ids import position_id, position_key, load_position_ids, contains, stored_fens
+import instrumentation
+
+CSV_FILE_PATH = 'data/chessData.csv'
+DB_PATH = 'chess_analysis.db'
+POSITIONS_ANALYZED = 200000
+
+def ingestion_arguments(description: str) -> argparse.ArgumentParser:
+    """Cria o parser com as opções comuns aos scripts de ingestão."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--csv', default=CSV_FILE_PATH, help='arquivo CSV com as colunas FEN e avaliação')
+    parser.add_argument('--db', default=DB_PATH, help='banco de dados SQLite de saída')
+    parser.add_argument('--offset', type=int, default=0, help='linhas do CSV ignoradas antes de começar')
+    parser.add_argument('--limit', type=int, default=POSITIONS_ANALYZED, help='número de posições analisadas (0 para todas)')
+    parser.add_argument('--resume', action='store_true', help='continuar a partir da última posição gravada no banco')
+    parser.add_argument('--workers', type=int, default=1, help='número de processos que analisam as posições')
+    parser.add_argument('--chunk-size', type=int, default=500, help='posições enviadas a um processo por vez')
+    parser.add_argument('--batch-size', type=int, default=5000, help='linhas gravadas por transação')
+    parser.add_argument('--cache', default=None, help='arquivo SQLite do cache de características por posição')
+    parser.add_argument('--cache-size', type=int, default=100_000, help='posições mantidas no cache em memória de cada processo')
+    return instrumentation.add_arguments(parser)
+
+def stream_fen_data(csv_path: str, offset: int = 0, limit: int = None, previous_fen: str = None):
+    """
+    Gera as linhas (FEN, avaliação) do CSV sob demanda, ignorando o cabeçalho e as primeiras
+    `offset` linhas e parando após `limit` linhas (None para ler até o fim). Se `previous_fen` for
+    informado, confere que a linha anterior a `offset` é essa posição antes de continuar.
+    """
+    with open(csv_path, 'r', newline='') as file:
+        reader = csv.reader(file)
+        next(reader)
+
+        if previous_fen is not None and offset > 0:
+            previous = next(itertools.islice(reader, offset - 1, offset), None)
+            if previous is None or previous[0] != previous_fen:
+                raise ValueError(f"A linha {offset - 1} de {csv_path} não é a última posição gravada ({previous_fen})")
+            rows = reader
+        else:
+            rows = itertools.islice(reader, offset, None)
+
+        if limit is not None:
+            rows = itertools.islice(rows, limit)
+        yield from rows
+
+def chunked(rows, size: int):
+    """Divide um iterável de linhas em blocos de até `size` elementos, sem materializá-lo."""
+    iterator = iter(rows)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def create_progress_table(conn):
+    """Cria a tabela que guarda, para cada ingestão, a próxima linha do CSV a processar."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ingestion_progress (
+            job TEXT PRIMARY KEY,
+            csv_path TEXT,
+            next_row INTEGER,
+            last_fen TEXT
+        )
+    ''')
+    conn.commit()
+
+def resume_window(args, job: str, path: str = None):
+    """
+    Calcula (offset, limit, previous_fen) da execução. Com --resume, continua da linha seguinte
+    à última posição gravada por `job` a partir do arquivo `path` (por padrão args.csv), descontando
+    do limite o que já foi processado.
+    """
+    limit = args.limit or None
+    if not args.resume:
+        return args.offset, limit, None
+
+    conn = sqlite3.connect(args.db)
+    create_progress_table(conn)
+    progress = conn.execute(
+        'SELECT next_row, last_fen FROM ingestion_progress WHERE job = ? AND csv_path = ?', (job, path or args.csv)
+    ).fetchone()
+    conn.close()
+    if progress is None:
+        return args.offset, limit, None
+
+    next_row, last_fen = progress
+    if limit is not None:
+        limit = max(limit - (next_row - args.offset), 0)
+    return next_row, limit, last_fen
+
+# Ids das posições já gravadas quando a ingestão começou (ordenados), consultados pelos processos de trabalho
+known_ids = np.empty(0, dtype=np.int64)
+
+def set_known_ids(ids: np.ndarray):
+    """Inicializador dos processos de trabalho: guarda os ids já gravados."""
+    global known_ids
+    known_ids = ids
+
+def analyze_chunk(analyze_row, chunk: list) -> list:
+    """
+    Executado nos processos de trabalho: analisa um bloco de linhas do CSV. Retorna, para cada linha,
+    (id da posição, FEN, linha analisada), com None no lugar da linha se a posição já estava gravada.
+    """
+    with instrumentation.stage('position_id'):
+        ids = [position_id(row[0]) for row in chunk]
+        present = contains(known_ids, ids)
+    instrumentation.count('ingestion/skipped', int(present.sum()))
+    results = [(pid, row[0], None if seen else analyze_row(row)) for pid, seen, row in zip(ids, present, chunk)]
+    # Funções de análise com estado (como feature_cache.CachedAnalyzer) gravam o que acumularam
+    flush = getattr(analyze_row, 'flush', None)
+    if flush is not None:
+        flush()
+    return results
+
+class PositionFilter:
+    """
+    Decide, no processo escritor, quais posições ainda precisam ser gravadas em `table`. Cada id é
+    conferido com as posições já gravadas e com as entregues ao lote ainda não gravado: o mesmo id
+    com as mesmas peças e lado a jogar é uma posição repetida, ignorada; com outras peças é uma
+    colisão do hash, relatada e também ignorada.
+    """
+
+    def __init__(self, table: str):
+        self.table = table
+        self.stored = {}
+        self.pending = {}  # id -> FEN das linhas entregues ao BulkWriter e talvez ainda não gravadas
+        self.duplicates = 0
+        self.collisions = 0
+
+    def load(self, conn, ids, unflushed):
+        """Prepara a conferência de um bloco: lê as FENs gravadas com `ids` e mantém pendentes só os ids `unflushed`."""
+        self.pending = {pid: self.pending[pid] for pid in unflushed}
+        with instrumentation.stage('sqlite/dedupe'):
+            self.stored = stored_fens(conn, self.table, ids)
+
+    def accept(self, pid: int, fen: str, row) -> bool:
+        """
+        Indica se a linha deve ser gravada. `row` None marca uma posição que os processos de trabalho já
+        sabiam gravada; `fen` None, uma posição da qual eles não calcularam a FEN (contada como repetida).
+        """
+        other = self.stored.get(pid) or self.pending.get(pid)
+        if other is not None or row is None:
+            if other is not None and fen is not None and position_key(other) != position_key(fen):
+                self.collisions += 1
+                print(f"colisão do id {pid}: {fen} e {other}", file=sys.stderr)
+            else:
+                self.duplicates += 1
+            return False
+        self.pending[pid] = fen
+        return True
+
+    def summary(self) -> str:
+        instrumentation.count('ingestion/duplicates', self.duplicates)
+        instrumentation.count('ingestion/collisions', self.collisions)
+        return f"{self.duplicates} posições já presentes ignoradas" + (f", {self.collisions} colisões de id" if self.collisions else "")
+
+def write_results(db_path: str, create_tables, insert_sql: str, table: str, batch_size: int, queue,
+                  job: str = None, csv_path: str = None, offset: int = 0, stats_queue=None) -> None:
+    """
+    Processo escritor: único dono da conexão com o banco, consome os blocos da fila em ordem e grava
+    (id, *linha) com `insert_sql`, ignorando as posições repetidas de `table` (ver PositionFilter).
+    Se `job` for informado, registra em ingestion_progress, na mesma transação de cada lote,
+    a próxima linha do CSV e a FEN da última linha consumida (gravada ou ignorada). Com a
+    instrumentação ativa, devolve suas medições por `stats_queue` ao terminar.
+    """
+    conn = sqlite3.connect(db_path)
+    create_tables(conn)
+    create_progress_table(conn)
+
+    next_row, last_fen, recorded = offset, None, offset
+    def record_progress(conn, rows=None):
+        nonlocal recorded
+        conn.execute('INSERT OR REPLACE INTO ingestion_progress (job, csv_path, next_row, last_fen) VALUES (?, ?, ?, ?)',
+                     (job, csv_path, next_row, last_fen))
+        recorded = next_row
+
+    positions = PositionFilter(table)
+    on_flush = record_progress if job is not None else None
+    with BulkWriter(conn, insert_sql, batch_size, on_flush=on_flush) as writer:
+        while True:
+            results = queue.get()
+            if results is None:
+                break
+            positions.load(conn, [pid for pid, _, _ in results], [row[0] for row in writer.buffer])
+            for pid, fen, row in results:
+                next_row += 1
+                last_fen = fen
+                if positions.accept(pid, fen, row):
+                    writer.add((pid, *row))
+
+    # Linhas ignoradas depois do último lote (ou em todo o arquivo) também contam como processadas
+    if job is not None and next_row != recorded:
+        record_progress(conn)
+        conn.commit()
+    conn.close()
+    print(f"{writer.rows} linhas gravadas ({writer.rows_per_second():.0f} linhas/s), {positions.summary()}")
+    if stats_queue is not None:
+        stats_queue.put(instrumentation.take())
+
+def run_pipeline(items, analyze, write, workers: int = 1, chunk_size: int = 500, queue_size: int = 16,
+                 job: str = None, total: int = None, initializer=None, initargs: tuple = (), count=len) -> int:
+    """
+    Esqueleto das ingestões: divide `items` em blocos de `chunk_size`, executa `analyze(bloco)` em
+    `workers` processos (preparados por `initializer(*initargs)`) e envia os resultados, na ordem
+    original, a um único processo escritor `write(fila, stats_queue=...)` através de uma fila
+    limitada. `count(resultado)` dá o número de itens de cada bloco, usado no progresso e no retorno.
+    `analyze` e `write` precisam ser serializáveis (funções do módulo ou functools.partial delas).
+    """
+    if initializer is not None:
+        initializer(*initargs)
+
+    instrumented = instrumentation.enabled
+    stats_queue = multiprocessing.SimpleQueue() if instrumented else None
+    queue = multiprocessing.Queue(maxsize=queue_size)
+    writer = multiprocessing.Process(target=write, args=(queue,), kwargs={'stats_queue': stats_queue})
+    writer.start()
+
+    def collect(result):
+        nonlocal processed
+        if instrumented:
+            # Com a instrumentação ativa cada bloco é analisado sob os perfiladores e devolve as medições do processo
+            result, snapshot = result
+            instrumentation.merge(snapshot)
+        queue.put(result)
+        processed += count(result)
+        progress.update(count(result))
+
+    processed = 0
+    progress = instrumentation.Progress(total)
+    chunks = instrumentation.timed_iter('csv', chunked(items, chunk_size))
+    try:
+        if workers <= 1:
+            for chunk in chunks:
+                collect(instrumentation.run_profiled(analyze, chunk) if instrumented else analyze(chunk))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+                # Limitar os blocos em andamento para que a memória não cresça se o escritor atrasar
+                pending = deque()
+                for chunk in chunks:
+                    if len(pending) >= 2 * workers:
+                        collect(pending.popleft().result())
+                    if instrumented:
+                        pending.append(executor.submit(instrumentation.run_profiled, analyze, chunk))
+                    else:
+                        pending.append(executor.submit(analyze, chunk))
+                while pending:
+                    collect(pending.popleft().result())
+    finally:
+        queue.put(None)
+        writer.join()
+
+    if writer.exitcode != 0:
+        raise RuntimeError(f"O processo escritor terminou com código {writer.exitcode}")
+
+    if instrumented:
+        instrumentation.merge(stats_queue.get())
+        path = instrumentation.report_path(job)
+        instrumentation.write_report(path, job, processed, progress.elapsed())
+        print(f"{progress.line()}; relatório em {path}")
+    return processed
+
+def run_ingestion(fen_data, analyze_row, create_tables, insert_sql: str, table: str, db_path: str = DB_PATH,
+                  workers: int = 1, chunk_size: int = 500, batch_size: int = 5000, queue_size: int = 16,
+                  job: str = None, csv_path: str = None, offset: int = 0, total: int = None) -> int:
+    """
+    Distribui a análise das linhas entre `workers` processos e envia os resultados, na ordem
+    original do CSV, para um único processo escritor através de uma fila limitada (ver run_pipeline).
+    O escritor grava o id da posição seguido da tupla retornada por `analyze_row` com `insert_sql` em
+    lotes de `batch_size`. Os ids já presentes em `table` são lidos no início e enviados aos processos, que
+    pulam essas posições sem analisá-las: reprocessar um CSV só calcula as posições novas.
+    `fen_data` pode ser qualquer iterável (por exemplo stream_fen_data), consumido sob demanda.
+    A saída é a mesma para qualquer número de processos. Retorna o número de linhas processadas.
+
+    Com a instrumentação ativa (instrumentation.configure ou variáveis de ambiente), mede cada etapa
+    em todos os processos, imprime o progresso periodicamente (com ETA se `total` for informado)
+    e grava ao final o relatório em JSON.
+    """
+    # Cria as tabelas aqui também para recusar bancos no formato antigo antes de iniciar os processos
+    conn = sqlite3.connect(db_path)
+    create_tables(conn)
+    ids = load_position_ids(conn, table)
+    conn.close()
+
+    write = functools.partial(write_results, db_path, create_tables, insert_sql, table, batch_size,
+                              job=job, csv_path=csv_path, offset=offset)
+    return run_pipeline(fen_data, functools.partial(analyze_chunk, analyze_row), write, workers=workers,
+                        chunk_size=chunk_size, queue_size=queue_size, job=job, total=total,
+                        initializer=set_known_ids, initargs=(ids,))
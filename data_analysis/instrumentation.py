@@ -0,0 +1,227 @@
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import nullcontext
+
+# Variáveis de ambiente que ativam a instrumentação (herdadas pelos processos de trabalho e pelo escritor)
+ENABLE_VAR = 'DATA_ANALYSIS_INSTRUMENT'
+PROFILE_VAR = 'DATA_ANALYSIS_PROFILE'  # 'cprofile', 'tracemalloc' ou ambos separados por vírgula
+REPORT_VAR = 'DATA_ANALYSIS_REPORT'
+
+PROFILERS = ['cprofile', 'tracemalloc']
+
+enabled = os.environ.get(ENABLE_VAR, '') not in ('', '0')
+profilers = set(filter(None, os.environ.get(PROFILE_VAR, '').split(',')))
+
+# Estatísticas do processo atual: segundos e chamadas por etapa, contadores livres
+timings = defaultdict(float)
+calls = defaultdict(int)
+counters = defaultdict(int)
+peak_memory = 0
+profile_stats = None
+
+def configure(instrument: bool = False, profile=None, report: str = None):
+    """
+    Ativa a instrumentação a partir das opções da linha de comando. As opções são copiadas para as
+    variáveis de ambiente para que os processos criados depois (trabalho e escritor) também as vejam.
+    """
+    global enabled, profilers
+    if profile:
+        instrument = True
+        os.environ[PROFILE_VAR] = ','.join(profile)
+        profilers = set(profile)
+    if report:
+        os.environ[REPORT_VAR] = report
+    if instrument:
+        os.environ[ENABLE_VAR] = '1'
+        enabled = True
+
+def add_arguments(parser):
+    """Acrescenta ao parser as opções de instrumentação."""
+    parser.add_argument('--instrument', action='store_true', help=f'medir o tempo de cada etapa (ou defina {ENABLE_VAR}=1)')
+    parser.add_argument('--profile', action='append', choices=PROFILERS,
+                        help=f'capturar também cProfile e/ou tracemalloc (ou defina {PROFILE_VAR})')
+    parser.add_argument('--report', help=f'arquivo JSON do relatório final (ou defina {REPORT_VAR})')
+    return parser
+
+class Stage:
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        timings[self.name] += time.perf_counter() - self.start
+        calls[self.name] += 1
+
+_disabled_stage = nullcontext()
+
+def stage(name: str):
+    """Contexto que soma o tempo do bloco à etapa `name`. Desativado, devolve um contexto vazio compartilhado."""
+    return Stage(name) if enabled else _disabled_stage
+
+def timed(name: str):
+    """Decorador que soma o tempo de cada chamada da função à etapa `name` (tempo inclusivo)."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings[name] += time.perf_counter() - start
+                calls[name] += 1
+        return wrapper
+    return decorate
+
+def timed_iter(name: str, iterable):
+    """Itera sobre `iterable` somando à etapa `name` o tempo gasto para produzir cada elemento."""
+    if not enabled:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            timings[name] += time.perf_counter() - start
+        calls[name] += 1
+        yield item
+
+def count(name: str, amount: int = 1):
+    if enabled:
+        counters[name] += amount
+
+class _CollectedStats:
+    """Adaptador para somar em um pstats.Stats as estatísticas enviadas por outro processo."""
+
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+def run_profiled(func, *args):
+    """
+    Executa func(*args) sob os perfiladores ativos. Retorna (resultado, estatísticas coletadas no processo
+    atual desde a última chamada), para que os processos de trabalho as devolvam junto com cada bloco.
+    """
+    global peak_memory
+    if 'tracemalloc' in profilers and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if 'cprofile' in profilers:
+        profiler = cProfile.Profile()
+        result = profiler.runcall(func, *args)
+        profiler.create_stats()
+        collect_profile(profiler.stats)
+    else:
+        result = func(*args)
+    if tracemalloc.is_tracing():
+        peak_memory = max(peak_memory, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    return result, take()
+
+def collect_profile(stats: dict):
+    global profile_stats
+    if profile_stats is None:
+        profile_stats = pstats.Stats(_CollectedStats(stats))
+    else:
+        profile_stats.add(_CollectedStats(stats))
+
+def take() -> dict:
+    """Retira as estatísticas acumuladas no processo atual (usado para enviá-las a outro processo)."""
+    global peak_memory, profile_stats
+    snapshot = {
+        'timings': dict(timings), 'calls': dict(calls), 'counters': dict(counters),
+        'peak_memory': peak_memory, 'profile': profile_stats.stats if profile_stats is not None else None,
+    }
+    timings.clear()
+    calls.clear()
+    counters.clear()
+    peak_memory = 0
+    profile_stats = None
+    return snapshot
+
+def merge(snapshot: dict):
+    """Soma ao processo atual as estatísticas retiradas de outro processo com take()."""
+    global peak_memory
+    for name, seconds in snapshot['timings'].items():
+        timings[name] += seconds
+    for name, amount in snapshot['calls'].items():
+        calls[name] += amount
+    for name, amount in snapshot['counters'].items():
+        counters[name] += amount
+    peak_memory = max(peak_memory, snapshot['peak_memory'])
+    if snapshot['profile']:
+        collect_profile(snapshot['profile'])
+
+class Progress:
+    """Imprime periodicamente as linhas processadas, a vazão e, se o total for conhecido, o tempo restante."""
+
+    def __init__(self, total: int = None, interval: float = 10.0, stream=sys.stderr):
+        self.total = total
+        self.interval = interval
+        self.stream = stream
+        self.rows = 0
+        self.start = time.perf_counter()
+        self.last_report = self.start
+
+    def update(self, rows: int):
+        self.rows += rows
+        now = time.perf_counter()
+        if enabled and now - self.last_report >= self.interval:
+            self.last_report = now
+            print(self.line(now), file=self.stream, flush=True)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def line(self, now: float = None) -> str:
+        elapsed = (now or time.perf_counter()) - self.start
+        rate = self.rows / elapsed if elapsed else 0.0
+        line = f'{self.rows} linhas, {rate:.0f} linhas/s'
+        if self.total and rate:
+            remaining = max(self.total - self.rows, 0) / rate
+            line += f', {self.rows / self.total:.1%}, ETA {time.strftime("%H:%M:%S", time.gmtime(remaining))}'
+        return line
+
+def write_report(path: str, job: str, rows: int, elapsed: float) -> dict:
+    """Grava o relatório final em JSON (e o perfil do cProfile ao lado, com extensão .prof) e o retorna."""
+    stages = {
+        name: {'seconds': seconds, 'calls': calls[name], 'mean_us': seconds / calls[name] * 1e6 if calls[name] else None}
+        for name, seconds in sorted(timings.items(), key=lambda item: -item[1])
+    }
+    report = {
+        'job': job,
+        'rows': rows,
+        'seconds': elapsed,
+        'rows_per_sec': rows / elapsed if elapsed else None,
+        'stages': stages,
+        'counters': dict(counters),
+        'profilers': sorted(profilers),
+    }
+    if 'tracemalloc' in profilers:
+        report['peak_traced_memory_kb'] = peak_memory / 1024
+    if profile_stats is not None:
+        profile_path = os.path.splitext(path)[0] + '.prof'
+        profile_stats.dump_stats(profile_path)
+        report['profile'] = profile_path
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2)
+    return report
+
+def report_path(job: str) -> str:
+    return os.environ.get(REPORT_VAR) or f'{job or "ingestion"}_report.json'
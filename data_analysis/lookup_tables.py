@@ -0,0 +1,196 @@
+import contextlib
+import os
+import zipfile
+import numpy as np
+import chess
+
+# Versão do formato das tabelas; o arquivo em cache também depende da versão do python-chess,
+# de onde vêm os ataques por fileira, coluna e diagonal usados na construção. As duas ficam gravadas
+# no próprio arquivo e um cache de outra versão é reconstruído.
+TABLES_VERSION = 3
+
+CACHE_VAR = 'DATA_ANALYSIS_TABLES'
+CACHE_PATH = os.environ.get(CACHE_VAR) or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '__pycache__', f'lookup_tables.v{TABLES_VERSION}.chess-{chess.__version__}.npz'
+)
+
+CENTER = chess.BB_E4 | chess.BB_D4 | chess.BB_E5 | chess.BB_D5
+
+# Tabelas dos saltadores (rei, cavalo e peões), já calculadas pelo python-chess
+KING_ATTACKS = chess.BB_KING_ATTACKS
+KNIGHT_ATTACKS = chess.BB_KNIGHT_ATTACKS
+PAWN_ATTACKS = chess.BB_PAWN_ATTACKS
+
+# Casas ao redor de cada posição possível do rei
+KING_ZONE = KING_ATTACKS
+
+BB_EDGE_FILES = chess.BB_FILE_A | chess.BB_FILE_H
+BB_EDGE_RANKS = chess.BB_RANK_1 | chess.BB_RANK_8
+
+def occupancy_subsets(mask: int):
+    """Gera todos os subconjuntos das casas de `mask` (incluindo o vazio)."""
+    subset = 0
+    while True:
+        yield subset
+        subset = (subset - mask) & mask
+        if not subset:
+            return
+
+def rook_mask(square: chess.Square) -> int:
+    """Casas cuja ocupação altera os ataques de uma torre (as bordas nunca bloqueiam nada além delas)."""
+    return (chess.BB_RANK_ATTACKS[square][0] & ~BB_EDGE_FILES | chess.BB_FILE_ATTACKS[square][0] & ~BB_EDGE_RANKS) & chess.BB_ALL
+
+def bishop_mask(square: chess.Square) -> int:
+    """Casas cuja ocupação altera os ataques de um bispo."""
+    return chess.BB_DIAG_ATTACKS[square][0] & ~(BB_EDGE_FILES | BB_EDGE_RANKS) & chess.BB_ALL
+
+def center_attack_masks(attacks: list) -> list:
+    """
+    Agrupa as casas de origem pelo número de casas centrais que uma peça nelas ataca: masks[k - 1]
+    contém as casas das quais a peça ataca exatamente k casas centrais.
+    """
+    counts = [chess.popcount(attacks[square] & CENTER) for square in chess.SQUARES]
+    masks = [0] * max(counts)
+    for square, count in enumerate(counts):
+        if count:
+            masks[count - 1] |= chess.BB_SQUARES[square]
+    return masks
+
+def sum_masks(masks) -> int:
+    union = 0
+    for mask in masks:
+        union |= mask
+    return union
+
+def build_tables() -> dict:
+    """
+    Monta as tabelas de ataques das peças deslizantes indexadas pela ocupação relevante de cada casa:
+    uma única consulta por torre ou bispo (duas por dama), em vez de uma por fileira, coluna e diagonal.
+    """
+    rook_masks = [rook_mask(square) for square in chess.SQUARES]
+    bishop_masks = [bishop_mask(square) for square in chess.SQUARES]
+    rook_attacks = [
+        {occupied: chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied] |
+                   chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied]
+         for occupied in occupancy_subsets(rook_masks[square])}
+        for square in chess.SQUARES
+    ]
+    bishop_attacks = [
+        {occupied: chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied]
+         for occupied in occupancy_subsets(bishop_masks[square])}
+        for square in chess.SQUARES
+    ]
+    center_masks = {
+        (piece_type, color): center_attack_masks(attacks)
+        for color in chess.COLORS
+        for piece_type, attacks in [(chess.PAWN, PAWN_ATTACKS[color]), (chess.KNIGHT, KNIGHT_ATTACKS), (chess.KING, KING_ATTACKS)]
+    }
+    # Para cada casa do rei, as casas de onde um cavalo, uma torre ou um bispo (com o tabuleiro vazio)
+    # alcança alguma casa ao redor dele: as demais peças nunca atacam a zona do rei
+    zone_sources = {
+        piece_type: [
+            sum_masks(attacks(zone_square) for zone_square in chess.scan_forward(KING_ZONE[square]))
+            for square in chess.SQUARES
+        ]
+        for piece_type, attacks in [
+            (chess.KNIGHT, KNIGHT_ATTACKS.__getitem__),
+            (chess.ROOK, lambda zone_square: rook_attacks[zone_square][0]),
+            (chess.BISHOP, lambda zone_square: bishop_attacks[zone_square][0]),
+        ]
+    }
+    return {
+        'rook_masks': rook_masks, 'rook_attacks': rook_attacks,
+        'bishop_masks': bishop_masks, 'bishop_attacks': bishop_attacks,
+        'center_masks': center_masks, 'zone_sources': zone_sources,
+    }
+
+# Ordem das peças em zone_sources.npy e chaves (tipo de peça, cor) de center_masks
+ZONE_PIECES = [chess.KNIGHT, chess.ROOK, chess.BISHOP]
+CENTER_KEYS = [(piece_type, color) for color in chess.COLORS for piece_type in [chess.PAWN, chess.KNIGHT, chess.KING]]
+
+def table_arrays(tables: dict) -> dict:
+    """
+    Converte as tabelas em arrays numpy para np.savez: os dicionários ocupação -> ataques de cada casa
+    viram as chaves e os valores de todas as casas concatenados, com o início de cada casa em *_offsets.
+    """
+    arrays = {'version': np.array(TABLES_VERSION), 'chess_version': np.array(chess.__version__)}
+    for piece in ['rook', 'bishop']:
+        attacks = tables[f'{piece}_attacks']
+        arrays[f'{piece}_masks'] = np.array(tables[f'{piece}_masks'], dtype=np.uint64)
+        arrays[f'{piece}_offsets'] = np.cumsum([0] + [len(table) for table in attacks])
+        arrays[f'{piece}_occupied'] = np.array([occupied for table in attacks for occupied in table], dtype=np.uint64)
+        arrays[f'{piece}_attacks'] = np.array([value for table in attacks for value in table.values()], dtype=np.uint64)
+    for piece_type, color in CENTER_KEYS:
+        arrays[f'center_{piece_type}_{int(color)}'] = np.array(tables['center_masks'][piece_type, color], dtype=np.uint64)
+    arrays['zone_sources'] = np.array([tables['zone_sources'][piece_type] for piece_type in ZONE_PIECES], dtype=np.uint64)
+    return arrays
+
+def arrays_tables(arrays) -> dict:
+    """Inverso de table_arrays, com inteiros do Python (mais rápidos que os escalares numpy nas consultas)."""
+    tables = {}
+    for piece in ['rook', 'bishop']:
+        offsets = arrays[f'{piece}_offsets'].tolist()
+        occupied, attacks = arrays[f'{piece}_occupied'].tolist(), arrays[f'{piece}_attacks'].tolist()
+        tables[f'{piece}_masks'] = arrays[f'{piece}_masks'].tolist()
+        tables[f'{piece}_attacks'] = [
+            dict(zip(occupied[start:end], attacks[start:end])) for start, end in zip(offsets, offsets[1:])
+        ]
+    tables['center_masks'] = {
+        (piece_type, color): arrays[f'center_{piece_type}_{int(color)}'].tolist() for piece_type, color in CENTER_KEYS
+    }
+    tables['zone_sources'] = dict(zip(ZONE_PIECES, arrays['zone_sources'].tolist()))
+    return tables
+
+def read_tables(path: str) -> dict:
+    """
+    Lê as tabelas gravadas por load_tables, ou retorna None se o arquivo não existir, estiver truncado ou
+    for de outra versão. O arquivo é lido sem pickle, de modo que um cache adulterado não executa código.
+    """
+    try:
+        with np.load(path, allow_pickle=False) as arrays:
+            if arrays['version'] != TABLES_VERSION or str(arrays['chess_version']) != chess.__version__:
+                return None
+            return arrays_tables(arrays)
+    except (OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+def load_tables(path: str = CACHE_PATH) -> dict:
+    """
+    Lê as tabelas do cache em disco ou, se ele não existir, estiver corrompido ou for de outra versão,
+    as constrói e tenta gravá-las (em um arquivo temporário renomeado ao final, para que outro processo
+    nunca leia um arquivo pela metade). Falhas de gravação são ignoradas: as tabelas ficam apenas em memória.
+    """
+    tables = read_tables(path)
+    if tables is not None:
+        return tables
+
+    tables = build_tables()
+    staging = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(staging, 'wb') as file:
+            np.savez(file, **table_arrays(tables))
+        os.replace(staging, path)
+    except OSError:
+        with contextlib.suppress(OSError):
+            os.remove(staging)
+    return tables
+
+_tables = load_tables()
+ROOK_MASKS = _tables['rook_masks']
+ROOK_ATTACKS = _tables['rook_attacks']
+BISHOP_MASKS = _tables['bishop_masks']
+BISHOP_ATTACKS = _tables['bishop_attacks']
+# (tipo de peça, cor) -> máscaras por número de casas centrais atacadas, ver center_attack_masks
+CENTER_ATTACK_MASKS = _tables['center_masks']
+# Tipo de peça (cavalo, torre ou bispo) -> casas de onde essa peça pode atacar a zona de um rei em cada casa
+KING_ZONE_SOURCES = _tables['zone_sources']
+
+def rook_attacks(square: chess.Square, occupied: int) -> int:
+    return ROOK_ATTACKS[square][ROOK_MASKS[square] & occupied]
+
+def bishop_attacks(square: chess.Square, occupied: int) -> int:
+    return BISHOP_ATTACKS[square][BISHOP_MASKS[square] & occupied]
+
+def queen_attacks(square: chess.Square, occupied: int) -> int:
+    return ROOK_ATTACKS[square][ROOK_MASKS[square] & occupied] | BISHOP_ATTACKS[square][BISHOP_MASKS[square] & occupied]
@@ -0,0 +1,88 @@
+import argparse
+import ast
+import sqlite3
+import chess
+from attack_graph import encode_attack_graph, decode_attack_graph, DENSE_SIZE
+from bulk_writer import BulkWriter
+from create_graph import create_attack_table, INSERT_ATTACK_SQL
+from ingestion import DB_PATH
+from position_ids import position_id
+
+def parse_square_column(text: str) -> int:
+    """Converte uma coluna no formato antigo "([[destinos]], [[origens]])" no bitboard dos destinos."""
+    attacking, _ = ast.literal_eval(text)
+    bitboard = 0
+    for to_square in attacking[0]:
+        bitboard |= chess.BB_SQUARES[to_square]
+    return bitboard
+
+def migrate(conn, batch_size: int = 5000, keep_text: bool = False) -> int:
+    """
+    Converte a tabela graph_connections do formato de texto (uma coluna por casa) para o formato
+    binário de attack_graph. Retorna o número de posições convertidas.
+    """
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(graph_connections)')]
+    if not columns or 'attacks' in columns:
+        return 0
+
+    conn.execute('ALTER TABLE graph_connections RENAME TO graph_connections_text')
+    conn.commit()
+    create_attack_table(conn)
+
+    square_columns = ', '.join([f'square_{i}' for i in range(64)])
+    last_rowid = 0
+    with BulkWriter(conn, INSERT_ATTACK_SQL, batch_size) as writer:
+        while True:
+            rows = conn.execute(f'''
+                SELECT rowid, fen, {square_columns} FROM graph_connections_text
+                WHERE rowid > ? ORDER BY rowid LIMIT ?
+            ''', (last_rowid, batch_size)).fetchall()
+            if not rows:
+                break
+            for row in rows:
+                bitboards = [parse_square_column(text) for text in row[2:]]
+                writer.add((position_id(row[1]), row[1], encode_attack_graph(bitboards)))
+            last_rowid = rows[-1][0]
+
+    if not keep_text:
+        conn.execute('DROP TABLE graph_connections_text')
+        conn.commit()
+        conn.execute('VACUUM')
+    return writer.rows
+
+def compact(conn, batch_size: int = 5000) -> int:
+    """
+    Regrava no formato compacto de attack_graph (só as casas de origem não vazias) os grafos gravados
+    com os 64 bitboards de 512 bytes. Retorna o número de grafos regravados.
+    """
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(graph_connections)')]
+    if 'attacks' not in columns:
+        return 0
+    compacted, last_rowid = 0, 0
+    while True:
+        rows = conn.execute('''
+            SELECT rowid, attacks FROM graph_connections
+            WHERE rowid > ? AND length(attacks) = ? ORDER BY rowid LIMIT ?
+        ''', (last_rowid, DENSE_SIZE, batch_size)).fetchall()
+        if not rows:
+            return compacted
+        conn.executemany('UPDATE graph_connections SET attacks = ? WHERE rowid = ?',
+                         [(encode_attack_graph(decode_attack_graph(blob)), rowid) for rowid, blob in rows])
+        conn.commit()
+        compacted += len(rows)
+        last_rowid = rows[-1][0]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Converte graph_connections do formato de texto para o formato binário compacto.')
+    parser.add_argument('--db', default=DB_PATH, help='banco de dados SQLite a converter')
+    parser.add_argument('--batch-size', type=int, default=5000, help='linhas gravadas por transação')
+    parser.add_argument('--keep-text', action='store_true', help='manter a tabela antiga como graph_connections_text')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    migrated = migrate(conn, args.batch_size, args.keep_text)
+    compacted = compact(conn, args.batch_size)
+    if compacted:
+        conn.execute('VACUUM')
+    conn.close()
+    print(f"{migrated} posições convertidas, {compacted} grafos compactados")
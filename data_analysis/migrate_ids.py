@@ -0,0 +1,99 @@
+import argparse
+import sqlite3
+import sys
+import chess
+from bulk_writer import BulkWriter
+from db import create_positions_table
+from create_graph import create_attack_table
+from ingestion import DB_PATH
+from position_ids import position_id
+
+def table_columns(conn, table: str) -> list:
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+def board_key(fen: str) -> str:
+    """Peças, lado a jogar, roques e en passant da FEN, normalizados pelo python-chess (sem os relógios)."""
+    return ' '.join(chess.Board(fen).fen().split()[:4])
+
+def migrate_table(conn, table: str, create_table, batch_size: int = 5000, keep_old: bool = False) -> tuple:
+    """
+    Converte `table` da chave FEN TEXT PRIMARY KEY para o id de position_ids. Os rowids são preservados,
+    de modo que o progresso incremental do mapa de calor e da regressão continua válido. Posições
+    repetidas (mesmo id e mesma FEN fora os relógios) mantêm a primeira linha. Uma linha com o id de
+    outra mas com FEN diferente é uma colisão do hash: ela é relatada e a tabela antiga é mantida para
+    não perdê-la. Retorna (linhas copiadas, linhas repetidas descartadas, colisões).
+    """
+    columns = table_columns(conn, table)
+    if not columns or 'id' in columns:
+        return 0, 0, 0
+
+    # A visão e os índices acompanhariam a tabela renomeada; create_table os recria sobre a tabela nova
+    old_table = f'{table}_fen'
+    if table == 'positions':
+        conn.execute('DROP VIEW IF EXISTS piece_squares')
+    conn.execute(f'ALTER TABLE {table} RENAME TO {old_table}')
+    indexes = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (old_table,)
+    ).fetchall()
+    for (index,) in indexes:
+        conn.execute(f'DROP INDEX {index}')
+    conn.commit()
+    create_table(conn)
+
+    # Colunas que a tabela antiga ainda não tinha ficam nulas (ver backfill_positions.py)
+    copied = [column for column in table_columns(conn, table) if column in columns]
+    insert_sql = f'''
+        INSERT INTO {table} (rowid, id, {', '.join(copied)}) VALUES ({', '.join(['?'] * (len(copied) + 2))})
+        ON CONFLICT (id) DO NOTHING
+    '''
+    fen_index = copied.index('fen')
+    last_rowid, read = 0, 0
+    with BulkWriter(conn, insert_sql, batch_size) as writer:
+        while True:
+            rows = conn.execute(f'''
+                SELECT rowid, {', '.join(copied)} FROM {old_table}
+                WHERE rowid > ? ORDER BY rowid LIMIT ?
+            ''', (last_rowid, batch_size)).fetchall()
+            if not rows:
+                break
+            for row in rows:
+                writer.add((row[0], position_id(row[1 + fen_index]), *row[1:]))
+            read += len(rows)
+            last_rowid = rows[-1][0]
+
+    # Linhas recusadas pelo ON CONFLICT (as únicas sem o seu rowid na tabela nova), conferidas com a linha mantida
+    collisions = 0
+    dropped = conn.execute(f'''
+        SELECT old.rowid, old.fen FROM {old_table} AS old LEFT JOIN {table} AS new ON new.rowid = old.rowid
+        WHERE new.rowid IS NULL
+    ''')
+    for rowid, fen in dropped:
+        pid = position_id(fen)
+        (other,) = conn.execute(f'SELECT fen FROM {table} WHERE id = ?', (pid,)).fetchone()
+        if board_key(other) != board_key(fen):
+            collisions += 1
+            print(f"{table}: colisão do id {pid} entre {other} e {fen} (rowid {rowid} de {old_table})", file=sys.stderr)
+
+    kept = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    if collisions and not keep_old:
+        print(f"{table}: {old_table} mantida para preservar as posições que colidiram", file=sys.stderr)
+    elif not keep_old:
+        conn.execute(f'DROP TABLE {old_table}')
+        conn.commit()
+    return kept, read - kept - collisions, collisions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Converte positions e graph_connections para a chave inteira de position_ids.')
+    parser.add_argument('--db', default=DB_PATH, help='banco de dados SQLite a converter')
+    parser.add_argument('--batch-size', type=int, default=5000, help='linhas gravadas por transação')
+    parser.add_argument('--keep-old', action='store_true', help='manter as tabelas antigas com o sufixo _fen')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    for table, create_table in [('positions', create_positions_table), ('graph_connections', create_attack_table)]:
+        kept, dropped, collisions = migrate_table(conn, table, create_table, args.batch_size, args.keep_old)
+        print(f"{table}: {kept} posições convertidas, {dropped} repetidas descartadas"
+              + (f", {collisions} colisões mantidas em {table}_fen" if collisions else ""))
+    if not args.keep_old:
+        conn.execute('VACUUM')
+    conn.close()
@@ -0,0 +1,257 @@
+import argparse
+import functools
+import io
+import itertools
+import re
+import sqlite3
+import chess
+import chess.pgn
+import numpy as np
+from attack_graph import encode_attack_graph
+from bulk_writer import BulkWriter
+from create_graph import create_attack_table, INSERT_ATTACK_SQL
+from db import create_positions_table, INSERT_POSITION_SQL, position_row
+from game_features import IncrementalPosition
+from ingestion import DB_PATH, PositionFilter, create_progress_table, resume_window, run_pipeline
+from position_ids import load_position_ids
+import instrumentation
+
+# Linha de cabeçalho ("[Tag "valor"]"); depois dos lances de uma partida, ela inicia a seguinte
+HEADER_REGEX = re.compile(r'\[[A-Za-z0-9_]+\s+"')
+
+# Ids enviados por um processo de trabalho que ele não precisa recalcular; o conjunto é esvaziado ao atingir o limite
+SENT_LIMIT = 1_000_000
+
+def split_games(lines):
+    """Agrupa as linhas de um PGN no texto de cada partida, sem interpretar os lances."""
+    game, moves = [], False
+    for line in lines:
+        if HEADER_REGEX.match(line):
+            if moves:
+                yield ''.join(game)
+                game, moves = [], False
+        elif line.strip():
+            moves = True
+        game.append(line)
+    if moves:
+        yield ''.join(game)
+
+def final_fen(text: str) -> str:
+    """FEN da última posição da linha principal de uma partida (a mesma registrada no progresso da ingestão)."""
+    game = chess.pgn.read_game(io.StringIO(text))
+    return game.end().board().fen() if game is not None else None
+
+def stream_games(pgn_path: str, offset: int = 0, limit: int = None, previous_fen: str = None):
+    """
+    Gera o texto de cada partida do PGN sob demanda, ignorando as primeiras `offset` partidas e parando após
+    `limit` partidas (None para ler até o fim); a memória usada não depende do tamanho do arquivo. Se
+    `previous_fen` for informado, confere que a partida anterior a `offset` termina nessa posição.
+    """
+    with open(pgn_path, 'r', encoding='utf-8-sig', errors='replace') as file:
+        games = split_games(file)
+        if previous_fen is not None and offset > 0:
+            previous = next(itertools.islice(games, offset - 1, offset), None)
+            if previous is None or final_fen(previous) != previous_fen:
+                raise ValueError(f"A partida {offset - 1} de {pgn_path} não termina na última posição gravada ({previous_fen})")
+        else:
+            games = itertools.islice(games, offset, None)
+
+        if limit is not None:
+            games = itertools.islice(games, limit)
+        yield from games
+
+# Ids das posições já gravadas quando a ingestão começou (ordenados) e os já enviados por este processo
+known_positions = np.empty(0, dtype=np.int64)
+known_graphs = np.empty(0, dtype=np.int64)
+sent = set()
+
+def set_known_ids(positions: np.ndarray, graphs: np.ndarray):
+    """Inicializador dos processos de trabalho: guarda os ids já gravados em positions e graph_connections."""
+    global known_positions, known_graphs, sent
+    known_positions, known_graphs, sent = positions, graphs, set()
+
+def is_known(ids: np.ndarray, pid: int) -> bool:
+    index = ids.searchsorted(pid)
+    return index < len(ids) and ids[index] == pid
+
+def evaluation_text(match) -> str:
+    """Converte um [%eval] do PGN (em peões, do ponto de vista das brancas) no formato do CSV: "+56", "-3", "#+2"."""
+    if match.group('mate'):
+        return f"#{int(match.group('mate')):+d}"
+    return f"{round(float(match.group('cp')) * 100):+d}"
+
+class GamePositions(chess.pgn.BaseVisitor):
+    """
+    Visitante de chess.pgn.read_game que percorre a linha principal de uma partida com IncrementalPosition.
+    Para cada posição ainda não gravada (inclusive a inicial), guarda o id, a FEN, as características e
+    o grafo de ataques, com None no que já está gravado, e a avaliação [%eval] do comentário do lance
+    que levou a ela (None se não houver). Variações e partidas de outras variantes são ignoradas; um
+    lance inválido encerra a partida.
+    """
+
+    def begin_game(self):
+        self.headers = {}
+        self.tracker = None
+        self.board = None
+        self.positions = []
+        self.current = None
+        self.skipped = 0
+        self.failed = False
+
+    def visit_header(self, tagname: str, tagvalue: str):
+        self.headers[tagname] = tagvalue
+
+    def end_headers(self):
+        try:
+            variant = chess.pgn.Headers(self.headers).variant()
+        except ValueError:
+            return chess.pgn.SKIP
+        return chess.pgn.SKIP if variant is not chess.Board else None
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def handle_error(self, error: Exception):
+        self.failed = True
+
+    def visit_board(self, board: chess.Board):
+        if self.failed:
+            return
+        if self.tracker is None:
+            self.tracker = IncrementalPosition(board)
+        else:
+            self.tracker.update(board)
+        self.board = board
+
+        pid = self.tracker.position_id(board)
+        new_position = not is_known(known_positions, pid)
+        new_graph = not is_known(known_graphs, pid)
+        if pid in sent or not (new_position or new_graph):
+            self.current = None
+            self.skipped += 1
+            return
+        if len(sent) >= SENT_LIMIT:
+            sent.clear()
+        sent.add(pid)
+        features, graph = self.tracker.features(board)
+        self.current = [pid, self.tracker.fen(board), features if new_position else None,
+                        encode_attack_graph(graph) if new_graph else None, None]
+        self.positions.append(self.current)
+
+    def visit_comment(self, comment: str):
+        match = chess.pgn.EVAL_REGEX.search(comment)
+        if match and self.current is not None:
+            self.current[4] = evaluation_text(match)
+
+    def result(self) -> tuple:
+        """Retorna ([(id, FEN, linha de positions ou None, grafo ou None)], posições puladas, FEN final)."""
+        rows = [
+            (pid, fen, None if features is None else position_row((fen, evaluation), features), graph)
+            for pid, fen, features, graph, evaluation in self.positions
+        ]
+        return rows, self.skipped, self.tracker.fen(self.board) if self.board is not None else None
+
+def analyze_games(texts: list) -> list:
+    """Executado nos processos de trabalho: percorre um bloco de partidas e retorna o resultado de cada uma."""
+    games = []
+    for text in texts:
+        with instrumentation.stage('pgn/game'):
+            game = chess.pgn.read_game(io.StringIO(text), Visitor=GamePositions)
+        games.append(game if game is not None else ([], 0, None))
+    instrumentation.count('ingestion/skipped', sum(skipped for _, skipped, _ in games))
+    return games
+
+def write_games(db_path: str, batch_size: int, queue, pgn_path: str = None, offset: int = 0, stats_queue=None) -> None:
+    """
+    Processo escritor da ingestão de partidas: grava as posições em positions e os grafos em
+    graph_connections, ignorando as repetidas de cada tabela (ver PositionFilter). Os grafos de cada
+    lote são gravados na mesma transação das posições, junto com o progresso em ingestion_progress
+    (a próxima partida do PGN e a FEN final da última partida consumida).
+    """
+    conn = sqlite3.connect(db_path)
+    create_positions_table(conn)
+    create_attack_table(conn)
+    create_progress_table(conn)
+
+    next_game, last_fen, recorded = offset, None, offset
+    graph_rows = []
+    graphs_written = 0
+    def write_graphs(conn, rows=None):
+        nonlocal recorded, graphs_written
+        conn.executemany(INSERT_ATTACK_SQL, graph_rows)
+        graphs_written += len(graph_rows)
+        graph_rows.clear()
+        conn.execute('INSERT OR REPLACE INTO ingestion_progress (job, csv_path, next_row, last_fen) VALUES (?, ?, ?, ?)',
+                     ('pgn', pgn_path, next_game, last_fen))
+        recorded = next_game
+
+    positions, graphs = PositionFilter('positions'), PositionFilter('graph_connections')
+    with BulkWriter(conn, INSERT_POSITION_SQL, batch_size, on_flush=write_graphs) as writer:
+        while True:
+            games = queue.get()
+            if games is None:
+                break
+            rows = [row for game_rows, _, _ in games for row in game_rows]
+            positions.load(conn, [row[0] for row in rows if row[2] is not None], [row[0] for row in writer.buffer])
+            graphs.load(conn, [row[0] for row in rows if row[3] is not None], [row[0] for row in graph_rows])
+            for game_rows, skipped, game_fen in games:
+                # Posições que os processos de trabalho pularam já estão gravadas nas duas tabelas
+                positions.duplicates += skipped
+                graphs.duplicates += skipped
+                for pid, fen, row, graph in game_rows:
+                    if positions.accept(pid, fen, row):
+                        writer.add((pid, *row))
+                    if graphs.accept(pid, fen, graph):
+                        graph_rows.append((pid, fen, graph))
+                next_game += 1
+                last_fen = game_fen
+            if len(graph_rows) >= batch_size:
+                writer.flush(force=True)
+        # Grafos e partidas consumidos depois do último lote de posições
+        if graph_rows or writer.buffer or next_game != recorded:
+            writer.flush(force=True)
+
+    conn.close()
+    print(f"{writer.rows} posições e {graphs_written} grafos gravados ({writer.rows_per_second():.0f} posições/s); "
+          f"positions: {positions.summary()}; graph_connections: {graphs.summary()}")
+    if stats_queue is not None:
+        stats_queue.put(instrumentation.take())
+
+def run_pgn_ingestion(games, db_path: str = DB_PATH, workers: int = 1, chunk_size: int = 20, batch_size: int = 5000,
+                      queue_size: int = 16, pgn_path: str = None, offset: int = 0, total: int = None) -> int:
+    """
+    Analisa as partidas (textos PGN, por exemplo de stream_games) em `workers` processos, `chunk_size`
+    partidas por vez, e grava todas as posições em positions e graph_connections pelo esqueleto de
+    ingestion.run_pipeline. Cada partida é percorrida lance a lance com IncrementalPosition em vez de
+    montar um tabuleiro por FEN, e as posições já gravadas nas duas tabelas são puladas antes de
+    calcular suas características. Retorna o número de partidas processadas.
+    """
+    # Cria as tabelas aqui também para recusar bancos no formato antigo antes de iniciar os processos
+    conn = sqlite3.connect(db_path)
+    create_positions_table(conn)
+    create_attack_table(conn)
+    ids = (load_position_ids(conn, 'positions'), load_position_ids(conn, 'graph_connections'))
+    conn.close()
+
+    write = functools.partial(write_games, db_path, batch_size, pgn_path=pgn_path, offset=offset)
+    return run_pipeline(games, analyze_games, write, workers=workers, chunk_size=chunk_size, queue_size=queue_size,
+                        job='pgn', total=total, initializer=set_known_ids, initargs=ids)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Popula positions e graph_connections com todas as posições das partidas de um PGN.')
+    parser.add_argument('--pgn', required=True, help='arquivo PGN, lido sob demanda (pode ter vários GB)')
+    parser.add_argument('--db', default=DB_PATH, help='banco de dados SQLite de saída')
+    parser.add_argument('--offset', type=int, default=0, help='partidas ignoradas antes de começar')
+    parser.add_argument('--limit', type=int, default=0, help='número de partidas analisadas (0 para todas)')
+    parser.add_argument('--resume', action='store_true', help='continuar a partir da última partida gravada no banco')
+    parser.add_argument('--workers', type=int, default=1, help='número de processos que analisam as partidas')
+    parser.add_argument('--chunk-size', type=int, default=20, help='partidas enviadas a um processo por vez')
+    parser.add_argument('--batch-size', type=int, default=5000, help='posições gravadas por transação')
+    args = instrumentation.add_arguments(parser).parse_args()
+    instrumentation.configure(args.instrument, args.profile, args.report)
+
+    offset, limit, previous_fen = resume_window(args, 'pgn', args.pgn)
+    games = stream_games(args.pgn, offset, limit, previous_fen)
+    processed = run_pgn_ingestion(games, args.db, workers=args.workers, chunk_size=args.chunk_size,
+                                  batch_size=args.batch_size, pgn_path=args.pgn, offset=offset, total=limit)
+    print(f"{processed} partidas processadas")
@@ -1,5 +1,7 @@
 import chess
 import re
+import instrumentation
+import lookup_tables
 
 def compute_material_count(board: chess.Board) -> int:
     """Calcula a diferença de valor de material no tabuleiro."""
@@ -25,60 +27,70 @@ def compute_total_material_count(board: chess.Board) -> int:
 
 def compute_mobility(board: chess.Board) -> int:
     """Calcula a mobilidade como o número total de movimentos legais disponíveis para cada cor."""
-    current_turn = board.turn
-
-    board.turn = chess.WHITE
-    white_mobility = len(list(board.legal_moves))
-
-    board.turn = chess.BLACK
-    black_mobility = len(list(board.legal_moves))
-
-    board.turn = current_turn
-
+    white_mobility = sum(count_moves(board, chess.WHITE).values())
+    black_mobility = sum(count_moves(board, chess.BLACK).values())
     return white_mobility - black_mobility
 
 
 def compute_central_control(board: chess.Board) -> int:
     """Calcula o controle central do tabuleiro (e4, d4, e5, d5) somando os ataques das peças brancas e subtraindo os ataques das pretas."""
-    central_squares = [chess.E4, chess.D4, chess.E5, chess.D5]
+    occupied = board.occupied
+    white = board.occupied_co[chess.WHITE]
     control = 0
-    
-    for square in central_squares:
-        white_attacks = len(board.attackers(chess.WHITE, square))
-        black_attacks = len(board.attackers(chess.BLACK, square))
-        control += white_attacks - black_attacks
-    
+
+    # Peões, cavalos e reis: cada máscara reúne as casas das quais a peça ataca k casas centrais
+    for (piece_type, color), masks in lookup_tables.CENTER_ATTACK_MASKS.items():
+        pieces = board.pieces_mask(piece_type, color)
+        sign = 1 if color == chess.WHITE else -1
+        for count, mask in enumerate(masks, 1):
+            control += sign * count * chess.popcount(pieces & mask)
+
+    # Peças deslizantes: os ataques a partir de cada casa central alcançam as peças que a atacam
+    rooks = board.rooks | board.queens
+    bishops = board.bishops | board.queens
+    for square in chess.scan_forward(lookup_tables.CENTER):
+        attackers = lookup_tables.rook_attacks(square, occupied) & rooks | lookup_tables.bishop_attacks(square, occupied) & bishops
+        control += chess.popcount(attackers & white) - chess.popcount(attackers & ~white)
     return control
 
 def compute_king_safety(board: chess.Board) -> int:
     """Avalia a segurança dos reis. Considera se há peças atacando as casas ao redor do rei."""
+    occupied = board.occupied
     safety = 0
     for color in [chess.WHITE, chess.BLACK]:
-        king_square = board.king(color)
-        adjacent_squares = chess.SquareSet(chess.BB_KING_ATTACKS[king_square])
-        for square in adjacent_squares:
-            if board.is_attacked_by(not color, square):
-                safety -= 1 if color == chess.WHITE else -1
+        king = board.king(color)
+        enemies = board.occupied_co[not color]
+        pawns = board.pawns & enemies
+        if color == chess.WHITE:
+            attacks = pawns >> 9 & ~chess.BB_FILE_H | pawns >> 7 & ~chess.BB_FILE_A
+        else:
+            attacks = (pawns << 7 & ~chess.BB_FILE_H | pawns << 9 & ~chess.BB_FILE_A) & chess.BB_ALL
+
+        # Apenas as peças que alcançariam a zona do rei em um tabuleiro vazio precisam ser consultadas
+        sources = lookup_tables.KING_ZONE_SOURCES
+        for square in chess.scan_forward(board.kings & enemies):
+            attacks |= lookup_tables.KING_ATTACKS[square]
+        for square in chess.scan_forward(board.knights & enemies & sources[chess.KNIGHT][king]):
+            attacks |= lookup_tables.KNIGHT_ATTACKS[square]
+        for square in chess.scan_forward((board.rooks | board.queens) & enemies & sources[chess.ROOK][king]):
+            attacks |= lookup_tables.rook_attacks(square, occupied)
+        for square in chess.scan_forward((board.bishops | board.queens) & enemies & sources[chess.BISHOP][king]):
+            attacks |= lookup_tables.bishop_attacks(square, occupied)
+
+        unsafe = chess.popcount(lookup_tables.KING_ZONE[king] & attacks)
+        safety -= unsafe if color == chess.WHITE else -unsafe
     return safety
 
 def compute_connectivity(board: chess.Board) -> int:
     """Avalia a conectividade das peças, atribuindo diferentes pontos conforme a peça que defende."""
     connectivity = 0
-    piece_values = {
-        chess.PAWN: 50,
-        chess.KNIGHT: 35,
-        chess.BISHOP: 30,
-        chess.ROOK: 10,
-        chess.QUEEN: 4,
-    }
-
     for square in chess.SQUARES:
         piece = board.piece_at(square)
         if piece:
             for defender_square in board.attackers(piece.color, square):
                 defender = board.piece_at(defender_square)
-                if defender and defender.piece_type in piece_values:
-                    value = piece_values[defender.piece_type]
+                if defender and defender.piece_type in CONNECTIVITY_VALUES:
+                    value = CONNECTIVITY_VALUES[defender.piece_type]
                     if piece.color == chess.WHITE:
                         connectivity += value
                     else:
@@ -109,6 +121,251 @@ def get_kings_position(board: chess.Board):
     """Retorna uma lista de posições dos reis brancos e outra dos reis pretos."""
     return list(board.pieces(chess.KING, chess.WHITE)), list(board.pieces(chess.KING, chess.BLACK))
 
+PIECE_VALUES = {
+    chess.PAWN: 1,
+    chess.KNIGHT: 3,
+    chess.BISHOP: 3,
+    chess.ROOK: 5,
+    chess.QUEEN: 9,
+}
+
+# Pontos de conectividade de cada peça que defende outra (usados por compute_connectivity e extract_features)
+CONNECTIVITY_VALUES = {
+    chess.PAWN: 50,
+    chess.KNIGHT: 35,
+    chess.BISHOP: 30,
+    chess.ROOK: 10,
+    chess.QUEEN: 4,
+}
+
+BB_CENTER = lookup_tables.CENTER
+
+PIECE_LIST_NAMES = {
+    chess.PAWN: 'pawns',
+    chess.KNIGHT: 'knights',
+    chess.BISHOP: 'bishops',
+    chess.ROOK: 'rooks',
+    chess.QUEEN: 'queens',
+    chess.KING: 'kings',
+}
+
+def piece_attacks(piece_type: chess.PieceType, color: chess.Color, square: chess.Square, occupied: int) -> int:
+    """Retorna o bitboard de casas atacadas por uma peça, usando as tabelas pré-calculadas de lookup_tables."""
+    if piece_type == chess.PAWN:
+        return lookup_tables.PAWN_ATTACKS[color][square]
+    if piece_type == chess.KNIGHT:
+        return lookup_tables.KNIGHT_ATTACKS[square]
+    if piece_type == chess.KING:
+        return lookup_tables.KING_ATTACKS[square]
+    if piece_type == chess.ROOK:
+        return lookup_tables.rook_attacks(square, occupied)
+    if piece_type == chess.BISHOP:
+        return lookup_tables.bishop_attacks(square, occupied)
+    return lookup_tables.queen_attacks(square, occupied)
+
+def attacked_mask(board: chess.Board, color: chess.Color) -> int:
+    """Retorna o bitboard de todas as casas atacadas pelas peças da cor indicada."""
+    occupied = board.occupied
+    pawns = board.pieces_mask(chess.PAWN, color)
+    # Ataques de todos os peões de uma vez, deslocando o bitboard na diagonal
+    if color == chess.WHITE:
+        attacks = (pawns << 7 & ~chess.BB_FILE_H | pawns << 9 & ~chess.BB_FILE_A) & chess.BB_ALL
+    else:
+        attacks = pawns >> 9 & ~chess.BB_FILE_H | pawns >> 7 & ~chess.BB_FILE_A
+    for piece_type in (chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN, chess.KING):
+        for square in chess.scan_forward(board.pieces_mask(piece_type, color)):
+            attacks |= piece_attacks(piece_type, color, square, occupied)
+    return attacks
+
+def pin_masks(board: chess.Board, color: chess.Color, king: chess.Square) -> dict:
+    """
+    Retorna {casa da peça cravada: linha rei-cravador} para as peças da cor indicada.
+    Uma peça cravada só pode se mover ao longo dessa linha.
+    """
+    occupied = board.occupied
+    snipers = ((chess.BB_RANK_ATTACKS[king][0] | chess.BB_FILE_ATTACKS[king][0]) & (board.rooks | board.queens) |
+               chess.BB_DIAG_ATTACKS[king][0] & (board.bishops | board.queens)) & board.occupied_co[not color]
+
+    pins = {}
+    for sniper in chess.scan_forward(snipers):
+        blockers = chess.between(king, sniper) & occupied
+        if blockers and chess.popcount(blockers) == 1 and blockers & board.occupied_co[color]:
+            pins[chess.lsb(blockers)] = chess.ray(king, sniper)
+    return pins
+
+def needs_move_generation(board: chess.Board, color: chess.Color, king_mask: int) -> bool:
+    """
+    Indica as posições raras em que a contagem por bitboards não se aplica e os movimentos
+    legais precisam ser gerados: rei ausente ou repetido, rei em xeque, xadrez 960, en passant
+    e peões na primeira ou última fileira.
+    """
+    if chess.popcount(king_mask) != 1 or board.chess960 or board.pawns & chess.BB_BACKRANKS:
+        return True
+    if board.is_attacked_by(not color, chess.lsb(king_mask)):
+        return True
+    ep_square = board.ep_square
+    if ep_square is not None and not board.occupied & chess.BB_SQUARES[ep_square]:
+        capturers = chess.BB_PAWN_ATTACKS[not color][ep_square] & board.pawns & board.occupied_co[color]
+        if capturers & chess.BB_RANKS[4 if color == chess.WHITE else 3]:
+            return True
+    return False
+
+def count_moves(board: chess.Board, color: chess.Color, per_square: bool = False) -> dict:
+    """
+    Conta os movimentos legais da cor indicada, como se fosse a vez dela, por tipo de peça
+    ({chess.PAWN: n, ...}) ou por casa de origem ({casa: n}) quando per_square é verdadeiro.
+    Usa apenas bitboards: não cria objetos Move nem altera o tabuleiro recebido, podendo ser
+    chamada de várias threads sobre o mesmo tabuleiro. Promoções contam uma vez por peça escolhida.
+    """
+    counts = {} if per_square else dict.fromkeys(chess.PIECE_TYPES, 0)
+    king_mask = board.kings & board.occupied_co[color]
+
+    if needs_move_generation(board, color, king_mask):
+        probe = board.copy(stack=False)
+        probe.turn = color
+        for move in probe.legal_moves:
+            key = move.from_square if per_square else probe.piece_type_at(move.from_square)
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    occupied = board.occupied
+    own = board.occupied_co[color]
+    enemies = board.occupied_co[not color]
+    king = chess.lsb(king_mask)
+    pins = pin_masks(board, color, king)
+    enemy_attacks = attacked_mask(board, not color)
+
+    def add(piece_type, square, moves):
+        if moves:
+            key = square if per_square else piece_type
+            counts[key] = counts.get(key, 0) + moves
+
+    for piece_type in (chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN):
+        for square in chess.scan_forward(board.pieces_mask(piece_type, color)):
+            targets = piece_attacks(piece_type, color, square, occupied) & ~own
+            add(piece_type, square, chess.popcount(targets & pins.get(square, chess.BB_ALL)))
+
+    forward = 8 if color == chess.WHITE else -8
+    start_rank = 1 if color == chess.WHITE else 6
+    for square in chess.scan_forward(board.pawns & own):
+        targets = chess.BB_PAWN_ATTACKS[color][square] & enemies
+        push = square + forward
+        if not occupied & chess.BB_SQUARES[push]:
+            targets |= chess.BB_SQUARES[push]
+            if chess.square_rank(square) == start_rank and not occupied & chess.BB_SQUARES[push + forward]:
+                targets |= chess.BB_SQUARES[push + forward]
+        targets &= pins.get(square, chess.BB_ALL)
+        add(chess.PAWN, square, chess.popcount(targets & ~chess.BB_BACKRANKS) + 4 * chess.popcount(targets & chess.BB_BACKRANKS))
+
+    king_moves = chess.popcount(chess.BB_KING_ATTACKS[king] & ~own & ~enemy_attacks)
+    for rook in chess.scan_forward(board.clean_castling_rights() & own & board.rooks):
+        # Roque padrão: casas entre rei e torre vazias, casas de passagem e destino do rei não atacadas
+        king_side = rook > king
+        king_to = chess.square(6 if king_side else 2, chess.square_rank(king))
+        path = chess.between(king, rook)
+        king_path = chess.between(king, king_to) | chess.BB_SQUARES[king_to]
+        if not path & occupied and not king_path & enemy_attacks:
+            king_moves += 1
+    add(chess.KING, king, king_moves)
+    return counts
+
+@instrumentation.timed('features/mobility_by_piece')
+def mobility_by_piece(board: chess.Board) -> list:
+    """Retorna, para cada tipo de peça (peão ... rei), os movimentos legais das brancas menos os das pretas."""
+    white_moves = count_moves(board, chess.WHITE)
+    black_moves = count_moves(board, chess.BLACK)
+    return [white_moves[piece_type] - black_moves[piece_type] for piece_type in chess.PIECE_TYPES]
+
+# Colunas da tabela positions com a mobilidade de cada tipo de peça, na ordem de mobility_by_piece
+MOBILITY_COLUMNS = [f'{chess.piece_name(piece_type)}_mobility' for piece_type in chess.PIECE_TYPES]
+
+@instrumentation.timed('features/extract_features')
+def extract_features(board: chess.Board) -> dict:
+    """
+    Calcula todas as características da posição em uma única passada pelos bitboards.
+    Os valores são idênticos aos das funções compute_* e get_*_position individuais.
+    """
+    occupied = board.occupied
+    piece_masks = {
+        chess.PAWN: board.pawns,
+        chess.KNIGHT: board.knights,
+        chess.BISHOP: board.bishops,
+        chess.ROOK: board.rooks,
+        chess.QUEEN: board.queens,
+        chess.KING: board.kings,
+    }
+
+    features = {name: ([], []) for name in PIECE_LIST_NAMES.values()}
+    material = 0
+    total_material = 0
+    central_control = 0
+    connectivity = 0
+    attacked_by = {chess.WHITE: 0, chess.BLACK: 0}
+
+    for color in [chess.WHITE, chess.BLACK]:
+        sign = 1 if color == chess.WHITE else -1
+        own = board.occupied_co[color]
+        lists_index = 0 if color == chess.WHITE else 1
+
+        for piece_type, mask in piece_masks.items():
+            pieces = mask & own
+            if not pieces:
+                continue
+
+            count = chess.popcount(pieces)
+            if piece_type in PIECE_VALUES:
+                material += sign * PIECE_VALUES[piece_type] * count
+                total_material += PIECE_VALUES[piece_type] * count
+
+            square_list = features[PIECE_LIST_NAMES[piece_type]][lists_index]
+            for square in chess.scan_forward(pieces):
+                square_list.append(square)
+                attacks = piece_attacks(piece_type, color, square, occupied)
+                attacked_by[color] |= attacks
+                central_control += sign * chess.popcount(attacks & BB_CENTER)
+                if piece_type in CONNECTIVITY_VALUES:
+                    # Cada peça da mesma cor atacada por esta é uma peça defendida por ela
+                    connectivity += sign * CONNECTIVITY_VALUES[piece_type] * chess.popcount(attacks & own)
+
+    king_safety = 0
+    for color in [chess.WHITE, chess.BLACK]:
+        king_square = board.king(color)
+        king_zone = lookup_tables.KING_ZONE[king_square]
+        unsafe = chess.popcount(king_zone & attacked_by[not color])
+        king_safety -= unsafe if color == chess.WHITE else -unsafe
+
+    by_piece = mobility_by_piece(board)
+    features.update({
+        'material': material,
+        'total_material': total_material,
+        'mobility': sum(by_piece),
+        'mobility_by_piece': by_piece,
+        'central_control': central_control,
+        'king_safety': king_safety,
+        'connectivity': connectivity,
+    })
+    return features
+
+# Colunas da tabela positions com o bitboard de cada peça e cor, na ordem de piece_bitboards
+BITBOARD_COLUMNS = [
+    f'{color}_{chess.piece_name(piece_type)}_bb'
+    for color in ['white', 'black']
+    for piece_type in chess.PIECE_TYPES
+]
+
+def to_signed_bitboard(bitboard: int) -> int:
+    """Converte um bitboard de 64 bits sem sinal no inteiro com sinal equivalente aceito pelo SQLite."""
+    return bitboard - (1 << 64) if bitboard >= (1 << 63) else bitboard
+
+@instrumentation.timed('features/piece_bitboards')
+def piece_bitboards(board: chess.Board) -> list:
+    """Retorna os 12 bitboards (com sinal, ver to_signed_bitboard) das peças brancas e pretas."""
+    return [
+        to_signed_bitboard(board.pieces_mask(piece_type, color))
+        for color in [chess.WHITE, chess.BLACK]
+        for piece_type in chess.PIECE_TYPES
+    ]
+
 def get_evaluation(fen_data: str) -> int:
     """Extrai a avaliação numérica de uma string FEN com avaliação no final."""
     try:
@@ -120,7 +377,22 @@ def get_evaluation(fen_data: str) -> int:
     except Exception as e:
         print(f"Erro ao processar a linha: {e}")
         return None
-    
+
+@instrumentation.timed('features/parse_evaluation')
+def parse_evaluation(evaluation) -> tuple:
+    """
+    Converte a avaliação do CSV ("+56", "-3", "#+2", ...) em (valor numérico, is_mate, mate_in).
+    Avaliações de mate valem 1000 - N, como na análise de heat_map.py; mate_in é None quando não há mate.
+    Posições sem avaliação (lances de partidas PGN sem [%eval]) resultam em (None, None, None).
+    """
+    if evaluation is None:
+        return None, None, None
+    evaluation = str(evaluation)
+    if '#' in evaluation:
+        mate_in = int(evaluation[1:])
+        return 1000 - mate_in, 1, mate_in
+    return float(evaluation), 0, None
+
 def attacking_squares(board: chess.Board, square: chess.Square) -> list:
     """
     Retorna uma lista de todas as casas que a peça na casa especificada pode atacar,
@@ -128,18 +400,12 @@ def attacking_squares(board: chess.Board, square: chess.Square) -> list:
     """
     piece = board.piece_at(square)
     if piece:
-        # Se a peça na casa for de cor oposta ao lado a jogar, inverta o turno
-        original_turn = board.turn
-        if piece.color != board.turn:
-            board.turn = piece.color  # Temporariamente ajusta o turno para a cor da peça
+        # Ajusta o turno para a cor da peça em uma cópia, sem alterar o tabuleiro recebido
+        probe = board.copy(stack=False)
+        probe.turn = piece.color
 
         # Gerar todos os movimentos válidos da peça que está na casa especificada
-        legal_moves = board.legal_moves
-        attacks = [move.to_square for move in legal_moves if move.from_square == square]
-
-        # Restaurar o turno original
-        board.turn = original_turn
-        return attacks
+        return [move.to_square for move in probe.generate_legal_moves(from_mask=chess.BB_SQUARES[square])]
     return []
 
 def attacked_squares(board: chess.Board, square: chess.Square) -> list:
@@ -148,24 +414,35 @@ def attacked_squares(board: chess.Board, square: chess.Square) -> list:
     ajustando o turno conforme a cor das peças que atacam a casa.
     """
     attackers = []
+    probe = board.copy(stack=False)
 
     for sq in chess.SQUARES:
         piece = board.piece_at(sq)
         if piece:
-            # Se a peça que pode atacar for de cor oposta ao turno, ajustar temporariamente
-            original_turn = board.turn
-            if piece.color != board.turn:
-                board.turn = piece.color  # Temporariamente ajusta o turno para a cor da peça
+            # Ajusta o turno para a cor da peça na cópia do tabuleiro
+            probe.turn = piece.color
 
             # Verificar se a peça pode atacar a casa especificada
-            legal_moves = board.legal_moves
-            if any(move.to_square == square and move.from_square == sq for move in legal_moves):
+            moves = probe.generate_legal_moves(from_mask=chess.BB_SQUARES[sq])
+            if any(move.to_square == square for move in moves):
                 attackers.append(sq)
-
-            # Restaurar o turno original
-            board.turn = original_turn
     return attackers
 
+@instrumentation.timed('graph/attack_bitboards')
+def attack_bitboards(board: chess.Board) -> list:
+    """
+    Retorna, para cada uma das 64 casas, o bitboard dos destinos dos movimentos legais da peça
+    que está nela (os mesmos destinos de attacking_squares, sem ordem nem repetições).
+    """
+    probe = board.copy(stack=False)
+    attacks = [0] * 64
+
+    for color in [chess.WHITE, chess.BLACK]:
+        probe.turn = color
+        for move in probe.legal_moves:
+            attacks[move.from_square] |= chess.BB_SQUARES[move.to_square]
+    return attacks
+
 """
 fen_data = "3r1b2/kbr2p2/1q3p2/pp5p/3N1P2/P1Pp2P1/BP1Q3P/K1RR4 b - - 1 32,+11"
 
@@ -0,0 +1,107 @@
+import functools
+import numpy as np
+import chess
+import chess.polyglot
+
+# Identificador inteiro de uma posição: o hash Zobrist de 64 bits do formato polyglot (o mesmo de
+# chess.polyglot.zobrist_hash), convertido para inteiro com sinal para caber em um INTEGER do SQLite.
+# Posições que diferem apenas nos relógios ou em um en passant sem captura legal têm o mesmo id (o
+# polyglot conta o en passant com qualquer peão vizinho, mesmo cravado; aqui vale a regra de board.fen()).
+
+RANDOM = chess.polyglot.POLYGLOT_RANDOM_ARRAY
+CASTLING_KEYS = {'K': RANDOM[768], 'Q': RANDOM[769], 'k': RANDOM[770], 'q': RANDOM[771]}
+TURN_KEY = RANDOM[780]
+
+# Valor de cada peça da FEN em cada casa: RANDOM[64 * ((tipo - 1) * 2 + cor) + casa], com preto = 0
+PIECE_KEYS = {
+    symbol: [RANDOM[64 * ((chess.PIECE_SYMBOLS.index(symbol.lower()) - 1) * 2 + symbol.isupper()) + square]
+             for square in chess.SQUARES]
+    for symbol in 'PNBRQKpnbrqk'
+}
+
+# Casas de cada roque que precisam estar ocupadas (rei e torre) para o python-chess manter o direito
+CASTLING_PIECES = {'K': (0, 'K', 'R', 4, 7), 'Q': (0, 'K', 'R', 4, 0), 'k': (7, 'k', 'r', 4, 7), 'q': (7, 'k', 'r', 4, 0)}
+
+def expand_rank(text: str) -> str:
+    """Expande uma fileira da FEN em 8 caracteres, com '.' nas casas vazias."""
+    return ''.join('.' * int(char) if char.isdigit() else char for char in text)
+
+@functools.lru_cache(maxsize=1 << 16)
+def rank_hash(rank: int, text: str) -> int:
+    """XOR das chaves das peças de uma fileira da FEN; as fileiras se repetem muito entre posições."""
+    value = 0
+    for file, char in enumerate(expand_rank(text)):
+        if char != '.':
+            value ^= PIECE_KEYS[char][8 * rank + file]
+    return value
+
+def position_id(fen: str) -> int:
+    """
+    Calcula o id da posição diretamente do texto da FEN, em geral sem montar um chess.Board. O resultado é
+    igual a chess.polyglot.zobrist_hash(chess.Board(chess.Board(fen).fen())) (com sinal) para qualquer FEN
+    válida, e portanto ao id de IncrementalPosition para a mesma posição de uma partida.
+    """
+    placement, turn, castling, ep = fen.split()[:4]
+    # Roques em Shredder-FEN ou X-FEN (por exemplo "HAha") são convertidos pelo python-chess para "KQkq"
+    if castling.strip('KQkq-'):
+        return position_id(chess.Board(fen).fen())
+    ranks = placement.split('/')
+    value = 0
+    for index, text in enumerate(ranks):
+        value ^= rank_hash(7 - index, text)
+
+    # Direitos de roque sem o rei e a torre nas casas iniciais são descartados, como em Board.clean_castling_rights
+    if castling != '-':
+        for right in castling:
+            rank, king, rook, king_file, rook_file = CASTLING_PIECES[right]
+            row = expand_rank(ranks[7 - rank])
+            if row[king_file] == king and row[rook_file] == rook:
+                value ^= CASTLING_KEYS[right]
+
+    # O en passant só entra no hash se a captura for legal, como em board.fen() e game_features.legal_ep_square;
+    # sem um peão do lado a jogar ao lado do peão que avançou não há captura, e o tabuleiro nem é montado
+    if ep != '-':
+        file = ord(ep[0]) - ord('a')
+        pawn, row = ('P', expand_rank(ranks[3])) if turn == 'w' else ('p', expand_rank(ranks[4]))
+        if ((file > 0 and row[file - 1] == pawn) or (file < 7 and row[file + 1] == pawn)) \
+                and chess.Board(fen).has_legal_en_passant():
+            value ^= RANDOM[772 + file]
+
+    if turn == 'w':
+        value ^= TURN_KEY
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def position_key(fen: str) -> str:
+    """
+    Parte da FEN comparada na verificação de colisões (peças e lado a jogar): duas FENs com o mesmo id e
+    chaves diferentes são posições distintas que colidiram no hash.
+    """
+    return ' '.join(fen.split()[:2])
+
+def load_position_ids(conn, table: str) -> np.ndarray:
+    """Lê os ids já gravados em `table` como um array int64 ordenado (vazio se a tabela não existe)."""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    if exists is None:
+        return np.empty(0, dtype=np.int64)
+    ids = np.fromiter((row[0] for row in conn.execute(f'SELECT id FROM {table}')), dtype=np.int64)
+    ids.sort()
+    return ids
+
+def contains(known: np.ndarray, ids) -> np.ndarray:
+    """Indica, para cada id, se ele está no array ordenado `known` (busca binária vetorizada)."""
+    ids = np.asarray(ids, dtype=np.int64)
+    if not len(known):
+        return np.zeros(len(ids), dtype=bool)
+    found = np.minimum(np.searchsorted(known, ids), len(known) - 1)
+    return known[found] == ids
+
+def stored_fens(conn, table: str, ids, group_size: int = 500) -> dict:
+    """Retorna {id: fen} das posições de `table` com os ids informados."""
+    ids = list(ids)
+    stored = {}
+    for start in range(0, len(ids), group_size):
+        group = ids[start:start + group_size]
+        stored.update(conn.execute(
+            f"SELECT id, fen FROM {table} WHERE id IN ({', '.join(['?'] * len(group))})", group
+        ).fetchall())
+    return stored
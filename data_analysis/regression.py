@@ -0,0 +1,243 @@
+import argparse
+import pickle
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from heat_map import (HEAT_MAP_SLICES, REGRESSION_FEATURES, MOBILITY_COLUMNS, PIECE_PLANES, BITBOARD_COLUMNS,
+                      NUM_SQUARES, derived_columns_ready)
+from dataset import load_dataset, slice_mask, feature_matrix, unpack_bitboards
+
+# Uma característica por peça e casa (1 quando a peça está na casa), na ordem dos planos de unpack_bitboards
+PIECE_SQUARE_COLUMNS = [f'{plane}_{square}' for plane in PIECE_PLANES for square in range(NUM_SQUARES)]
+
+# Fração das posições reservada para teste, escolhidas por um hash do rowid (mesma divisão em qualquer ordem de leitura)
+TEST_FRACTION = 0.2
+
+class RegressionStats:
+    """
+    Estatísticas suficientes da regressão linear com intercepto: contagem, médias e co-momentos
+    centrados de X e y. Blocos e fragmentos processados em paralelo são combinados com as fórmulas
+    de Chan et al., que evitam o cancelamento numérico de acumular XᵀX e Xᵀy brutos.
+    """
+
+    def __init__(self, columns: list):
+        self.columns = list(columns)
+        size = len(self.columns)
+        self.count = 0
+        self.mean_x = np.zeros(size)
+        self.mean_y = 0.0
+        self.cxx = np.zeros((size, size))
+        self.cxy = np.zeros(size)
+        self.cyy = 0.0
+
+    def add_moments(self, count, mean_x, mean_y, cxx, cxy, cyy):
+        if count == 0:
+            return self
+        total = self.count + count
+        delta_x = mean_x - self.mean_x
+        delta_y = mean_y - self.mean_y
+        weight = self.count * count / total
+        self.cxx += cxx + weight * np.outer(delta_x, delta_x)
+        self.cxy += cxy + weight * delta_x * delta_y
+        self.cyy += cyy + weight * delta_y * delta_y
+        self.mean_x += delta_x * count / total
+        self.mean_y += delta_y * count / total
+        self.count = total
+        return self
+
+    def update(self, X, y):
+        """Incorpora um bloco de linhas (X com uma coluna por característica, y com as avaliações)."""
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if not len(y):
+            return self
+        mean_x = X.mean(axis=0)
+        mean_y = y.mean()
+        centered_x = X - mean_x
+        centered_y = y - mean_y
+        return self.add_moments(len(y), mean_x, mean_y, centered_x.T @ centered_x,
+                                centered_x.T @ centered_y, centered_y @ centered_y)
+
+    def merge(self, other: 'RegressionStats'):
+        """Soma as estatísticas de outro bloco ou fragmento com as mesmas colunas."""
+        if other.columns != self.columns:
+            raise ValueError('estatísticas de regressão com colunas diferentes')
+        return self.add_moments(other.count, other.mean_x, other.mean_y, other.cxx, other.cxy, other.cyy)
+
+    def to_dict(self) -> dict:
+        """Estado serializável (sem referência à classe, que pode ter sido definida em __main__)."""
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'RegressionStats':
+        stats = cls(state['columns'])
+        vars(stats).update(state)
+        return stats
+
+    def solve(self):
+        """
+        Retorna (intercepto, coeficientes) de mínimos quadrados. Como o LinearRegression do sklearn,
+        resolve o problema centrado e, se as colunas forem linearmente dependentes, devolve a solução de menor norma.
+        """
+        coef = np.linalg.lstsq(self.cxx, self.cxy, rcond=None)[0]
+        return self.mean_y - self.mean_x @ coef, coef
+
+    def mean_squared_error(self, intercept, coef) -> float:
+        """Erro quadrático médio do modelo sobre as linhas acumuladas, sem precisar relê-las."""
+        offset = self.mean_y - intercept - self.mean_x @ coef
+        squared_error = self.cyy - 2 * coef @ self.cxy + coef @ self.cxx @ coef + self.count * offset ** 2
+        return max(squared_error, 0.0) / self.count
+
+def regression_columns(mobility_breakdown: bool = False, piece_squares: bool = False) -> list:
+    """Colunas de X: as características de heat_map.py e, opcionalmente, mobilidade por peça e peça-casa."""
+    return (REGRESSION_FEATURES + (MOBILITY_COLUMNS if mobility_breakdown else [])
+            + (PIECE_SQUARE_COLUMNS if piece_squares else []))
+
+def is_test_row(rowids: np.ndarray) -> np.ndarray:
+    """Indica as linhas de teste a partir do rowid, com um hash multiplicativo para espalhá-las pela tabela."""
+    hashed = (np.asarray(rowids).astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(40)
+    return hashed % np.uint64(1000) < np.uint64(round(TEST_FRACTION * 1000))
+
+def feature_block(frame: np.ndarray, boards, piece_squares: bool) -> np.ndarray:
+    X = frame.astype(np.float64)
+    if piece_squares:
+        X = np.hstack([X, unpack_bitboards(boards).reshape(len(X), -1)])
+    return X
+
+def sqlite_chunks(conn, columns: list, condition: str, first_rowid: int, last_rowid: int, chunk_size: int):
+    """Lê as posições sem mate com first_rowid < rowid <= last_rowid em blocos (rowids, X, y), em ordem de rowid."""
+    base = [column for column in columns if column not in PIECE_SQUARE_COLUMNS]
+    piece_squares = len(base) < len(columns)
+    select = ['rowid'] + base + ['evaluation_value'] + (BITBOARD_COLUMNS if piece_squares else [])
+    while True:
+        chunk = pd.read_sql_query(f'''
+            SELECT {', '.join(select)} FROM positions
+            WHERE rowid > ? AND rowid <= ? AND ({condition}) AND is_mate = 0
+            ORDER BY rowid LIMIT ?
+        ''', conn, params=(first_rowid, last_rowid, chunk_size))
+        if chunk.empty:
+            return
+        boards = chunk[BITBOARD_COLUMNS].to_numpy(dtype=np.int64) if piece_squares else None
+        yield chunk['rowid'].to_numpy(), feature_block(chunk[base].to_numpy(), boards, piece_squares), chunk['evaluation_value'].to_numpy()
+        first_rowid = int(chunk['rowid'].iloc[-1])
+
+def dataset_chunks(dataset: dict, columns: list, slice_name: str, chunk_size: int):
+    """Lê as posições sem mate de um recorte do conjunto em memmap em blocos (rowids, X, y)."""
+    base = [column for column in columns if column not in PIECE_SQUARE_COLUMNS]
+    piece_squares = len(base) < len(columns)
+    selected = np.flatnonzero(slice_mask(dataset, slice_name) & (dataset['is_mate'] == 0))
+    for start in range(0, len(selected), chunk_size):
+        rows = selected[start:start + chunk_size]
+        boards = dataset['bitboards'][rows] if piece_squares else None
+        yield dataset['rowid'][rows], feature_block(feature_matrix(dataset, base, rows), boards, piece_squares), dataset['evaluation'][rows]
+
+def accumulate(chunks, columns: list):
+    """Acumula os blocos em estatísticas separadas de treino e de teste."""
+    train, test = RegressionStats(columns), RegressionStats(columns)
+    for rowids, X, y in chunks:
+        in_test = is_test_row(rowids)
+        train.update(X[~in_test], y[~in_test])
+        test.update(X[in_test], y[in_test])
+    return train, test
+
+def accumulate_rowid_range(db_path: str, columns: list, condition: str, first_rowid: int, last_rowid: int, chunk_size: int):
+    """Executada nos processos de trabalho: cada fragmento abre sua própria conexão."""
+    conn = sqlite3.connect(db_path)
+    stats = accumulate(sqlite_chunks(conn, columns, condition, first_rowid, last_rowid, chunk_size), columns)
+    conn.close()
+    return stats
+
+def train_sqlite(db_path: str, columns: list, condition: str, first_rowid: int, last_rowid: int,
+                 workers: int = 1, chunk_size: int = 50_000):
+    """Acumula as posições first_rowid < rowid <= last_rowid dividindo o intervalo de rowids entre os processos."""
+    if workers <= 1:
+        return accumulate_rowid_range(db_path, columns, condition, first_rowid, last_rowid, chunk_size)
+
+    bounds = np.linspace(first_rowid, last_rowid, workers * 4 + 1).astype(int)
+    train, test = RegressionStats(columns), RegressionStats(columns)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(accumulate_rowid_range, db_path, columns, condition, int(low), int(high), chunk_size)
+            for low, high in zip(bounds[:-1], bounds[1:])
+        ]
+        for future in futures:
+            shard_train, shard_test = future.result()
+            train.merge(shard_train)
+            test.merge(shard_test)
+    return train, test
+
+# Função que cria a tabela com as estatísticas acumuladas de cada modelo
+def create_regression_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS regression_stats (
+            model TEXT PRIMARY KEY,
+            last_rowid INTEGER,
+            train BLOB,
+            test BLOB
+        )
+    ''')
+    conn.commit()
+
+def update_regression(db_path: str, model: str, columns: list, condition: str, workers: int = 1,
+                      chunk_size: int = 50_000, rebuild: bool = False):
+    """
+    Incorpora às estatísticas salvas do modelo apenas as posições inseridas desde a última execução
+    e retorna (treino, teste, posições acrescentadas).
+    """
+    conn = sqlite3.connect(db_path)
+    create_regression_table(conn)
+    base = [column for column in columns if column not in PIECE_SQUARE_COLUMNS]
+    required = ['evaluation_value', 'is_mate'] + base + (BITBOARD_COLUMNS if len(base) < len(columns) else [])
+    if not derived_columns_ready(conn, condition, required):
+        conn.close()
+        raise SystemExit('colunas derivadas não preenchidas; execute backfill_positions.py antes')
+
+    if rebuild:
+        conn.execute('DELETE FROM regression_stats WHERE model = ?', (model,))
+    saved = conn.execute('SELECT last_rowid, train, test FROM regression_stats WHERE model = ?', (model,)).fetchone()
+    if saved is None:
+        last_rowid, train, test = 0, RegressionStats(columns), RegressionStats(columns)
+    else:
+        last_rowid, train, test = saved[0], RegressionStats.from_dict(pickle.loads(saved[1])), RegressionStats.from_dict(pickle.loads(saved[2]))
+        if train.columns != columns:
+            conn.close()
+            raise SystemExit(f'o modelo {model} foi treinado com outras colunas; use --rebuild')
+    max_rowid = conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM positions').fetchone()[0]
+
+    new_train, new_test = train_sqlite(db_path, columns, condition, last_rowid, max_rowid, workers, chunk_size)
+    train.merge(new_train)
+    test.merge(new_test)
+
+    conn.execute('INSERT OR REPLACE INTO regression_stats (model, last_rowid, train, test) VALUES (?, ?, ?, ?)',
+                 (model, max_rowid, pickle.dumps(train.to_dict()), pickle.dumps(test.to_dict())))
+    conn.commit()
+    conn.close()
+    return train, test, new_train.count + new_test.count
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Treina a regressão linear da avaliação em blocos, sem carregar as posições na memória.')
+    parser.add_argument('--db', default='chess_analysis.db', help='banco de dados SQLite')
+    parser.add_argument('--dataset', help='ler do conjunto exportado por dataset.py (sempre do zero)')
+    parser.add_argument('--slice', default='default', choices=list(HEAT_MAP_SLICES), help='recorte de posições')
+    parser.add_argument('--mobility-breakdown', action='store_true', help='incluir a mobilidade de cada tipo de peça')
+    parser.add_argument('--piece-squares', action='store_true', help='incluir uma característica por peça e casa')
+    parser.add_argument('--workers', type=int, default=1, help='processos lendo fragmentos do banco em paralelo')
+    parser.add_argument('--chunk-size', type=int, default=50_000, help='linhas por bloco')
+    parser.add_argument('--rebuild', action='store_true', help='descartar as estatísticas salvas do modelo')
+    args = parser.parse_args()
+
+    columns = regression_columns(args.mobility_breakdown, args.piece_squares)
+    if args.dataset:
+        train, test = accumulate(dataset_chunks(load_dataset(args.dataset), columns, args.slice, args.chunk_size), columns)
+    else:
+        model = args.slice + ('+mobility' if args.mobility_breakdown else '') + ('+squares' if args.piece_squares else '')
+        train, test, added = update_regression(args.db, model, columns, HEAT_MAP_SLICES[args.slice],
+                                               args.workers, args.chunk_size, args.rebuild)
+        print(f'{model}: {added} posições novas, {train.count} de treino e {test.count} de teste')
+
+    intercept, coef = train.solve()
+    if test.count:
+        print(f'Erro Quadrático Médio: {test.mean_squared_error(intercept, coef)}')
+    print(f'Intercepto: {intercept}')
+    print(pd.DataFrame(coef, columns, columns=['Coefficient']).head(len(REGRESSION_FEATURES) + len(MOBILITY_COLUMNS)))
@@ -0,0 +1,369 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import stat
+import sys
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+import chess
+import numpy as np
+from evaluator import PositionEvaluator, board_arrays
+from dataset import FEATURE_COLUMNS
+from position_ids import position_id
+
+# Latências guardadas para os percentis (as mais recentes)
+LATENCY_WINDOW = 100_000
+
+def analyze_fens(fens) -> tuple:
+    """
+    Executada nos processos de trabalho: retorna (características (n, k) na ordem de FEATURE_COLUMNS,
+    bitboards (n, 12), erros), com a mensagem de erro das FENs inválidas e linhas zeradas para elas.
+    """
+    boards, valid, errors = [], [], [None] * len(fens)
+    for row, fen in enumerate(fens):
+        try:
+            board = chess.Board(fen=fen)
+        except ValueError as error:
+            errors[row] = str(error)
+            continue
+        if not board.is_valid():
+            errors[row] = 'posição inválida'
+            continue
+        boards.append(board)
+        valid.append(row)
+    X = np.zeros((len(fens), len(FEATURE_COLUMNS)), dtype=np.int64)
+    bitboards = np.zeros((len(fens), 12), dtype=np.int64)
+    X[valid], bitboards[valid] = board_arrays(FEATURE_COLUMNS, boards)
+    return X, bitboards, errors
+
+REQUEST_ERROR = 'a requisição deve ser um objeto com uma lista "fens" de FENs'
+
+def request_fens(request) -> list:
+    """Lista "fens" de uma requisição já decodificada, ou None se ela não for um objeto com uma lista de textos."""
+    fens = request.get('fens') if isinstance(request, dict) else None
+    if not isinstance(fens, list) or not all(isinstance(fen, str) for fen in fens):
+        return None
+    return fens
+
+def warm_up():
+    """Inicializador dos processos de trabalho: carrega as tabelas de ataque antes da primeira requisição."""
+    analyze_fens([chess.STARTING_FEN])
+
+class LatencyStats:
+    """Latências das requisições recentes e contadores acumulados desde o início do serviço."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.positions = 0
+        self.cache_hits = 0
+        self.errors = 0
+        self.start = time.perf_counter()
+
+    def record(self, seconds: float, positions: int, cache_hits: int, errors: int):
+        self.latencies.append(seconds)
+        self.requests += 1
+        self.positions += positions
+        self.cache_hits += cache_hits
+        self.errors += errors
+
+    def summary(self) -> dict:
+        elapsed = time.perf_counter() - self.start
+        summary = {
+            'requests': self.requests,
+            'positions': self.positions,
+            'cache_hits': self.cache_hits,
+            'errors': self.errors,
+            'seconds': elapsed,
+            'positions_per_sec': self.positions / elapsed if elapsed else None,
+        }
+        if self.latencies:
+            latencies_ms = np.asarray(self.latencies) * 1000
+            for percentile in (50, 90, 99):
+                summary[f'p{percentile}_ms'] = float(np.percentile(latencies_ms, percentile))
+            summary['max_ms'] = float(latencies_ms.max())
+        return summary
+
+    def line(self) -> str:
+        summary = self.summary()
+        line = f"{summary['requests']} requisições, {summary['positions']} posições ({summary['positions_per_sec']:.0f}/s)"
+        if self.latencies:
+            line += f", latência p50 {summary['p50_ms']:.1f} ms, p90 {summary['p90_ms']:.1f} ms, p99 {summary['p99_ms']:.1f} ms"
+        return line
+
+class EvaluationService:
+    """
+    Mantém em memória o avaliador (coeficientes da regressão e mapa de calor) e um LRU das características
+    por id de posição, e distribui o cálculo das características das posições novas entre os processos de
+    `executor` em lotes de `batch_size`. No máximo `max_requests` requisições ficam em andamento e
+    `max_batches` lotes no pool: quando os limites são atingidos, as conexões deixam de ser lidas até que
+    haja vaga, e a pressão volta para os clientes.
+    """
+
+    def __init__(self, evaluator: PositionEvaluator, executor, batch_size: int = 500, max_batches: int = 2,
+                 max_requests: int = 64, cache_size: int = 100_000):
+        self.evaluator = evaluator
+        self.executor = executor
+        self.batch_size = batch_size
+        self.batch_slots = asyncio.Semaphore(max_batches)
+        self.request_slots = asyncio.Semaphore(max_requests)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.stats = LatencyStats()
+        self.model_columns = [FEATURE_COLUMNS.index(column) for column in evaluator.feature_columns]
+
+    def remember(self, key: int, value):
+        self.cache[key] = value
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def analyze_batch(self, fens) -> tuple:
+        async with self.batch_slots:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, analyze_fens, fens)
+
+    async def evaluate(self, fens) -> list:
+        """Retorna, na ordem de `fens`, as características, a avaliação do modelo e a média do mapa de calor de cada posição."""
+        start = time.perf_counter()
+        ids, errors = [None] * len(fens), [None] * len(fens)
+        for row, fen in enumerate(fens):
+            try:
+                ids[row] = position_id(fen)
+            except (ValueError, KeyError, IndexError):
+                errors[row] = 'FEN inválida'
+
+        # Valores em cache copiados antes de esperar pelo pool (outras requisições podem descartá-los do LRU);
+        # as posições fora do cache são calculadas uma única vez, mesmo se repetidas na requisição
+        cached, missing = {}, {}
+        for fen, pid in zip(fens, ids):
+            if pid is None:
+                continue
+            if pid in self.cache:
+                cached[pid] = self.cache[pid]
+                self.cache.move_to_end(pid)
+            else:
+                missing[fen] = pid
+        pending = list(missing)
+        batches = [pending[start:start + self.batch_size] for start in range(0, len(pending), self.batch_size)]
+        computed = {}
+        for batch, (X, bitboards, batch_errors) in zip(batches, await asyncio.gather(*map(self.analyze_batch, batches))):
+            for fen, features, boards, error in zip(batch, X, bitboards, batch_errors):
+                computed[fen] = (features, boards, error)
+                if error is None:
+                    self.remember(missing[fen], (features, boards))
+
+        X = np.zeros((len(fens), len(FEATURE_COLUMNS)), dtype=np.int64)
+        bitboards = np.zeros((len(fens), 12), dtype=np.int64)
+        for row, (fen, pid) in enumerate(zip(fens, ids)):
+            if fen in computed:
+                X[row], bitboards[row], errors[row] = computed[fen]
+            elif pid in cached:
+                X[row], bitboards[row] = cached[pid]
+        cache_hits = sum(pid in cached for pid in ids)
+
+        scores = self.evaluator.evaluate_arrays(X[:, self.model_columns], bitboards)
+        heat = self.evaluator.heat_arrays(bitboards)
+        results = []
+        for row, fen in enumerate(fens):
+            if errors[row] is not None:
+                results.append({'fen': fen, 'error': errors[row]})
+                continue
+            results.append({
+                'fen': fen,
+                'id': ids[row],
+                'score': float(scores[row]),
+                'heat': None if np.isnan(heat[row]) else float(heat[row]),
+                'features': dict(zip(FEATURE_COLUMNS, X[row].tolist())),
+            })
+        self.stats.record(time.perf_counter() - start, len(fens), cache_hits, sum(error is not None for error in errors))
+        return results
+
+    async def handle_request(self, request: dict) -> dict:
+        """Atende uma requisição {"id": ..., "fens": [...]} ou {"stats": true} do protocolo de linhas JSON."""
+        if request.get('stats'):
+            return {'id': request.get('id'), 'stats': self.stats.summary()}
+        fens = request_fens(request)
+        if fens is None:
+            return {'id': request.get('id'), 'error': REQUEST_ERROR}
+        start = time.perf_counter()
+        results = await self.evaluate([fen.strip() for fen in fens])
+        return {'id': request.get('id'), 'results': results, 'latency_ms': (time.perf_counter() - start) * 1000}
+
+    async def serve_lines(self, reader: asyncio.StreamReader, write):
+        """
+        Protocolo de linhas JSON (entrada padrão e socket Unix): cada linha é um objeto de requisição ou uma
+        FEN isolada, e cada resposta é uma linha JSON com o mesmo "id". As requisições de uma conexão são
+        atendidas em paralelo, por isso as respostas podem chegar fora de ordem.
+        """
+        tasks = set()
+
+        async def respond(line: str):
+            try:
+                try:
+                    request = json.loads(line) if line.startswith('{') else {'fens': [line]}
+                except json.JSONDecodeError as error:
+                    response = {'error': f'JSON inválido: {error}'}
+                else:
+                    response = await self.handle_request(request)
+                await write(json.dumps(response) + '\n')
+            finally:
+                self.request_slots.release()
+
+        while True:
+            await self.request_slots.acquire()
+            line = await reader.readline()
+            if not line:
+                self.request_slots.release()
+                break
+            line = line.decode().strip()
+            if not line:
+                self.request_slots.release()
+                continue
+            task = asyncio.create_task(respond(line))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def handle_unix(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async def write(text: str):
+            writer.write(text.encode())
+            await writer.drain()
+        try:
+            await self.serve_lines(reader, write)
+        finally:
+            writer.close()
+
+    async def handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        HTTP/1.1 mínimo: POST /evaluate com {"fens": [...]} (ou uma FEN por linha) responde uma linha JSON por
+        posição; GET /stats responde as latências. A conexão é mantida entre requisições.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(' ', 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    name, _, value = line.decode().partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, content_type = '200 OK', 'application/x-ndjson'
+                if method == 'POST' and path == '/evaluate':
+                    async with self.request_slots:
+                        try:
+                            text = body.decode()
+                            request = json.loads(text) if text.lstrip().startswith(('{', '[')) else {'fens': text.splitlines()}
+                        except (json.JSONDecodeError, UnicodeDecodeError) as error:
+                            fens, error = None, f'requisição inválida: {error}'
+                        else:
+                            fens, error = request_fens(request), REQUEST_ERROR
+                        if fens is None:
+                            status, payload = '400 Bad Request', json.dumps({'error': error}) + '\n'
+                        else:
+                            results = await self.evaluate([fen.strip() for fen in fens if fen.strip()])
+                            payload = ''.join(json.dumps(result) + '\n' for result in results)
+                elif method == 'GET' and path == '/stats':
+                    content_type, payload = 'application/json', json.dumps(self.stats.summary()) + '\n'
+                else:
+                    status, payload = '404 Not Found', json.dumps({'error': f'{method} {path} não existe'}) + '\n'
+
+                data = payload.encode()
+                writer.write(f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(data)}\r\n\r\n'.encode() + data)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+class ThreadLineReader:
+    """
+    Lê as linhas de um arquivo comum em uma thread, com a mesma interface de readline() do StreamReader:
+    connect_read_pipe só aceita pipes, sockets e terminais, não a entrada padrão redirecionada de um arquivo.
+    """
+
+    def __init__(self, file):
+        self.file = file
+
+    async def readline(self) -> bytes:
+        return await asyncio.get_running_loop().run_in_executor(None, self.file.readline)
+
+async def serve_stdin(service: EvaluationService, stdin=None):
+    """Atende as requisições lidas da entrada padrão (ou de `stdin`) até o fim do arquivo, respondendo na saída padrão."""
+    stdin = stdin or sys.stdin
+    mode = os.fstat(stdin.fileno()).st_mode
+    if stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode) or stat.S_ISCHR(mode):
+        reader = asyncio.StreamReader(limit=2 ** 26)
+        await asyncio.get_running_loop().connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), stdin)
+    else:
+        reader = ThreadLineReader(stdin.buffer if hasattr(stdin, 'buffer') else stdin)
+
+    async def write(text: str):
+        sys.stdout.write(text)
+        sys.stdout.flush()
+    await service.serve_lines(reader, write)
+
+async def report_periodically(stats: LatencyStats, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        print(stats.line(), file=sys.stderr, flush=True)
+
+async def main(args):
+    evaluator = PositionEvaluator.from_database(args.db, args.model)
+    workers = args.workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm_up) as executor:
+        service = EvaluationService(evaluator, executor, args.batch_size, 2 * workers, args.max_requests, args.cache_size)
+        reporter = asyncio.create_task(report_periodically(service.stats, args.stats_interval)) if args.stats_interval else None
+
+        servers = []
+        if args.unix:
+            servers.append(await asyncio.start_unix_server(service.handle_unix, path=args.unix, limit=2 ** 26))
+        if args.http:
+            servers.append(await asyncio.start_server(service.handle_http, '127.0.0.1', args.http, limit=2 ** 26))
+
+        if servers:
+            print(f"atendendo em {', '.join(filter(None, [args.unix, args.http and f'http://127.0.0.1:{args.http}']))}",
+                  file=sys.stderr, flush=True)
+            stop = asyncio.Event()
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                asyncio.get_running_loop().add_signal_handler(signum, stop.set)
+            await stop.wait()
+            for server in servers:
+                server.close()
+                await server.wait_closed()
+            if args.unix:
+                os.remove(args.unix)
+        else:
+            await serve_stdin(service)
+
+        if reporter is not None:
+            reporter.cancel()
+        print(service.stats.line(), file=sys.stderr)
+        if args.report:
+            with open(args.report, 'w') as file:
+                json.dump(service.stats.summary(), file, indent=2)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serviço local que avalia lotes de FENs mantendo o modelo e o mapa de calor em memória.')
+    parser.add_argument('--db', default='chess_analysis.db', help='banco de dados SQLite com o modelo e o mapa de calor')
+    parser.add_argument('--model', default='default', help='nome do modelo salvo por regression.py')
+    parser.add_argument('--unix', metavar='PATH', help='atender em um socket Unix (linhas JSON)')
+    parser.add_argument('--http', metavar='PORT', type=int, help='atender HTTP em 127.0.0.1:PORT')
+    parser.add_argument('--workers', type=int, default=None, help='processos calculando as características (padrão: um por CPU)')
+    parser.add_argument('--batch-size', type=int, default=500, help='posições enviadas a um processo por vez')
+    parser.add_argument('--max-requests', type=int, default=64, help='requisições em andamento antes de parar de ler as conexões')
+    parser.add_argument('--cache-size', type=int, default=100_000, help='posições mantidas no cache de características')
+    parser.add_argument('--stats-interval', type=float, default=0, help='segundos entre os relatórios de latência (0 desativa)')
+    parser.add_argument('--report', help='arquivo JSON com as latências ao encerrar')
+    args = parser.parse_args()
+    if args.unix and os.path.exists(args.unix):
+        parser.error(f'{args.unix} já existe')
+    asyncio.run(main(args))
@@ -0,0 +1,61 @@
+import os
+import sqlite3
+import sys
+import chess
+import pytest
+
+# Os módulos de data_analysis são scripts soltos, importados pelo nome como nos próprios scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+from bench_suite import load_corpus
+from bulk_writer import BulkWriter
+
+# Posições fixas com roques, en passant, promoções, xeques e mates, somadas ao corpus de bench_corpus.csv
+FENS = [
+    chess.STARTING_FEN,
+    "3r1b2/kbr2p2/1q3p2/pp5p/3N1P2/P1Pp2P1/BP1Q3P/K1RR4 b - - 1 32",
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4",
+    "rnbqkbnr/ppp1pppp/8/3pP3/8/8/PPPP1PPP/RNBQKBNR b KQkq - 0 2",
+    "rnbqkbnr/pp1ppppp/8/2pP4/8/8/PPP1PPPP/RNBQKBNR w KQkq c6 0 3",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+    "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+    "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1",
+    "7k/5Q2/6K1/8/8/8/8/8 b - - 0 1",
+    "8/8/8/8/8/5k2/4q3/7K w - - 0 1",
+    "4k3/8/8/8/8/8/8/4K2R w K - 0 1",
+    "8/P7/8/8/8/8/7p/k6K w - - 0 1",
+]
+
+@pytest.fixture(scope='session')
+def fens():
+    return FENS + [fen for fen, _, _ in load_corpus()]
+
+@pytest.fixture
+def boards(fens):
+    return [chess.Board(fen=fen) for fen in fens]
+
+# Linhas da tabela positions do banco de teste, repetindo as posições do corpus com avaliações variadas
+POSITIONS_ROWS = 20_000
+
+def evaluation_text(index: int) -> str:
+    return f'#+{index % 5 + 1}' if index % 97 == 0 else f'{(index * 37) % 601 - 300:+d}'
+
+@pytest.fixture(scope='session')
+def positions_db(fens, tmp_path_factory):
+    """Caminho de um banco com a tabela positions preenchida; os testes que o alteram devem copiá-lo."""
+    features = [db.position_features(chess.Board(fen=fen)) for fen in fens]
+    path = str(tmp_path_factory.mktemp('positions') / 'positions.db')
+    conn = sqlite3.connect(path)
+    db.create_positions_table(conn)
+    with BulkWriter(conn, db.INSERT_POSITION_SQL) as writer:
+        writer.add_many([
+            (i, *db.position_row([fens[i % len(fens)], evaluation_text(i)], features[i % len(fens)]))
+            for i in range(POSITIONS_ROWS)
+        ])
+    conn.close()
+    return path
@@ -0,0 +1,54 @@
+import struct
+import chess
+import numpy as np
+from position_analyzer import attack_bitboards, attacking_squares, attacked_squares
+from attack_graph import *
+import create_graph
+
+def squares_bitboard(squares) -> int:
+    bitboard = 0
+    for square in squares:
+        bitboard |= chess.BB_SQUARES[square]
+    return bitboard
+
+def test_attack_bitboards_matches_attacking_squares(boards):
+    for board in boards:
+        expected = [squares_bitboard(attacking_squares(board, square) or []) for square in chess.SQUARES]
+        assert attack_bitboards(board) == expected, board.fen()
+
+def test_decoded_graph_matches_attacked_squares(boards):
+    # attacked_squares percorre todas as peças para cada casa; as primeiras posições bastam
+    for board in boards[:50]:
+        blob = create_graph.generate_attack_data(board)
+        expected = [chess.SquareSet(squares_bitboard(attacked_squares(board, square))) for square in chess.SQUARES]
+        assert to_attacked_square_sets(blob) == expected, board.fen()
+
+def test_encode_decode_roundtrip(boards):
+    for board in boards:
+        bitboards = attack_bitboards(board)
+        blob = encode_attack_graph(bitboards)
+        assert len(blob) == 8 * (1 + sum(1 for bitboard in bitboards if bitboard))
+        assert decode_attack_graph(blob) == tuple(bitboards), board.fen()
+
+def test_dense_blobs_are_still_decoded(boards):
+    bitboards = attack_bitboards(boards[1])
+    blob = struct.pack(DENSE_FORMAT, *bitboards)
+    assert len(blob) == DENSE_SIZE
+    assert decode_attack_graph(blob) == tuple(bitboards)
+    assert decode_attack_graph(encode_attack_graph(decode_attack_graph(blob))) == tuple(bitboards)
+
+def test_to_numpy_mixes_dense_and_compact_blobs(boards):
+    graphs = [attack_bitboards(board) for board in boards]
+    blobs = [struct.pack(DENSE_FORMAT, *bitboards) if i % 3 == 0 else encode_attack_graph(bitboards)
+             for i, bitboards in enumerate(graphs)]
+    blobs.append(encode_attack_graph([0] * 64))
+    expected = np.array(graphs + [[0] * 64], dtype=np.uint64)
+    assert np.array_equal(to_numpy(blobs), expected)
+    assert np.array_equal(to_numpy(blobs[1]), expected[1])
+
+def test_to_adjacency(boards):
+    bitboards = attack_bitboards(boards[1])
+    adjacency = to_adjacency(encode_attack_graph(bitboards))
+    assert adjacency.shape == (64, 64)
+    for square in chess.SQUARES:
+        assert squares_bitboard(np.flatnonzero(adjacency[square])) == bitboards[square]
@@ -0,0 +1,28 @@
+import sqlite3
+import numpy as np
+import dataset
+import heat_map
+
+def test_exported_features_match_sqlite(positions_db, tmp_path):
+    conn = sqlite3.connect(positions_db)
+    expected = heat_map.load_regression_data(conn)
+    manifest = dataset.export_dataset(conn, str(tmp_path / 'dataset'), heat_map.HEAT_MAP_SLICES, chunk_size=3000)
+    conn.close()
+
+    loaded = dataset.load_dataset(str(tmp_path / 'dataset'))
+    assert loaded['manifest'] == manifest and manifest['rows'] == len(loaded['features'])
+    selected = np.flatnonzero(dataset.slice_mask(loaded, 'default') & (loaded['is_mate'] == 0))
+    X = dataset.feature_matrix(loaded, heat_map.REGRESSION_FEATURES, selected)
+    assert np.array_equal(X, expected[heat_map.REGRESSION_FEATURES].to_numpy())
+    assert np.array_equal(loaded['evaluation'][selected], expected['avaliacao_numerica'].to_numpy())
+
+def test_heat_map_statistics_match_heat_map(positions_db, tmp_path):
+    conn = sqlite3.connect(positions_db)
+    dataset.export_dataset(conn, str(tmp_path / 'dataset'), heat_map.HEAT_MAP_SLICES)
+    df = heat_map.load_regression_data(conn, ['fen'] + heat_map.BITBOARD_COLUMNS)
+    conn.close()
+
+    sums, counts, sum_squares = dataset.heat_map_statistics(dataset.load_dataset(str(tmp_path / 'dataset')), block_size=3000)
+    expected = heat_map.accumulate_heat_map_stats(df.reset_index(drop=True))
+    assert np.array_equal(counts, expected[1])
+    assert np.allclose(sums, expected[0]) and np.allclose(sum_squares, expected[2])
@@ -0,0 +1,18 @@
+import chess
+import numpy as np
+import dataset
+import regression
+from evaluator import PositionEvaluator
+
+def test_piece_square_terms_match_expanded_planes(fens):
+    rng = np.random.default_rng(859)
+    columns = regression.regression_columns(mobility_breakdown=True, piece_squares=True)
+    intercept, coef = rng.normal(), rng.normal(size=len(columns))
+    evaluator = PositionEvaluator(columns, intercept, coef, rng.normal(size=(12, 64)))
+    X, bitboards = evaluator.board_arrays([chess.Board(fen=fen) for fen in fens])
+
+    # Referência: os 768 indicadores por peça e casa expandidos explicitamente
+    planes = dataset.unpack_bitboards(bitboards).reshape(len(fens), -1)
+    expected = intercept + np.hstack([X, planes]) @ coef
+    assert np.allclose(evaluator.evaluate_arrays(X, bitboards), expected)
+    assert np.allclose(evaluator.evaluate_fens(fens[:50]), expected[:50])
@@ -0,0 +1,34 @@
+import chess
+import numpy as np
+import graph_analytics
+from position_analyzer import PIECE_VALUES, attack_bitboards
+
+# Referência por posição com python-chess: peças adversárias capturáveis e, dessas, as sem defensor
+def hanging_per_board(board: chess.Board, targets) -> tuple:
+    threatened = hanging = value = 0
+    for color, sign in [(chess.WHITE, 1), (chess.BLACK, -1)]:
+        reached = 0
+        for square in chess.scan_forward(board.occupied_co[color]):
+            reached |= int(targets[square])
+        for square in chess.scan_forward(reached & board.occupied_co[not color] & ~board.kings):
+            threatened += sign
+            if not board.is_attacked_by(not color, square):
+                hanging += sign
+                value += sign * PIECE_VALUES[board.piece_type_at(square)]
+    return threatened, hanging, value
+
+def test_hanging_pieces_match_python_chess(fens):
+    boards = [chess.Board(fen=fen) for fen in fens]
+    targets = np.array([attack_bitboards(board) for board in boards], dtype=np.uint64)
+    features = graph_analytics.graph_features(fens, targets)
+    for row, board in enumerate(boards):
+        result = tuple(features[column][row] for column in ['threatened_pieces', 'hanging_pieces', 'hanging_value'])
+        assert result == hanging_per_board(board, targets[row]), board.fen()
+
+def test_chunks_match_one_batch(fens):
+    targets = np.array([attack_bitboards(chess.Board(fen=fen)) for fen in fens], dtype=np.uint64)
+    features = graph_analytics.graph_features(fens, targets)
+    chunks = [graph_analytics.graph_features(fens[start:start + 100], targets[start:start + 100])
+              for start in range(0, len(fens), 100)]
+    for column, values in features.items():
+        assert np.array_equal(np.concatenate([chunk[column] for chunk in chunks]), values), column
@@ -0,0 +1,43 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+import heat_map
+
+# Versão original de heat_map.update_positions (iterrows + eval), usada como referência
+def update_positions_per_row(df, piece_type, color, piece_positions, piece_col):
+    for index, row in df.iterrows():
+        positions = eval(row[piece_col])
+        evaluation = row['avaliacao_numerica']
+        piece_list = positions[0] if color == 'white' else positions[1]
+        for pos in piece_list:
+            piece_positions[color + '_' + piece_type]['sum'][pos] += evaluation
+            piece_positions[color + '_' + piece_type]['count'][pos] += 1
+
+def heat_map_per_row(df):
+    piece_positions = {piece: {'sum': np.zeros(64), 'count': np.zeros(64)} for piece in heat_map.PIECE_PLANES}
+    for piece_type, col in heat_map.piece_cols.items():
+        for color in ['white', 'black']:
+            update_positions_per_row(df, piece_type, color, piece_positions, col)
+    # Médias como no laço original (round do Python, mais de 10 ocorrências)
+    averages = np.full((len(heat_map.PIECE_PLANES), 64), np.nan)
+    for plane, piece in enumerate(heat_map.PIECE_PLANES):
+        data = piece_positions[piece]
+        for i in range(64):
+            if data['count'][i] > 10:
+                averages[plane][i] = round(data['sum'][i] / data['count'][i], 2)
+    return averages
+
+def positions_frame(db_path, limit):
+    conn = sqlite3.connect(db_path)
+    df = pd.read_sql_query(f'SELECT * FROM positions LIMIT {int(limit)}', conn)
+    conn.close()
+    df = heat_map.add_evaluation_columns(df)
+    return df[df['is_mate'] == 0].reset_index(drop=True)
+
+def test_vectorized_heat_map_matches_original_loop(positions_db):
+    df = positions_frame(positions_db, 3000)
+    from_bitboards = heat_map.average_heat_map(*heat_map.accumulate_heat_map(df))
+    from_text = heat_map.average_heat_map(*heat_map.accumulate_heat_map(df.drop(columns=heat_map.BITBOARD_COLUMNS)))
+    expected = heat_map_per_row(df)
+    assert np.array_equal(from_bitboards, expected, equal_nan=True)
+    assert np.array_equal(from_text, expected, equal_nan=True)
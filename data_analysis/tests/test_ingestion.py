@@ -0,0 +1,47 @@
+import sqlite3
+import db
+from bulk_writer import BulkWriter
+from ingestion import run_ingestion
+from position_ids import position_id
+
+def ingest(fen_data, db_path, workers=1):
+    run_ingestion(fen_data, db.analyze_position, db.create_positions_table, db.INSERT_POSITION_SQL,
+                  'positions', db_path=db_path, workers=workers)
+
+def stored_rows(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute('SELECT * FROM positions ORDER BY id').fetchall()
+    conn.close()
+    return rows
+
+def test_workers_write_the_same_rows(fens, tmp_path):
+    fen_data = [[fen, '0'] for fen in fens[:300]]
+    ingest(fen_data, str(tmp_path / 'one.db'))
+    ingest(fen_data, str(tmp_path / 'two.db'), workers=2)
+    assert stored_rows(str(tmp_path / 'one.db')) == stored_rows(str(tmp_path / 'two.db'))
+
+def test_reingestion_skips_known_positions(fens, tmp_path):
+    # Um CSV que se sobrepõe ao já gravado, com as mesmas FENs repetidas: nenhuma posição é gravada duas vezes
+    fens = fens[:300]
+    db_path = str(tmp_path / 'positions.db')
+    ingest([[fen, '0'] for fen in fens[:150]], db_path)
+    first = stored_rows(db_path)
+    ingest([[fen, '0'] for fen in fens[:75] + fens], db_path)
+    rows = stored_rows(db_path)
+    assert len(rows) == len({position_id(fen) for fen in fens})
+    assert set(first) <= set(rows)
+
+def test_bulk_writer_matches_insert_data(fens, tmp_path):
+    rows = [db.analyze_position([fen, '+12']) for fen in fens[:200]]
+    conn = sqlite3.connect(str(tmp_path / 'per_row.db'))
+    db.create_positions_table(conn)
+    for row in rows:
+        db.insert_data(conn, *row)
+    conn.close()
+
+    conn = sqlite3.connect(str(tmp_path / 'bulk.db'))
+    db.create_positions_table(conn)
+    with BulkWriter(conn, db.INSERT_POSITION_SQL, batch_size=64) as writer:
+        writer.add_many([(position_id(row[0]), *row) for row in rows])
+    conn.close()
+    assert stored_rows(str(tmp_path / 'per_row.db')) == stored_rows(str(tmp_path / 'bulk.db'))
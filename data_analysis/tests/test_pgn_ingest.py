@@ -0,0 +1,53 @@
+import io
+import sqlite3
+import chess
+import chess.pgn
+import numpy as np
+import create_graph
+import db
+import pgn_ingest
+from bench_suite import random_pgn_games
+from ingestion import run_ingestion
+from position_ids import position_id
+
+# Linhas que o caminho por FEN gravaria para as partidas: (id, FEN, avaliação) da primeira ocorrência de cada posição
+def pgn_fen_rows(texts):
+    rows = {}
+    for text in texts:
+        game = chess.pgn.read_game(io.StringIO(text))
+        board = game.board()
+        for node in [game, *game.mainline()]:
+            if node.move is not None:
+                board.push(node.move)
+            score = node.eval()
+            evaluation = None
+            if score is not None:
+                score = score.white()
+                evaluation = f"#{score.mate():+d}" if score.is_mate() else f"{score.score():+d}"
+            rows.setdefault(position_id(board.fen()), (board.fen(), evaluation))
+    return [(pid, fen, evaluation) for pid, (fen, evaluation) in rows.items()]
+
+def test_game_positions_match_fen_analysis():
+    texts = random_pgn_games(40)
+    fen_rows = pgn_fen_rows(texts)
+    pgn_ingest.set_known_ids(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    games = pgn_ingest.analyze_games(texts)
+    result = {pid: (fen, row, graph) for rows, _, _ in games for pid, fen, row, graph in rows}
+    assert len(result) == len(fen_rows)
+    for pid, fen, evaluation in fen_rows:
+        expected = (fen, db.analyze_position([fen, evaluation]), create_graph.analyze_attacks([fen, evaluation])[1])
+        assert result[pid] == expected, fen
+
+def test_pgn_and_csv_ingestion_write_the_same_tables(tmp_path):
+    texts = random_pgn_games(40, seed=236538)
+    fen_data_list = [[fen, evaluation] for _, fen, evaluation in pgn_fen_rows(texts)]
+    pgn_ingest.run_pgn_ingestion(texts, db_path=str(tmp_path / 'pgn.db'))
+    db_path = str(tmp_path / 'fen.db')
+    run_ingestion(fen_data_list, db.analyze_position, db.create_positions_table, db.INSERT_POSITION_SQL,
+                  'positions', db_path=db_path)
+    run_ingestion(fen_data_list, create_graph.analyze_attacks, create_graph.create_attack_table,
+                  create_graph.INSERT_ATTACK_SQL, 'graph_connections', db_path=db_path)
+    for table in ['positions', 'graph_connections']:
+        pgn, fen = [sorted(sqlite3.connect(str(tmp_path / name)).execute(f'SELECT * FROM {table}').fetchall())
+                    for name in ['pgn.db', 'fen.db']]
+        assert pgn == fen, table
@@ -0,0 +1,91 @@
+import chess
+from position_analyzer import *
+
+# Implementações originais, casa a casa e invertendo o turno, usadas como referência
+
+def mobility_turn_flipping(board: chess.Board) -> int:
+    current_turn = board.turn
+    board.turn = chess.WHITE
+    white_mobility = len(list(board.legal_moves))
+    board.turn = chess.BLACK
+    black_mobility = len(list(board.legal_moves))
+    board.turn = current_turn
+    return white_mobility - black_mobility
+
+def central_control_per_square(board: chess.Board) -> int:
+    control = 0
+    for square in [chess.E4, chess.D4, chess.E5, chess.D5]:
+        control += len(board.attackers(chess.WHITE, square)) - len(board.attackers(chess.BLACK, square))
+    return control
+
+def king_safety_per_square(board: chess.Board) -> int:
+    safety = 0
+    for color in [chess.WHITE, chess.BLACK]:
+        for square in chess.SquareSet(chess.BB_KING_ATTACKS[board.king(color)]):
+            if board.is_attacked_by(not color, square):
+                safety -= 1 if color == chess.WHITE else -1
+    return safety
+
+def moves_per_piece_generated(board: chess.Board):
+    """Movimentos legais por tipo de peça e por casa de origem, contados a partir dos objetos Move."""
+    probe = board.copy(stack=False)
+    counts = []
+    for color in [chess.WHITE, chess.BLACK]:
+        probe.turn = color
+        per_piece = dict.fromkeys(chess.PIECE_TYPES, 0)
+        per_square = {}
+        for move in probe.legal_moves:
+            per_piece[probe.piece_type_at(move.from_square)] += 1
+            per_square[move.from_square] = per_square.get(move.from_square, 0) + 1
+        counts.append((per_piece, per_square))
+    return counts
+
+def features_per_function(board: chess.Board) -> dict:
+    """As características de extract_features calculadas uma a uma pelas funções individuais."""
+    return {
+        'material': compute_material_count(board),
+        'total_material': compute_total_material_count(board),
+        'mobility': compute_mobility(board),
+        'mobility_by_piece': mobility_by_piece(board),
+        'central_control': compute_central_control(board),
+        'king_safety': compute_king_safety(board),
+        'connectivity': compute_connectivity(board),
+        'pawns': get_pawns_position(board),
+        'knights': get_knights_position(board),
+        'bishops': get_bishops_position(board),
+        'rooks': get_rooks_position(board),
+        'queens': get_queens_position(board),
+        'kings': get_kings_position(board),
+    }
+
+def test_extract_features_matches_individual_functions(boards):
+    for board in boards:
+        assert extract_features(board) == features_per_function(board), board.fen()
+
+def test_extract_features_does_not_change_the_board(boards):
+    for board in boards:
+        fen = board.fen()
+        extract_features(board)
+        assert board.fen() == fen
+
+def test_compute_mobility(boards):
+    for board in boards:
+        assert compute_mobility(board) == mobility_turn_flipping(board), board.fen()
+
+def test_compute_central_control(boards):
+    for board in boards:
+        assert compute_central_control(board) == central_control_per_square(board), board.fen()
+
+def test_compute_king_safety(boards):
+    for board in boards:
+        assert compute_king_safety(board) == king_safety_per_square(board), board.fen()
+
+def test_count_moves(boards):
+    for board in boards:
+        counted = [(count_moves(board, color), count_moves(board, color, per_square=True)) for color in [chess.WHITE, chess.BLACK]]
+        assert counted == moves_per_piece_generated(board), board.fen()
+
+def test_mobility_by_piece(boards):
+    for board in boards:
+        (white, _), (black, _) = moves_per_piece_generated(board)
+        assert mobility_by_piece(board) == [white[piece_type] - black[piece_type] for piece_type in chess.PIECE_TYPES], board.fen()
@@ -0,0 +1,41 @@
+import chess
+import chess.polyglot
+from position_ids import position_id
+from game_features import IncrementalPosition
+
+def zobrist_id(fen: str) -> int:
+    """Hash polyglot da posição normalizada por board.fen() (en passant só com captura legal), com sinal."""
+    value = chess.polyglot.zobrist_hash(chess.Board(fen=chess.Board(fen=fen).fen()))
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def test_position_id_matches_zobrist_hash(fens):
+    for fen in fens + ["rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3"]:
+        assert position_id(fen) == zobrist_id(fen), fen
+
+def test_pinned_en_passant_is_ignored():
+    # Peão de b5 cravado pela torre de h5: a FEN traz c6, mas a captura en passant é ilegal
+    pinned = "8/8/8/KPp4r/8/8/8/4k3 w - c6 0 2"
+    board = chess.Board(fen=pinned)
+    assert board.ep_square is not None and not board.has_legal_en_passant()
+    assert position_id(pinned) == position_id("8/8/8/KPp4r/8/8/8/4k3 w - - 0 2") == zobrist_id(pinned)
+    assert position_id(pinned) == IncrementalPosition(board).position_id(board)
+
+def test_legal_en_passant_changes_the_id():
+    fen = "rnbqkbnr/pp1ppppp/8/2pP4/8/8/PPP1PPPP/RNBQKBNR w KQkq c6 0 3"
+    assert position_id(fen) != position_id(fen.replace(' c6 ', ' - '))
+
+def test_clocks_do_not_change_the_id(fens):
+    for fen in fens[:50]:
+        fields = fen.split()
+        assert position_id(' '.join(fields[:4] + ['37', '99'])) == position_id(fen), fen
+
+def test_x_fen_castling_is_normalized():
+    assert position_id("r3k2r/8/8/8/8/8/8/R3K2R w HAha - 0 1") == position_id("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+
+def test_castling_without_king_or_rook_is_dropped():
+    assert position_id("4k3/8/8/8/8/8/8/4K3 w KQkq - 0 1") == position_id("4k3/8/8/8/8/8/8/4K3 w - - 0 1")
+
+def test_incremental_position_id(fens):
+    for fen in fens[:100]:
+        board = chess.Board(fen=fen)
+        assert IncrementalPosition(board).position_id(board) == position_id(fen), fen
@@ -0,0 +1,38 @@
+import sqlite3
+import numpy as np
+from sklearn.linear_model import LinearRegression
+import dataset
+import heat_map
+import regression
+
+def test_streaming_training_matches_linear_regression(positions_db):
+    columns = regression.regression_columns(mobility_breakdown=True)
+    condition = heat_map.HEAT_MAP_SLICES['default']
+    conn = sqlite3.connect(positions_db)
+    last_rowid = conn.execute('SELECT MAX(rowid) FROM positions').fetchone()[0]
+    rowids, X, y = next(regression.sqlite_chunks(conn, columns, condition, 0, last_rowid, last_rowid))
+    conn.close()
+    in_test = regression.is_test_row(rowids)
+    model = LinearRegression().fit(X[~in_test], y[~in_test])
+
+    # Em blocos, com os fragmentos de rowid divididos entre dois processos
+    train, test = regression.train_sqlite(positions_db, columns, condition, 0, last_rowid, workers=2, chunk_size=2000)
+    intercept, coef = train.solve()
+    assert train.count == (~in_test).sum() and test.count == in_test.sum()
+    assert np.allclose(coef, model.coef_, atol=1e-6) and np.isclose(intercept, model.intercept_)
+    expected_error = np.mean((model.predict(X[in_test]) - y[in_test]) ** 2)
+    assert np.isclose(test.mean_squared_error(intercept, coef), expected_error)
+
+def test_dataset_chunks_match_sqlite_chunks(positions_db, tmp_path):
+    columns = regression.regression_columns(mobility_breakdown=True, piece_squares=True)
+    conn = sqlite3.connect(positions_db)
+    dataset.export_dataset(conn, str(tmp_path / 'dataset'), heat_map.HEAT_MAP_SLICES)
+    from_sqlite = regression.accumulate(
+        regression.sqlite_chunks(conn, columns, heat_map.HEAT_MAP_SLICES['default'], 0, 1 << 62, 3000), columns)
+    conn.close()
+
+    loaded = dataset.load_dataset(str(tmp_path / 'dataset'))
+    from_dataset = regression.accumulate(regression.dataset_chunks(loaded, columns, 'default', 3000), columns)
+    for expected, stats in zip(from_sqlite, from_dataset):
+        assert stats.count == expected.count
+        assert np.allclose(stats.cxx, expected.cxx) and np.allclose(stats.cxy, expected.cxy)
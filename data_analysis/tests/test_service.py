@@ -0,0 +1,76 @@
+import asyncio
+import contextlib
+import io
+import json
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pytest
+import regression
+from evaluator import PositionEvaluator
+from position_ids import position_id
+from service import EvaluationService, serve_stdin
+
+@pytest.fixture(scope='module')
+def evaluator():
+    rng = np.random.default_rng(859)
+    columns = regression.regression_columns(mobility_breakdown=True, piece_squares=True)
+    return PositionEvaluator(columns, rng.normal(), rng.normal(size=len(columns)), rng.normal(size=(12, 64)))
+
+@pytest.fixture(scope='module')
+def executor():
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        yield executor
+
+def test_concurrent_requests_match_evaluator(fens, evaluator, executor):
+    batches = [[fens[(i * 10 + j) % len(fens)] for j in range(10)] for i in range(40)]
+
+    async def run():
+        service = EvaluationService(evaluator, executor, batch_size=25, max_batches=4, max_requests=8)
+        slots = asyncio.Semaphore(8)
+        async def request(batch):
+            async with slots:
+                return await service.evaluate(batch)
+        results = await asyncio.gather(*map(request, batches))
+        return service.stats.summary(), results
+
+    summary, results = asyncio.run(run())
+    for batch, result in zip(batches, results):
+        assert [item['fen'] for item in result] == batch
+        assert np.allclose([item['score'] for item in result], evaluator.evaluate_fens(batch))
+    assert summary['requests'] == len(batches)
+
+def test_stdin_http_validation_and_x_fen(fens, evaluator, executor, tmp_path):
+    xfen = "r3k2r/8/8/8/8/8/8/R3K2R w HAha - 0 1"
+
+    async def http(port, body):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'POST /evaluate HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        status, _, payload = response.partition(b'\r\n\r\n')
+        return status.split()[1].decode(), [json.loads(line) for line in payload.decode().splitlines()]
+
+    async def run(path):
+        service = EvaluationService(evaluator, executor)
+        output = io.StringIO()
+        # Entrada padrão redirecionada de um arquivo comum, que o asyncio não lê como um pipe
+        with open(path, 'rb') as file, contextlib.redirect_stdout(output):
+            await serve_stdin(service, file)
+        answers = [json.loads(line) for line in output.getvalue().splitlines()]
+
+        server = await asyncio.start_server(service.handle_http, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        statuses = {body: (await http(port, body))[0] for body in [b'[1,2]', b'{"fens": "abc"}', b'{"fens": 5}', b'{"fens": [1]}']}
+        ok, results = await http(port, json.dumps({'fens': [xfen, fens[0]]}).encode())
+        server.close()
+        await server.wait_closed()
+        return answers, statuses, ok, results
+
+    path = tmp_path / 'fens.txt'
+    path.write_text(''.join(fen + '\n' for fen in fens[:20]))
+    answers, statuses, ok, results = asyncio.run(run(str(path)))
+    assert sorted(answer['results'][0]['fen'] for answer in answers) == sorted(fens[:20])
+    assert set(statuses.values()) == {'400'}, statuses
+    assert ok == '200' and all('error' not in result for result in results), results
+    assert results[0]['id'] == position_id("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")